@@ -1,8 +1,24 @@
 import streamlit as st
 import os
-from backend.database import GraphDatabaseDriver
-from backend.text_to_cypher_v2 import TextToCypher
+import time
+from backend.database import GraphDatabaseDriver, get_shared_query_log, query_shapes
+from backend.text_to_cypher_v2 import AsyncTextToCypher, TextToCypher
 from backend.response_generator_v2 import ResponseGenerator
+from backend.inference import InferenceBackend
+from backend.speculative import SpeculativeDecoder
+from backend.batching import BatchingResponseGenerator
+from backend.question_cache import CachedTextToCypher, QuestionCache
+from backend.pipeline import AsyncPipeline, PipelineRunner
+from backend.schema_index import SchemaIndex
+from backend.result_formatter import ResultFormatter
+from backend.cypher_templates import TemplatedTextToCypher, TemplateMatcher, load_entity_catalog
+from backend.cypher_validator import CypherValidationError, CypherValidator, ValidationResult
+from backend.hedging import HedgedExecutor, neo4j_candidate
+from backend.vector_index import RetrievingTextToCypher, VectorIndex
+from backend.shortcuts import ShortcutMaintainer, with_shortcuts
+from backend.indexes import IndexAdvisor, bootstrap_from_config, existing_indexes
+from backend.model_loading import get_startup_times, startup_timer
+from backend import telemetry
 from backend.config import load_config
 
 st.set_page_config(
@@ -23,11 +39,229 @@ def init_resources():
     with open(schema_path) as fp:
         schema = fp.read().strip()
     
-    config = load_config()
-    return TextToCypher(schema, config), ResponseGenerator(schema), config
+    with startup_timer("config"):
+        config = load_config()
+        telemetry.configure_telemetry(config)
+    # PRODUCES_FROM / CAN_TRADE_AT are only in the graph, and so only in the
+    # schema, when [shortcuts] is enabled (it writes to the graph)
+    shortcuts = ShortcutMaintainer.from_config(config)
+    schema_transform = with_shortcuts if shortcuts is not None else None
+    if schema_transform is not None:
+        schema = schema_transform(schema)
+    with startup_timer("schema_index"):
+        schema_index = SchemaIndex.from_config(schema, config)
+    use_prefix_cache = config.get_prefix_cache_settings()["enabled"]
+    startup = config.get_startup_settings()
+    # the answer model loads on a background thread; the page accepts
+    # questions while Cypher generation and the database are already usable
+    with startup_timer("generator"):
+        generator = BatchingResponseGenerator.from_config(
+            ResponseGenerator(
+                schema,
+                use_prefix_cache=use_prefix_cache,
+                schema_index=schema_index,
+                background=startup["background_loading"],
+                warmup=startup["warmup"],
+                backend=InferenceBackend.from_config(config),
+                speculative=SpeculativeDecoder.from_config(config, "answer"),
+            ),
+            config,
+        )
+
+    # token counts use the answer model's tokenizer once it has loaded
+    formatter = ResultFormatter.from_config(config, tokenizer=generator.tokenizer_future)
+    validator = CypherValidator.from_config(schema, config, schema_index=schema_index)
+    with startup_timer("templates"):
+        template_matcher = TemplateMatcher.from_config(config, lambda: load_entity_catalog(config))
+
+    hedger = HedgedExecutor.from_config(config)
+    # indexes and constraints schema.txt implies, when [indexes] bootstrap is on
+    with startup_timer("indexes"):
+        index_report = bootstrap_from_config(config, schema)
+    with startup_timer("vector_index"):
+        vector_index = VectorIndex.from_config(config, schema)
+    # the shortcuts are kept current in the background
+    with startup_timer("shortcuts"):
+        if shortcuts is not None:
+            shortcuts.start()
+
+    runner = None
+    with startup_timer("text_to_cypher"):
+        if config.get_pipeline_settings()["enabled"]:
+            question_cache = QuestionCache.from_config(
+                config, schema_path, lambda: load_entity_catalog(config), schema_transform
+            )
+            ttc = AsyncTextToCypher(schema, config, schema_index=schema_index)
+            runner = PipelineRunner(
+                AsyncPipeline.from_config(
+                    ttc,
+                    generator,
+                    config,
+                    question_cache=question_cache,
+                    result_formatter=formatter,
+                    validator=validator,
+                    template_matcher=template_matcher,
+                    hedger=hedger,
+                    vector_index=vector_index,
+                )
+            )
+        else:
+            ttc = CachedTextToCypher.from_config(
+                TextToCypher(schema, config, schema_index=schema_index),
+                config,
+                schema_path,
+                lambda: load_entity_catalog(config),
+                schema_transform,
+            )
+            if vector_index is not None:
+                ttc = RetrievingTextToCypher(ttc, vector_index)
+            if template_matcher is not None:
+                ttc = TemplatedTextToCypher(ttc, template_matcher)
+    return (
+        ttc, generator, config, schema_index, runner, formatter, validator, template_matcher, hedger, vector_index,
+        shortcuts, index_report,
+    )
 
 with st.spinner("Loading system..."):
-    ttc, generator, config = init_resources()
+    (
+        ttc, generator, config, schema_index, runner, formatter, validator, template_matcher, hedger, vector_index,
+        shortcuts, index_report,
+    ) = init_resources()
+
+def validate_queries(cypher_queries: list[str], driver):
+    validations = []
+    for query in cypher_queries:
+        if validator is None:
+            validations.append(ValidationResult(query, query, []))
+            continue
+        try:
+            validations.append(validator.validate(query, driver))
+        except CypherValidationError as e:
+            validations.append(e)
+    return validations
+
+def race_candidates(question: str, candidates: list[str], generation_time: float | None):
+    # runs the hedged candidates and returns the outcome; a generated winner
+    # is stored in the question cache
+    if runner is not None:
+        return runner.run(runner.pipeline.execute_candidates(question, candidates, generation_time))
+    outcome = hedger.race(candidates, neo4j_candidate(lambda: GraphDatabaseDriver(config), validator))
+    cache = getattr(ttc, "cache", None)
+    if isinstance(cache, QuestionCache) and outcome.found and generation_time is not None:
+        cache.store(question, [outcome.query], generation_time)
+    return outcome
+
+def show_outcome(outcome) -> list[str]:
+    # returns the query that answers the question, if any
+    for candidate, error in outcome.rejected + outcome.errors:
+        st.caption(f"Candidate {outcome.candidates.index(candidate) + 1} failed: {error}")
+    if outcome.query is None:
+        failures = outcome.rejected + outcome.errors
+        if failures:
+            raise failures[0][1]
+        return []
+    st.write(
+        f"Candidate {outcome.index + 1} of {len(outcome.candidates)} answered"
+        + (f", {outcome.cancelled} cancelled." if outcome.cancelled else ".")
+    )
+    if outcome.query != outcome.candidates[outcome.index]:
+        st.code(outcome.query, language="cypher")
+    return [outcome.query]
+
+def show_validations(validations: list) -> list[str]:
+    # returns the queries to run, with rewrites applied
+    for i, validation in enumerate(validations, start=1):
+        if isinstance(validation, Exception):
+            st.warning(f"Query {i} rejected: {validation}")
+        elif validation.rewrites:
+            st.write(f"Query {i} rewritten ({'; '.join(validation.rewrites)}):")
+            st.code(validation.query, language="cypher")
+    queries = [v.query for v in validations if not isinstance(v, Exception)]
+    if not queries:
+        raise validations[0]
+    return queries
+
+with st.sidebar:
+    sidebar_driver = GraphDatabaseDriver(config)
+    with st.expander("Neo4j connection pool"):
+        pool_stats = sidebar_driver.get_pool_stats()
+        if pool_stats is None:
+            st.caption("Pooling disabled.")
+        else:
+            st.json(pool_stats)
+    with st.expander("Query parameterization"):
+        st.json(query_shapes.get_stats())
+    replica_stats = sidebar_driver.get_replica_stats()
+    if replica_stats is not None:
+        with st.expander("Graph replica"):
+            st.json(replica_stats)
+    result_cache_stats = sidebar_driver.get_result_cache_stats()
+    if result_cache_stats is not None:
+        with st.expander("Query result cache"):
+            st.json(result_cache_stats)
+    if schema_index is not None:
+        with st.expander("Schema pruning"):
+            st.json(schema_index.get_stats())
+    backend_info = generator.get_backend_info()
+    if backend_info is not None:
+        with st.expander("Inference backend"):
+            st.json(backend_info)
+    speculative_stats = generator.get_speculative_stats()
+    if speculative_stats is not None:
+        with st.expander("Speculative decoding"):
+            st.json(speculative_stats)
+    prefix_cache_stats = generator.get_prefix_cache_stats()
+    if prefix_cache_stats is not None:
+        with st.expander("Prompt prefix cache"):
+            st.json(prefix_cache_stats)
+    if isinstance(generator, BatchingResponseGenerator):
+        with st.expander("Response batching"):
+            st.json(generator.get_stats())
+    if hasattr(ttc, "get_client_stats"):
+        with st.expander("OpenRouter client"):
+            st.json(ttc.get_client_stats())
+    if template_matcher is not None:
+        with st.expander("Template fast path"):
+            st.json(template_matcher.get_stats())
+    if vector_index is not None:
+        with st.expander("Vector index"):
+            st.json(vector_index.get_stats())
+    if shortcuts is not None:
+        with st.expander("Shortcut relationships"):
+            st.json(shortcuts.get_stats())
+    if index_report is not None:
+        with st.expander("Index bootstrap"):
+            st.json(index_report)
+    query_log = get_shared_query_log(config)
+    if query_log is not None:
+        with st.expander("Query log"):
+            st.json(query_log.get_stats())
+            if st.button("Recommend indexes"):
+                with GraphDatabaseDriver(config, use_replica=False) as driver:
+                    existing = existing_indexes(driver)
+                st.json(IndexAdvisor.from_config(config).advise(query_log.entries(), existing))
+    # the question cache may sit behind the template fast path
+    if isinstance(getattr(ttc, "cache", None), QuestionCache):
+        with st.expander("Question cache"):
+            st.json(ttc.cache.get_stats())
+    if runner is not None:
+        with st.expander("Async pipeline"):
+            st.json(runner.pipeline.get_stats())
+    with st.expander("Startup"):
+        st.caption("Answer model ready." if generator.ready else "Answer model is still loading...")
+        st.dataframe(
+            [{"component": name, "seconds": round(seconds, 2)} for name, seconds in get_startup_times().items()],
+            hide_index=True,
+        )
+    if hedger is not None:
+        with st.expander("Hedged candidates"):
+            st.json(hedger.get_stats())
+    if validator is not None:
+        with st.expander("Cypher validation"):
+            st.json(validator.get_stats())
+    if telemetry.get_telemetry().enabled:
+        with st.expander("Telemetry"):
+            st.json(telemetry.get_telemetry().get_stats())
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -41,12 +275,35 @@ if question := st.chat_input("Masukkan pertanyaan..."):
     with st.chat_message("user"):
         st.markdown(question)
 
-    with st.chat_message("assistant"):
+    with st.chat_message("assistant"), telemetry.span("request", question=question) as request_span:
         with st.status("Processing...", expanded=True) as status:
             
             # generate cypher
             st.write("Generating Cypher query...")
-            cypher_queries = ttc(question)
+            generation_time = None
+            with telemetry.span("cypher"):
+                if hedger is not None and runner is not None:
+                    cypher_queries, generation_time = runner.run(runner.pipeline.generate_cypher_candidates(question))
+                elif hedger is not None:
+                    generation_start = time.perf_counter()
+                    cypher_queries = ttc.generate_candidates(question, hedger.candidates, hedger.temperature)
+                    if (
+                        getattr(ttc, "last_template", None) is None
+                        and getattr(ttc, "last_retrieval", None) is None
+                        and not getattr(ttc, "last_cache_hit", False)
+                    ):
+                        generation_time = time.perf_counter() - generation_start
+                elif runner is not None:
+                    cypher_queries = runner.run(runner.pipeline.generate_cypher(question))
+                else:
+                    cypher_queries = ttc(question)
+            if getattr(ttc, "last_template", None) is not None:
+                st.write(f"Answered from the `{ttc.last_template.template.name}` template, no LLM call.")
+            elif getattr(ttc, "last_retrieval", None) is not None:
+                names = ", ".join(f"{hit.name} ({hit.score:.2f})" for hit in ttc.last_retrieval.hits)
+                st.write(f"Retrieved {names} from the vector index, no LLM call.")
+            elif getattr(ttc, "last_cache_hit", False):
+                st.write("Reused cached Cypher query.")
 
             if isinstance(cypher_queries, str):
                 cypher_queries = [cypher_queries]
@@ -56,46 +313,79 @@ if question := st.chat_input("Masukkan pertanyaan..."):
                 status.update(label="Failed", state="error", expanded=False)
                 st.stop()
 
+            label = "Candidate" if hedger is not None else "Cypher Query"
             for i, q in enumerate(cypher_queries, start=1):
-                st.markdown(f"**Cypher Query {i}:**")
+                st.markdown(f"**{label} {i}:**")
                 st.code(q, language="cypher")
 
             # execute query
             st.write("Executing database query...")
-            all_results = []
-            context_str_parts = []
 
             try:
-                with GraphDatabaseDriver(config) as driver:
-                    for i, q in enumerate(cypher_queries, start=1):
-                        st.write(f"Running query {i}...")
-                        res = driver.execute_query(q)
-
-                        res = res or []
-                        all_results.extend(res)
+                with telemetry.span("db", queries=len(cypher_queries)):
+                    if hedger is not None:
+                        # alternatives for one question: first with rows wins
+                        st.write(f"Racing {len(cypher_queries)} candidate(s)...")
+                        outcome = race_candidates(question, cypher_queries, generation_time)
+                        cypher_queries = show_outcome(outcome)
+                        context_str, formatted = formatter.format_all([outcome.rows])
+                        query_results = []
+                    elif runner is not None:
+                        # independent queries run concurrently on the pipeline
+                        validations = runner.run(runner.pipeline.validate_queries(cypher_queries))
+                        cypher_queries = show_validations(validations)
+                        st.write(f"Running {len(cypher_queries)} query(ies)...")
+                        results = runner.run(runner.pipeline.execute_queries(cypher_queries))
+                        for res in results:
+                            if isinstance(res, Exception):
+                                raise res
+                        context_str, formatted = formatter.format_all([res or [] for res in results])
+                        query_results = []
+                    else:
+                        with GraphDatabaseDriver(config) as driver:
+                            cypher_queries = show_validations(validate_queries(cypher_queries, driver))
+                            # rows are streamed from the cursor into the formatter
+                            st.write(f"Running {len(cypher_queries)} query(ies)...")
+                            query_results = [driver.stream_query(q) for q in cypher_queries]
+                            context_str, formatted = formatter.format_all(query_results)
+                for i, query_result in enumerate(query_results, start=1):
+                    if query_result.truncated:
+                        st.warning(f"Query {i} stopped after {query_result.rows_read} rows (row/size limit).")
 
-                        for row in res:
-                            context_str_parts.append(str(row))
-
-                if all_results:
-                    st.success(f"Found {len(all_results)} total records from {len(cypher_queries)} query(ies).")
-                    st.json(all_results, expanded=False)
-                    context_str = "\n".join(context_str_parts)
+                total_rows = sum(result.total_rows for result in formatted)
+                if total_rows:
+                    st.success(f"Found {total_rows} total records from {len(cypher_queries)} query(ies).")
+                    if any(result.truncated for result in formatted):
+                        shown_rows = sum(len(result.rows) for result in formatted)
+                        st.write(f"Showing {shown_rows} rows to the model; the rest are summarized.")
+                    st.json([row for result in formatted for row in result.rows], expanded=False)
                 else:
                     st.warning("No data found from any query.")
                     context_str = "(no result)"
 
+            except CypherValidationError as e:
+                st.error(f"Query rejected before execution: {e}")
+                context_str = f"(error occurred: {e})"
             except Exception as e:
                 st.error(f"Database error: {e}")
                 context_str = f"(error occurred: {e})"
 
-            # generate answer
-            st.write("Generating final response...")
-
-            combined_cypher = "\n\n".join(cypher_queries)
-            final_answer = generator(question, combined_cypher, context_str)
-            
             status.update(label="Done", state="complete", expanded=False)
 
-        st.markdown(final_answer)
+        # generate answer, rendered token by token as it is decoded
+        combined_cypher = "\n\n".join(cypher_queries)
+        if not generator.ready:
+            with st.spinner("Waiting for the answer model to finish loading..."):
+                generator.wait_ready()
+        with telemetry.span("answer"):
+            final_answer = st.write_stream(generator.stream(question, combined_cypher, context_str))
         st.session_state.messages.append({"role": "assistant", "content": final_answer})
+
+    timings = request_span.breakdown()
+    if timings:
+        with status:
+            st.markdown("**Timing breakdown**")
+            st.dataframe(
+                [{"stage": "\u2003" * depth + name, "ms": round(ms, 1)} for depth, name, ms in timings],
+                hide_index=True,
+            )
@@ -0,0 +1,129 @@
+import asyncio
+import csv
+import json
+import os
+import time
+
+def read_questions(path: str, id_field: str = "id", question_field: str = "question") -> list[dict]:
+    # {"id", "question"} per JSONL line or CSV row (by extension); a missing
+    # id becomes the 1-based line/row number, so reruns get the same ids
+    items = []
+    with open(path, encoding="utf-8", newline="") as fp:
+        if path.lower().endswith(".csv"):
+            rows = enumerate(csv.DictReader(fp), start=1)
+        else:
+            rows = ((number, json.loads(line)) for number, line in enumerate(fp, start=1) if line.strip())
+        for number, row in rows:
+            question = (row.get(question_field) or "").strip()
+            if not question:
+                raise ValueError(f"{path}:{number}: no {question_field!r}")
+            item_id = row.get(id_field)
+            items.append({"id": str(item_id if item_id not in (None, "") else number), "question": question})
+    ids = [item["id"] for item in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path}: duplicate ids")
+    return items
+
+def load_completed(path: str) -> set[str]:
+    # ids already answered in an earlier run's output; failed ones are retried
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8", errors="replace") as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of an interrupted run may be cut off
+                continue
+            if "error" not in record:
+                completed.add(str(record["id"]))
+    return completed
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(fraction: float):
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+def summarize(records: list[dict], wall_seconds: float, skipped: int = 0) -> dict:
+    failed = [r for r in records if "error" in r]
+    stages = {}
+    for record in records:
+        for stage, seconds in record.get("stage_seconds", {}).items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "questions": len(records),
+        "skipped": skipped,
+        "failed": len(failed),
+        "error_rate": len(failed) / len(records) if records else 0.0,
+        # answers that came back with query errors but no rows
+        "query_errors": sum(1 for r in records if r.get("errors") and not r.get("results")),
+        "wall_seconds": wall_seconds,
+        "questions_per_second": len(records) / wall_seconds if wall_seconds else 0.0,
+        "latency": _percentiles([r["latency_seconds"] for r in records]),
+        "stages": {stage: _percentiles(samples) for stage, samples in stages.items()},
+    }
+
+async def run_batch(answer, items: list[dict], output_path: str, concurrency: int = 8, progress=None) -> list[dict]:
+    # Answers `items` with `concurrency` workers, `answer(question)` being an
+    # AsyncPipeline.answer-like coroutine function, and appends one JSON line
+    # per question to `output_path` as soon as it finishes. Returns the
+    # records of this run; `progress(record, done, total)` is called per record.
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    records = []
+
+    # an interrupted run may have left half a line; start on a new one
+    partial_line = False
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as fp:
+            fp.seek(-1, os.SEEK_END)
+            partial_line = fp.read(1) != b"\n"
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        if partial_line:
+            out.write("\n")
+
+        async def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start = time.perf_counter()
+                record = {"id": item["id"], "question": item["question"]}
+                try:
+                    result = await answer(item["question"])
+                    record.update({
+                        "answer": result["answer"],
+                        "cypher_queries": result["cypher_queries"],
+                        "results": result["results"],
+                        "errors": result["errors"],
+                        "stage_seconds": result.get("stage_seconds", {}),
+                    })
+                except Exception as e:
+                    record["error"] = f"{type(e).__name__}: {e}"
+                record["latency_seconds"] = time.perf_counter() - start
+                # one write per line from the loop thread, flushed right away,
+                # so an interrupted run leaves only whole records behind
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+                records.append(record)
+                if progress is not None:
+                    progress(record, len(records), len(items))
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(items))))))
+    return records
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from backend.config import Config
+
+class _PendingRequest:
+    def __init__(self, prompt: str, max_new_tokens: int):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+class BatchingResponseGenerator:
+    # Collects prompts from concurrent callers for up to `max_wait_ms` and runs
+    # them through one batched generate() on the shared ResponseGenerator.
+    def __init__(self, generator, max_batch_size: int = 8, max_wait_ms: float = 25.0):
+        self._generator = generator
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000
+        self._queue: queue.Queue[_PendingRequest] = queue.Queue()
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "generated_tokens": 0,
+            "generation_time": 0.0,
+            "total_queue_wait": 0.0,
+            "max_queue_wait": 0.0,
+            "max_batch_size_seen": 0,
+        }
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def from_config(cls, generator, config: Config):
+        settings = config.get_batching_settings()
+        if not settings["enabled"]:
+            return generator
+        return cls(
+            generator,
+            max_batch_size=settings["max_batch_size"],
+            max_wait_ms=settings["max_wait_ms"],
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._generator, name)
+
+    def submit(self, question: str, query: str, query_result_str: str, max_new_tokens: int = 512) -> Future:
+        fallback_answer = self._generator.get_fallback_answer(query_result_str)
+        if fallback_answer is not None:
+            future = Future()
+            future.set_result(fallback_answer)
+            return future
+
+        prompt = self._generator.build_prompt(question, query, query_result_str)
+        request = _PendingRequest(prompt, max_new_tokens)
+        self._queue.put(request)
+        return request.future
+
+    def __call__(self, question: str, query: str, query_result_str: str):
+        return self.submit(question, query, query_result_str).result()
+
+    def stream(self, question: str, query: str, query_result_str: str, max_new_tokens: int = 512):
+        # batched decoding finishes all rows together, so the answer arrives as one chunk
+        yield self.submit(question, query, query_result_str, max_new_tokens).result()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started_at = time.perf_counter()
+            waits = [started_at - request.enqueued_at for request in batch]
+            try:
+                responses, token_counts = self._generator.generate_batch(
+                    [request.prompt for request in batch],
+                    [request.max_new_tokens for request in batch],
+                )
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            elapsed = time.perf_counter() - started_at
+            for request, response in zip(batch, responses):
+                request.future.set_result(response)
+
+            with self._lock:
+                self._stats["requests"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["generated_tokens"] += sum(token_counts)
+                self._stats["generation_time"] += elapsed
+                self._stats["total_queue_wait"] += sum(waits)
+                self._stats["max_queue_wait"] = max(self._stats["max_queue_wait"], max(waits))
+                self._stats["max_batch_size_seen"] = max(self._stats["max_batch_size_seen"], len(batch))
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        stats["avg_batch_size"] = stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_queue_wait"] = stats["total_queue_wait"] / stats["requests"] if stats["requests"] else 0.0
+        generation_time = stats["generation_time"]
+        stats["tokens_per_second"] = stats["generated_tokens"] / generation_time if generation_time else 0.0
+        stats["requests_per_second"] = stats["requests"] / (time.perf_counter() - self._started_at)
+        return stats
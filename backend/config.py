@@ -15,7 +15,238 @@ class Config:
     def get_neo4j_database_name(self):
         neo4j_data = self._data["neo4j"]
         return neo4j_data["database_name"]
+
+    def get_neo4j_pool_settings(self):
+        pool_data = self._data.get("neo4j_pool", {})
+        return {
+            "enabled": pool_data.get("enabled", True),
+            "max_connection_pool_size": pool_data.get("max_connection_pool_size", 50),
+            "connection_acquisition_timeout": pool_data.get("connection_acquisition_timeout", 30.0),
+            "max_connection_lifetime": pool_data.get("max_connection_lifetime", 3600),
+            "liveness_check_timeout": pool_data.get("liveness_check_timeout", 60.0),
+            "health_check_interval": pool_data.get("health_check_interval", 300.0),
+        }
     
+    def get_question_cache_settings(self):
+        cache_data = self._data.get("question_cache", {})
+        return {
+            "enabled": cache_data.get("enabled", True),
+            "path": cache_data.get("path", ".cache/question_cache.json"),
+            "max_entries": cache_data.get("max_entries", 1000),
+            "ttl_seconds": cache_data.get("ttl_seconds", 7 * 24 * 3600),
+            "similarity_threshold": cache_data.get("similarity_threshold", 0.85),
+            "save_interval_seconds": cache_data.get("save_interval_seconds", 5.0),
+        }
+
+    def get_result_cache_settings(self):
+        cache_data = self._data.get("result_cache", {})
+        return {
+            "enabled": cache_data.get("enabled", True),
+            "max_entries": cache_data.get("max_entries", 512),
+            "max_bytes": cache_data.get("max_bytes", 16 * 1024 * 1024),
+            "version_query": cache_data.get(
+                "version_query",
+                "MATCH (v:GraphVersion) RETURN v.counter AS version"
+            ),
+            "static_labels": cache_data.get("static_labels", [
+                "Hex", "Intersection", "Path", "Harbor", "BuildingType", "DevCardType",
+                "TradeOption", "TerrainType", "DiceNumber", "Odds", "Rule", "Resource",
+            ]),
+            "static_relationship_types": cache_data.get("static_relationship_types", [
+                "CONNECTS_TO", "ADJACENT_TO", "TOUCHES", "HAS_HARBOR", "COSTS",
+                "UPGRADES_FROM", "GOVERNED_BY", "PRODUCES", "HAS_TOKEN", "HAS_ODDS",
+                "ALLOWS_ACCESS", "FOR_RESOURCE",
+            ]),
+        }
+
+    def get_batching_settings(self):
+        batching_data = self._data.get("batching", {})
+        return {
+            "enabled": batching_data.get("enabled", False),
+            "max_batch_size": batching_data.get("max_batch_size", 8),
+            "max_wait_ms": batching_data.get("max_wait_ms", 25.0),
+        }
+
+    def get_prefix_cache_settings(self):
+        prefix_data = self._data.get("prefix_cache", {})
+        return {
+            "enabled": prefix_data.get("enabled", True),
+        }
+
+    def get_inference_settings(self):
+        inference_data = self._data.get("inference", {})
+        return {
+            "dtype": inference_data.get("dtype", "auto"),
+            "quantize": inference_data.get("quantize", False),
+            "compile": inference_data.get("compile", False),
+            "compile_mode": inference_data.get("compile_mode", "default"),
+            "num_threads": inference_data.get("num_threads", 0),
+            "num_interop_threads": inference_data.get("num_interop_threads", 0),
+            "cpu_affinity": inference_data.get("cpu_affinity", []),
+            "static_cache": inference_data.get("static_cache", False),
+        }
+
+    def get_speculative_settings(self):
+        speculative_data = self._data.get("speculative", {})
+        return {
+            "text_to_cypher": speculative_data.get("text_to_cypher", "off"),
+            "answer": speculative_data.get("answer", "off"),
+            "max_draft_tokens": speculative_data.get("max_draft_tokens", 8),
+            "max_ngram_size": speculative_data.get("max_ngram_size", 3),
+            "text_to_cypher_draft_model": speculative_data.get("text_to_cypher_draft_model", "google/gemma-3-270m-it"),
+            "answer_draft_model": speculative_data.get("answer_draft_model", ""),
+        }
+
+    def get_schema_pruning_settings(self):
+        pruning_data = self._data.get("schema_pruning", {})
+        return {
+            "enabled": pruning_data.get("enabled", True),
+            "similarity_threshold": pruning_data.get("similarity_threshold", 0.3),
+            "max_note_chars": pruning_data.get("max_note_chars", 1500),
+        }
+
+    def get_pipeline_settings(self):
+        pipeline_data = self._data.get("pipeline", {})
+        return {
+            "enabled": pipeline_data.get("enabled", False),
+            "cypher_concurrency": pipeline_data.get("cypher_concurrency", 8),
+            "db_concurrency": pipeline_data.get("db_concurrency", 16),
+            "answer_workers": pipeline_data.get("answer_workers", 1),
+            "max_in_flight": pipeline_data.get("max_in_flight", 32),
+            "max_pending": pipeline_data.get("max_pending", 128),
+        }
+
+    def get_hedging_settings(self):
+        hedging_data = self._data.get("hedging", {})
+        return {
+            "enabled": hedging_data.get("enabled", False),
+            "candidates": hedging_data.get("candidates", 3),
+            "temperature": hedging_data.get("temperature", 0.8),
+            "timeout_seconds": hedging_data.get("timeout_seconds", 30.0),
+        }
+
+    def get_query_limits_settings(self):
+        limits_data = self._data.get("query_limits", {})
+        return {
+            "fetch_size": limits_data.get("fetch_size", 1000),
+            "max_rows": limits_data.get("max_rows", 10000),
+            "max_bytes": limits_data.get("max_bytes", 8 * 1024 * 1024),
+            "timeout_seconds": limits_data.get("timeout_seconds", 30.0),
+            "max_cached_rows": limits_data.get("max_cached_rows", 1000),
+        }
+
+    def get_templates_settings(self):
+        templates_data = self._data.get("templates", {})
+        return {
+            "enabled": templates_data.get("enabled", True),
+            "similarity_threshold": templates_data.get("similarity_threshold", 0.85),
+            "margin": templates_data.get("margin", 0.05),
+            "catalog_ttl_seconds": templates_data.get("catalog_ttl_seconds", 300.0),
+        }
+
+    def get_vector_index_settings(self):
+        vector_data = self._data.get("vector_index", {})
+        return {
+            "enabled": vector_data.get("enabled", True),
+            "path": vector_data.get("path", ".cache/vector_index"),
+            "labels": vector_data.get("labels", ["Rule", "DevCardType", "SpecialCard", "TradeOption"]),
+            "n_features": vector_data.get("n_features", 1024),
+            "top_k": vector_data.get("top_k", 3),
+            "similarity_threshold": vector_data.get("similarity_threshold", 0.15),
+            "max_related": vector_data.get("max_related", 10),
+            "refresh_interval_seconds": vector_data.get("refresh_interval_seconds", 60.0),
+        }
+
+    def get_shortcuts_settings(self):
+        shortcuts_data = self._data.get("shortcuts", {})
+        return {
+            "enabled": shortcuts_data.get("enabled", False),
+            "refresh_interval_seconds": shortcuts_data.get("refresh_interval_seconds", 5.0),
+        }
+
+    def get_query_log_settings(self):
+        query_log_data = self._data.get("query_log", {})
+        return {
+            "enabled": query_log_data.get("enabled", False),
+            "sample_rate": query_log_data.get("sample_rate", 1.0),
+            "max_entries": query_log_data.get("max_entries", 10000),
+            "path": query_log_data.get("path", ".cache/query_log.jsonl"),
+        }
+
+    def get_index_settings(self):
+        index_data = self._data.get("indexes", {})
+        return {
+            "bootstrap": index_data.get("bootstrap", False),
+            "min_queries": index_data.get("min_queries", 5),
+            "min_db_hits": index_data.get("min_db_hits", 1000),
+            "measure_queries": index_data.get("measure_queries", 20),
+        }
+
+    def get_cypher_validation_settings(self):
+        validation_data = self._data.get("cypher_validation", {})
+        return {
+            "enabled": validation_data.get("enabled", True),
+            "explain": validation_data.get("explain", True),
+            "max_result_rows": validation_data.get("max_result_rows", 1000),
+            "max_plan_rows": validation_data.get("max_plan_rows", 1_000_000),
+            "max_path_length": validation_data.get("max_path_length", 6),
+        }
+
+    def get_query_parameterization_settings(self):
+        parameterization_data = self._data.get("query_parameterization", {})
+        return {
+            "enabled": parameterization_data.get("enabled", True),
+        }
+
+    def get_graph_replica_settings(self):
+        replica_data = self._data.get("graph_replica", {})
+        return {
+            "enabled": replica_data.get("enabled", False),
+            "refresh_interval_seconds": replica_data.get("refresh_interval_seconds", 1.0),
+            "max_records": replica_data.get("max_records", 1_000_000),
+        }
+
+    def get_result_formatting_settings(self):
+        formatting_data = self._data.get("result_formatting", {})
+        return {
+            "token_budget": formatting_data.get("token_budget", 1024),
+            "top_k_values": formatting_data.get("top_k_values", 3),
+        }
+
+    def get_telemetry_settings(self):
+        telemetry_data = self._data.get("telemetry", {})
+        return {
+            "enabled": telemetry_data.get("enabled", True),
+            "jsonl_path": telemetry_data.get("jsonl_path", ""),
+            "prometheus_port": telemetry_data.get("prometheus_port", 0),
+        }
+
+    def get_startup_settings(self):
+        startup_data = self._data.get("startup", {})
+        return {
+            "background_loading": startup_data.get("background_loading", True),
+            "warmup": startup_data.get("warmup", True),
+        }
+
+    def get_llm_client_settings(self):
+        llm_data = self._data.get("llm_client", {})
+        return {
+            "base_url": llm_data.get("base_url", "https://openrouter.ai/api/v1"),
+            "timeout_seconds": llm_data.get("timeout_seconds", 20.0),
+            "connect_timeout_seconds": llm_data.get("connect_timeout_seconds", 5.0),
+            "deadline_seconds": llm_data.get("deadline_seconds", 60.0),
+            "max_retries": llm_data.get("max_retries", 4),
+            "backoff_base_seconds": llm_data.get("backoff_base_seconds", 0.5),
+            "backoff_max_seconds": llm_data.get("backoff_max_seconds", 8.0),
+            "rate_limit_per_second": llm_data.get("rate_limit_per_second", 0.0),
+            "rate_limit_burst": llm_data.get("rate_limit_burst", 4),
+            "hedge_percentile": llm_data.get("hedge_percentile", 0.0),
+            "hedge_min_samples": llm_data.get("hedge_min_samples", 20),
+            "max_connections": llm_data.get("max_connections", 20),
+            "max_keepalive_connections": llm_data.get("max_keepalive_connections", 10),
+            "keepalive_expiry_seconds": llm_data.get("keepalive_expiry_seconds", 30.0),
+        }
+
     def get_openai_key(self):
         openai_data = self._data["openai"]
         return openai_data["openai_api_key"]
@@ -0,0 +1,473 @@
+import difflib
+import re
+import threading
+import time
+import numpy as np
+from backend import telemetry
+from backend.config import Config
+from backend.cypher_utils import render_parameters
+from backend.database import GraphDatabaseDriver
+from backend.embeddings import HashingEmbedder, cosine_top_k
+
+_WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z']*|\d+")
+
+# everyday names of the resource cards
+RESOURCE_SYNONYMS = {
+    "wood": "Lumber",
+    "timber": "Lumber",
+    "clay": "Brick",
+    "sheep": "Wool",
+    "wheat": "Grain",
+    "stone": "Ore",
+    "rock": "Ore",
+}
+
+NUMBER_WORDS = {
+    "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+class EntityCatalog:
+    # Entity values known to exist in the graph, by kind. Questions are only
+    # answered from a template when their entities resolve to these values.
+    KINDS = ("player", "resource", "building", "trophy", "number")
+
+    def __init__(self, values: dict[str, list]):
+        self.values = {kind: list(values.get(kind, [])) for kind in self.KINDS}
+        self._lookup = {}
+        for kind in ("player", "resource", "building", "trophy"):
+            for value in self.values[kind]:
+                self._lookup[value.lower()] = (kind, value)
+                # plurals such as "cities", "bricks"
+                plural = value[:-1] + "ies" if value.endswith("y") else value + "s"
+                self._lookup.setdefault(plural.lower(), (kind, value))
+        resources = set(self.values["resource"])
+        for word, resource in RESOURCE_SYNONYMS.items():
+            if resource in resources:
+                self._lookup.setdefault(word, ("resource", resource))
+                self._lookup.setdefault(word + "s", ("resource", resource))
+        self._players = {value.lower(): value for value in self.values["player"]}
+
+    @classmethod
+    def from_driver(cls, driver):
+        # `driver` is an open GraphDatabaseDriver
+        queries = {
+            "player": "MATCH (n:Player) RETURN n.name AS value",
+            "resource": "MATCH (n:Resource) RETURN n.name AS value",
+            "building": "MATCH (n:BuildingType) RETURN n.name AS value",
+            "trophy": "MATCH (n:SpecialCard) RETURN n.name AS value",
+            "number": "MATCH (n:DiceNumber) RETURN n.value AS value",
+        }
+        return cls({
+            kind: [row["value"] for row in driver.execute_query(query) if row["value"] is not None]
+            for kind, query in queries.items()
+        })
+
+    def extract(self, question: str):
+        # Returns ({kind: [values]}, masked question) where each mention is
+        # replaced by its kind, e.g. "how many ore does {player} have".
+        entities: dict[str, list] = {}
+        masked = []
+        words = _WORD_PATTERN.findall(question)
+        i = 0
+        while i < len(words):
+            found = None
+            # multi-word values first ("Longest Road", "Year of Plenty")
+            for width in (3, 2, 1):
+                phrase = " ".join(words[i:i + width]).lower()
+                if width > 1 and i + width > len(words):
+                    continue
+                found = self._resolve(phrase, width)
+                if found is not None:
+                    break
+            if found is None:
+                masked.append(words[i].lower())
+                i += 1
+                continue
+            kind, value = found
+            if value not in entities.setdefault(kind, []):
+                entities[kind].append(value)
+            masked.append("{" + kind + "}")
+            i += width
+        return entities, " ".join(masked)
+
+    def _resolve(self, phrase: str, width: int):
+        phrase = phrase.removesuffix("'s")
+        if phrase in self._lookup:
+            return self._lookup[phrase]
+        if width > 1:
+            return None
+        number = int(phrase) if phrase.isdigit() else NUMBER_WORDS.get(phrase)
+        if number is not None and number in self.values["number"]:
+            return "number", number
+        # misspelled player names ("Filbret")
+        if len(phrase) > 3:
+            close = difflib.get_close_matches(phrase, self._players, n=1, cutoff=0.8)
+            if close:
+                return "player", self._players[close[0]]
+        return None
+
+def load_entity_catalog(config: Config) -> EntityCatalog:
+    with GraphDatabaseDriver(config) as driver:
+        return EntityCatalog.from_driver(driver)
+
+class CypherTemplate:
+    def __init__(self, name: str, cypher: str, examples: list[str], patterns: list[str] = (), slots: dict | None = None):
+        self.name = name
+        # parameterized Cypher; `$name` placeholders are filled from `slots`
+        self.cypher = cypher
+        # example questions with entities written as {kind}
+        self.examples = examples
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        # parameter name -> entity kind
+        self.slots = slots or {}
+
+    def render(self, parameters: dict) -> str:
+        return render_parameters(self.cypher, parameters)
+
+TEMPLATES = [
+    CypherTemplate(
+        "player_vp",
+        "MATCH (p:Player {name: $player}) RETURN p.vp AS vp",
+        [
+            "how many victory points does {player} have",
+            "what is {player} vp",
+            "how many points does {player} have",
+            "{player} victory points",
+        ],
+        [r"\b(victory points?|vp|points?)\b.*\{player\}|\{player\}.*\b(victory points?|vp|points?)\b"],
+        {"player": "player"},
+    ),
+    CypherTemplate(
+        "top_player",
+        "MATCH (p:Player) RETURN p.name AS name, p.vp AS vp ORDER BY vp DESC LIMIT 1",
+        [
+            "which player has the most victory points",
+            "who is winning",
+            "who is in the lead",
+            "who has the highest vp",
+        ],
+        [r"\bwho(?: is|'s) (winning|in the lead|leading)\b", r"\bmost (victory )?(points|vp)\b", r"\bhighest (vp|score)\b"],
+    ),
+    CypherTemplate(
+        "player_hand",
+        'MATCH (p:Player {name: $player})-[r:HAS_RESOURCE]->(res:Resource) RETURN res.name AS resource, r.amount AS amount',
+        [
+            "what resource cards does {player} have in his hand",
+            "what resources does {player} have",
+            "show {player} hand",
+            "what cards is {player} holding",
+        ],
+        [r"\bresources?\b.*\{player\}|\{player\}.*\b(resources?|hand)\b"],
+        {"player": "player"},
+    ),
+    CypherTemplate(
+        "player_resource_amount",
+        'MATCH (p:Player {name: $player})-[r:HAS_RESOURCE]->(res:Resource {name: $resource}) RETURN r.amount AS amount',
+        [
+            "how many {resource} does {player} have",
+            "how much {resource} does {player} hold",
+            "does {player} have any {resource}",
+        ],
+        [r"\bhow (many|much) \{resource\} (does|do|is) \{player\}"],
+        {"player": "player", "resource": "resource"},
+    ),
+    CypherTemplate(
+        "building_cost",
+        'MATCH (b:BuildingType {name: $building})-[c:COSTS]->(r:Resource) RETURN r.name AS resource, c.amount AS amount',
+        [
+            "what does it cost to build a {building}",
+            "how much does a {building} cost",
+            "what resources do i need for a {building}",
+            "{building} cost",
+        ],
+        [r"\b(cost|costs|price)\b.*\{building\}|\{building\}.*\b(cost|costs)\b"],
+        {"building": "building"},
+    ),
+    CypherTemplate(
+        "trophy_holder",
+        'MATCH (p:Player)-[:HOLDS_TROPHY]->(s:SpecialCard {name: $trophy}) RETURN p.name AS player, s.bonus_vp AS bonus',
+        [
+            "who holds the {trophy} card",
+            "who has {trophy}",
+            "which player owns the {trophy}",
+        ],
+        [r"\b(who|which player)\b.*\{trophy\}"],
+        {"trophy": "trophy"},
+    ),
+    CypherTemplate(
+        "hexes_with_number",
+        "MATCH (h:Hex)-[:HAS_TOKEN]->(d:DiceNumber {value: $number}) RETURN h.id AS hex",
+        [
+            "which hexes have the number {number}",
+            "which tiles have a {number} token",
+            "where are the {number} tokens",
+        ],
+        [r"\b(hexes|hex|tiles?)\b.*\{number\}"],
+        {"number": "number"},
+    ),
+    CypherTemplate(
+        "players_for_roll",
+        "MATCH (d:DiceNumber {value: $number})<-[:HAS_TOKEN]-(h:Hex)<-[:TOUCHES]-(i:Intersection)<-[:PLACED_ON]-(pc:Piece)<-[:OWNS]-(p:Player) "
+        'WHERE pc.type IN ["Settlement", "City"] RETURN DISTINCT p.name AS player',
+        [
+            "which players receive resources when a {number} is rolled",
+            "who gets resources on a {number}",
+            "who produces when {number} is rolled",
+        ],
+        [r"\b(who|which players?)\b.*\b(receive|gets?|produces?|collects?)\b.*\{number\}"],
+        {"number": "number"},
+    ),
+    CypherTemplate(
+        "dice_odds",
+        "MATCH (d:DiceNumber {value: $number})-[:HAS_ODDS]->(o:Odds) RETURN o.pips AS pips, o.probability AS probability",
+        [
+            "what are the odds of rolling a {number}",
+            "how likely is a {number}",
+            "probability of rolling {number}",
+        ],
+        [r"\b(odds|probability|likely|chance)\b.*\{number\}"],
+        {"number": "number"},
+    ),
+    CypherTemplate(
+        "terrain_for_resource",
+        'MATCH (t:TerrainType)-[:PRODUCES]->(r:Resource {name: $resource}) RETURN t.name AS terrain',
+        [
+            "which terrain produces {resource}",
+            "where does {resource} come from",
+            "what tile gives {resource}",
+        ],
+        [r"\b(terrain|tiles?|hex)\b.*\b(produces?|gives?)\b.*\{resource\}"],
+        {"resource": "resource"},
+    ),
+    CypherTemplate(
+        "active_player",
+        "MATCH (g:GameState)-[:ACTIVE_PLAYER]->(p:Player) RETURN p.name AS player, g.current_phase AS phase, g.turn_number AS turn",
+        [
+            "whose turn is it and in which phase",
+            "whose turn is it",
+            "what phase is the game in",
+            "who is the active player",
+        ],
+        [r"\bwhose turn\b", r"\bactive player\b", r"\bcurrent (phase|turn)\b"],
+    ),
+    CypherTemplate(
+        "players_with_port",
+        "MATCH (p:Player)-[:OWNS]->(pc:Piece)-[:PLACED_ON]->(i:Intersection)-[:HAS_HARBOR]->(h:Harbor) "
+        'WHERE pc.type IN ["Settlement", "City"] RETURN DISTINCT p.name AS player, h.id AS harbor, h.type AS type, h.ratio AS ratio',
+        [
+            "which players have access to a port",
+            "who can use a harbor",
+            "which players are on a harbor",
+        ],
+        [r"\b(who|which players?)\b.*\b(ports?|harbors?)\b"],
+    ),
+    CypherTemplate(
+        "player_ports",
+        "MATCH (p:Player {name: $player})-[:OWNS]->(pc:Piece)-[:PLACED_ON]->(i:Intersection)-[:HAS_HARBOR]->(h:Harbor) "
+        'WHERE pc.type IN ["Settlement", "City"] RETURN DISTINCT h.id AS harbor, h.type AS type, h.ratio AS ratio',
+        [
+            "which ports can {player} access",
+            "does {player} have a harbor",
+            "what harbors does {player} use",
+        ],
+        [r"\b(ports?|harbors?)\b.*\{player\}|\{player\}.*\b(ports?|harbors?)\b"],
+        {"player": "player"},
+    ),
+    CypherTemplate(
+        "robber_location",
+        'MATCH (pc:Piece {type: "Robber"})-[:LOCATED_AT]->(h:Hex)-[:IS_TYPE]->(t:TerrainType) RETURN h.id AS hex, t.name AS terrain',
+        [
+            "where is the robber",
+            "which hex is the robber on",
+            "where is the robber located",
+        ],
+        [r"\bwhere\b.*\brobber\b", r"\brobber\b.*\b(on|located)\b"],
+    ),
+]
+
+class TemplateMatch:
+    def __init__(self, template: CypherTemplate, parameters: dict, confidence: float, method: str):
+        self.template = template
+        self.parameters = parameters
+        self.confidence = confidence
+        # "pattern" or "embedding"
+        self.method = method
+
+    @property
+    def cypher(self) -> str:
+        return self.template.render(self.parameters)
+
+class TemplateMatcher:
+    # Maps common question shapes to parameterized Cypher without an LLM
+    # call. A question's entities (players, resources, dice numbers, ...) are
+    # resolved against the catalog and masked; the masked question must then
+    # match a template's regex, or be close enough to one of its examples.
+    # A template only applies when the question names exactly the entity
+    # kinds it has slots for, one value each.
+    def __init__(
+        self,
+        catalog: EntityCatalog,
+        templates: list[CypherTemplate] | None = None,
+        similarity_threshold: float = 0.85,
+        margin: float = 0.05,
+        embedder: HashingEmbedder | None = None,
+        catalog_loader=None,
+        catalog_ttl_seconds: float = 300.0,
+    ):
+        self._catalog = catalog
+        self._templates = templates or TEMPLATES
+        self._similarity_threshold = similarity_threshold
+        self._margin = margin
+        self._embedder = embedder or HashingEmbedder()
+        # () -> EntityCatalog, called again once the catalog is older than the ttl
+        self._catalog_loader = catalog_loader
+        self._catalog_ttl_seconds = catalog_ttl_seconds
+        self._catalog_loaded_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._example_templates = []
+        examples = []
+        for template in self._templates:
+            for example in template.examples:
+                examples.append(example)
+                self._example_templates.append(template)
+        self._example_matrix = self._embedder.embed_many(examples)
+        self._stats = {
+            "lookups": 0,
+            "pattern_hits": 0,
+            "embedding_hits": 0,
+            "misses": 0,
+            "match_time": 0.0,
+            "llm_calls": 0,
+            "llm_time": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Config, catalog_loader):
+        settings = config.get_templates_settings()
+        if not settings["enabled"]:
+            return None
+        try:
+            catalog = catalog_loader()
+        except Exception:
+            # the fast path stays off for entity questions until the graph answers
+            catalog = EntityCatalog({})
+        return cls(
+            catalog,
+            similarity_threshold=settings["similarity_threshold"],
+            margin=settings["margin"],
+            catalog_loader=catalog_loader,
+            catalog_ttl_seconds=settings["catalog_ttl_seconds"],
+        )
+
+    def _refresh_catalog(self):
+        if self._catalog_loader is None:
+            return
+        if time.monotonic() - self._catalog_loaded_at < self._catalog_ttl_seconds:
+            return
+        self._catalog_loaded_at = time.monotonic()
+        try:
+            self._catalog = self._catalog_loader()
+        except Exception:
+            # keep answering from the previous catalog
+            pass
+
+    def _fits(self, template: CypherTemplate, entities: dict[str, list]):
+        kinds = set(template.slots.values())
+        return set(entities) == kinds and all(len(entities[kind]) == 1 for kind in kinds)
+
+    def _parameters(self, template: CypherTemplate, entities: dict[str, list]):
+        return {name: entities[kind][0] for name, kind in template.slots.items()}
+
+    def _find(self, question: str):
+        entities, masked = self._catalog.extract(question)
+        candidates = [t for t in self._templates if self._fits(t, entities)]
+        if not candidates:
+            return None
+
+        matched = [t for t in candidates if any(pattern.search(masked) for pattern in t.patterns)]
+        if len(matched) > 1:
+            # e.g. "what resources does Ivan have and how many VP": two questions in one
+            return None
+        if matched:
+            return TemplateMatch(matched[0], self._parameters(matched[0], entities), 1.0, "pattern")
+
+        # the closest example must clear the threshold and be clearly closer
+        # than any example of another template
+        query_embedding = self._embedder.embed(masked)
+        ranked = cosine_top_k(self._example_matrix, query_embedding, k=len(self._example_templates))
+        best_index, best_score = ranked[0]
+        template = self._example_templates[best_index]
+        runner_up = next((score for index, score in ranked if self._example_templates[index] is not template), 0.0)
+        if template in candidates and best_score >= self._similarity_threshold and best_score - runner_up >= self._margin:
+            return TemplateMatch(template, self._parameters(template, entities), best_score, "embedding")
+        return None
+
+    def match(self, question: str) -> TemplateMatch | None:
+        start = time.perf_counter()
+        with self._lock:
+            self._refresh_catalog()
+        with telemetry.span("cypher.template") as span:
+            found = self._find(question)
+            span.set("template", found.template.name if found else None)
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats["match_time"] += time.perf_counter() - start
+            if found is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats[f"{found.method}_hits"] += 1
+        telemetry.increment("rag_cache_lookups_total", cache="template", result="miss" if found is None else "hit")
+        return found
+
+    def record_llm_time(self, seconds: float):
+        # latency of a fallback text-to-Cypher call, to estimate the time saved by hits
+        with self._lock:
+            self._stats["llm_calls"] += 1
+            self._stats["llm_time"] += seconds
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats["pattern_hits"] + stats["embedding_hits"]
+        stats["hit_rate"] = hits / stats["lookups"] if stats["lookups"] else 0.0
+        avg_llm_time = stats["llm_time"] / stats["llm_calls"] if stats["llm_calls"] else 0.0
+        avg_match_time = stats["match_time"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["avg_match_ms"] = avg_match_time * 1000
+        stats["latency_saved"] = max(hits * (avg_llm_time - avg_match_time), 0.0)
+        return stats
+
+class TemplatedTextToCypher:
+    # Wraps any TextToCypher backend; template hits skip it entirely.
+    def __init__(self, text_to_cypher, matcher: TemplateMatcher):
+        self._text_to_cypher = text_to_cypher
+        self._matcher = matcher
+        self.last_template = None
+
+    @property
+    def matcher(self):
+        return self._matcher
+
+    def __getattr__(self, name):
+        return getattr(self._text_to_cypher, name)
+
+    def __call__(self, question: str):
+        found = self._matcher.match(question)
+        self.last_template = found
+        if found is not None:
+            return [found.cypher]
+        start = time.perf_counter()
+        cypher = self._text_to_cypher(question)
+        self._matcher.record_llm_time(time.perf_counter() - start)
+        return cypher
+
+    def generate_candidates(self, question: str, count: int, temperature: float = 0.8) -> list[str]:
+        # a template hit is the only candidate
+        found = self._matcher.match(question)
+        self.last_template = found
+        if found is not None:
+            return [found.cypher]
+        start = time.perf_counter()
+        candidates = self._text_to_cypher.generate_candidates(question, count, temperature)
+        self._matcher.record_llm_time(time.perf_counter() - start)
+        return candidates
@@ -0,0 +1,416 @@
+import json
+import re
+
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+    |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<identifier>`[^`]*`)
+    |(?P<number>\b\d+\.\d+(?:[eE][-+]?\d+)?\b|\b\d+\b)
+    |(?P<parameter>\$\w+)
+    |(?P<operator><>|<=|>=|=~|!=)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<space>\s+)
+    |(?P<symbol>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+KEYWORDS = {
+    "MATCH", "OPTIONAL", "WHERE", "RETURN", "WITH", "UNWIND", "ORDER", "BY",
+    "SKIP", "LIMIT", "ASC", "ASCENDING", "DESC", "DESCENDING", "DISTINCT",
+    "AS", "AND", "OR", "XOR", "NOT", "IN", "IS", "NULL", "TRUE", "FALSE",
+    "CONTAINS", "STARTS", "ENDS", "CASE", "WHEN", "THEN", "ELSE", "END",
+    "UNION", "ALL", "CALL", "YIELD", "SHOW", "EXISTS", "CREATE", "MERGE", "SET",
+    "DELETE", "DETACH", "REMOVE", "DROP", "FOREACH", "LOAD", "CSV", "ON",
+    "EXPLAIN", "PROFILE",
+}
+
+WRITE_KEYWORDS = {"CREATE", "MERGE", "SET", "DELETE", "DETACH", "REMOVE", "DROP", "FOREACH", "LOAD"}
+
+_NO_SPACE_BEFORE = set(")]},:.")
+_NO_SPACE_AFTER = set("([{:.$")
+
+def tokenize(query: str):
+    for match in _TOKEN_PATTERN.finditer(query):
+        kind = match.lastgroup
+        if kind in ("comment", "space"):
+            continue
+        yield kind, match.group(0)
+
+def tokenize_spans(query: str):
+    # like tokenize, with the (start, end) offsets of each token in `query`
+    for match in _TOKEN_PATTERN.finditer(query):
+        kind = match.lastgroup
+        if kind in ("comment", "space"):
+            continue
+        yield kind, match.group(0), match.start(), match.end()
+
+def _unquote(literal: str) -> str:
+    body = literal[1:-1]
+    return re.sub(r"\\(.)", r"\1", body)
+
+def _requote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def canonicalize_query(query: str) -> str:
+    # Same query text modulo whitespace, comments, keyword case, quote style,
+    # number formatting and a trailing semicolon maps to the same string.
+    parts = []
+    previous, previous_kind = None, None
+    tokens = list(tokenize(query))
+    # variables that happen to be keywords, e.g. (end:Intersection) or AS all
+    variables = {
+        text for i, (kind, text) in enumerate(tokens[1:-1], start=1)
+        if kind == "word"
+        and (tokens[i - 1][1] in ("(", "[") and tokens[i + 1][1] in (":", ")", "]", "{")
+             or tokens[i - 1][1].upper() == "AS")
+    }
+    for i, (kind, text) in enumerate(tokens):
+        following = tokens[i + 1][1] if i + 1 < len(tokens) else None
+        # property names such as BuildingType.limit or {limit: 5} keep their case
+        if (
+            kind == "word" and text.upper() in KEYWORDS and text not in variables
+            and previous != "." and following != ":"
+        ):
+            kind, text = "keyword", text.upper()
+        elif kind == "string":
+            text = _requote(_unquote(text))
+        elif kind == "number" and "." in text:
+            text = repr(float(text))
+
+        if parts and not (
+            text in _NO_SPACE_BEFORE
+            or previous in _NO_SPACE_AFTER
+            or (text == "(" and previous_kind in ("word", "identifier"))
+            or (text in "-<>" and previous in "-<>[]()")
+            or (previous in "-<>" and text in "-<>[]()")
+        ):
+            parts.append(" ")
+        parts.append(text)
+        previous, previous_kind = text, kind
+
+    while parts and parts[-1] in (";", " "):
+        parts.pop()
+    return "".join(parts)
+
+def get_keywords(query: str) -> set[str]:
+    return {text.upper() for kind, text in tokenize(query) if kind == "word" and text.upper() in KEYWORDS}
+
+def is_write_query(query: str) -> bool:
+    return bool(get_keywords(query) & WRITE_KEYWORDS)
+
+def get_labels_and_types(query: str):
+    # Labels and relationship types are the identifiers following a ':' inside
+    # node `( )` and relationship `[ ]` patterns respectively.
+    labels, rel_types = set(), set()
+    brackets = []
+    after_colon = False
+    after_type = False
+    for kind, text in tokenize(query):
+        is_type = False
+        if kind == "symbol" and text in "([{":
+            brackets.append(text)
+        elif kind == "symbol" and text in ")]}":
+            if brackets:
+                brackets.pop()
+        elif kind == "symbol" and text == ":":
+            after_colon = True
+            continue
+        elif kind == "symbol" and text == "|" and after_type:
+            # alternation such as [:OWNS|HOLDS_TROPHY]
+            after_colon = True
+            continue
+        elif after_colon and kind in ("word", "identifier") and brackets:
+            name = text.strip("`")
+            if brackets[-1] == "(":
+                labels.add(name)
+            elif brackets[-1] == "[":
+                rel_types.add(name)
+                is_type = True
+        after_colon = False
+        after_type = is_type
+    return labels, rel_types
+
+_UNTYPED_RELATIONSHIP_PATTERN = re.compile(r"-\s*-|-\s*\[\s*\w*\s*(?:\*[^\]]*)?\]\s*-")
+
+def has_untyped_relationship(query: str) -> bool:
+    text = " ".join(text for kind, text in tokenize(query) if kind != "string")
+    return bool(_UNTYPED_RELATIONSHIP_PATTERN.search(text))
+
+def get_property_references(query: str):
+    # (variable, property) pairs from `var.prop` accesses and inline maps such
+    # as (p:Player {name: "Filbert"}), plus the labels/types bound to each
+    # variable in node and relationship patterns.
+    bindings: dict[str, set[str]] = {}
+    references = set()
+    tokens = [(kind, text) for kind, text in tokenize(query)]
+    brackets = []
+    pattern_variable = None
+    for i, (kind, text) in enumerate(tokens):
+        previous = tokens[i - 1][1] if i > 0 else None
+        following = tokens[i + 1][1] if i + 1 < len(tokens) else None
+        if kind == "symbol" and text in "([{":
+            # a map right after a node/relationship pattern's label holds properties
+            brackets.append((text, pattern_variable if text == "{" else None))
+            pattern_variable = None
+            continue
+        if kind == "symbol" and text in ")]}":
+            if brackets:
+                brackets.pop()
+            pattern_variable = None
+            continue
+
+        opener, map_owner = brackets[-1] if brackets else (None, None)
+        if kind in ("word", "identifier") and opener in ("(", "[") and previous in ("(", "[") and following == ":":
+            pattern_variable = text.strip("`")
+        elif kind in ("word", "identifier") and opener in ("(", "[") and previous in (":", "|") and pattern_variable:
+            bindings.setdefault(pattern_variable, set()).add(text.strip("`"))
+        elif kind in ("word", "identifier") and opener == "{" and map_owner and previous in ("{", ",") and following == ":":
+            references.add((map_owner, text.strip("`")))
+        elif kind in ("word", "identifier") and previous == "." and i >= 2 and tokens[i - 2][0] in ("word", "identifier"):
+            references.add((tokens[i - 2][1].strip("`"), text.strip("`")))
+    return bindings, references
+
+def _match_variable_length(tokens: list, start: int):
+    # Parses `*`, `*3`, `*..5`, `*2..` or `*2..5` starting at the `*` token;
+    # returns (end index, lower, upper) with None for an omitted bound.
+    i = start + 1
+    lower = upper = None
+    if i < len(tokens) and tokens[i][0] == "number":
+        lower = int(tokens[i][1])
+        i += 1
+    if i + 1 < len(tokens) and tokens[i][1] == "." and tokens[i + 1][1] == ".":
+        i += 2
+        if i < len(tokens) and tokens[i][0] == "number":
+            upper = int(tokens[i][1])
+            i += 1
+    elif lower is not None:
+        upper = lower
+    return i, lower, upper
+
+def bound_variable_length(query: str, max_length: int):
+    # Rewrites unbounded or too long variable-length relationships such as
+    # -[:ADJACENT_TO*]- to at most `max_length` hops; returns the new query
+    # and the rewritten patterns.
+    tokens = [
+        (match.lastgroup, match.group(0), match.start(), match.end())
+        for match in _TOKEN_PATTERN.finditer(query)
+        if match.lastgroup not in ("comment", "space")
+    ]
+    edits = []
+    brackets = []
+    for i, (kind, text, _, _) in enumerate(tokens):
+        if kind == "symbol" and text in "([{":
+            brackets.append(text)
+        elif kind == "symbol" and text in ")]}":
+            if brackets:
+                brackets.pop()
+        elif kind == "symbol" and text == "*" and brackets and brackets[-1] == "[":
+            end, lower, upper = _match_variable_length(tokens, i)
+            if upper is not None and upper <= max_length:
+                continue
+            lower = min(lower if lower is not None else 1, max_length)
+            span_end = tokens[end - 1][3]
+            edits.append((tokens[i][2], span_end, f"*{lower}..{max_length}"))
+
+    rewritten = query
+    for start, end, replacement in reversed(edits):
+        rewritten = rewritten[:start] + replacement + rewritten[end:]
+    return rewritten, [query[start:end] for start, end, _ in edits]
+
+def inject_limit(query: str, limit: int):
+    # Adds `LIMIT limit` to the final clause, or lowers a larger literal LIMIT
+    # there. Returns None for UNION queries, where a trailing LIMIT would
+    # only apply to the last branch.
+    tokens = [
+        (match.lastgroup, match.group(0), match.start(), match.end())
+        for match in _TOKEN_PATTERN.finditer(query)
+        if match.lastgroup not in ("comment", "space")
+    ]
+    words = [text.upper() for kind, text, _, _ in tokens if kind == "word"]
+    if "UNION" in words or "RETURN" not in words:
+        return None
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+
+    depth = 0
+    last_return = last_limit = None
+    for i, (kind, text, _, _) in enumerate(tokens):
+        if kind == "symbol" and text in "([{":
+            depth += 1
+        elif kind == "symbol" and text in ")]}":
+            depth -= 1
+        elif depth == 0 and kind == "word" and text.upper() == "RETURN":
+            last_return, last_limit = i, None
+        elif depth == 0 and kind == "word" and text.upper() == "LIMIT" and last_return is not None:
+            last_limit = i
+
+    body = query[:tokens[-1][3]]
+    if last_limit is None:
+        return f"{body} LIMIT {limit}"
+    if last_limit + 1 < len(tokens) and tokens[last_limit + 1][0] == "number":
+        _, text, start, end = tokens[last_limit + 1]
+        if int(text) > limit:
+            return body[:start] + str(limit) + body[end:]
+    return body
+
+def format_literal(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(format_literal(v) for v in value) + "]"
+    return _requote(str(value))
+
+def render_parameters(query: str, parameters: dict) -> str:
+    # substitutes `$name` placeholders with Cypher literals
+    parts = []
+    position = 0
+    for match in _TOKEN_PATTERN.finditer(query):
+        if match.lastgroup == "parameter" and match.group(0)[1:] in parameters:
+            parts.append(query[position:match.start()])
+            parts.append(format_literal(parameters[match.group(0)[1:]]))
+            position = match.end()
+    parts.append(query[position:])
+    return "".join(parts)
+
+def parse_literal(kind: str, text: str):
+    if kind == "string":
+        return _unquote(text)
+    return float(text) if "." in text else int(text)
+
+_RETURN_ENDS = {"ORDER", "SKIP", "LIMIT", "UNION"}
+
+def alias_projections(query: str) -> str:
+    # Unaliased RETURN items are named after their text, e.g. `p.vp * 2`.
+    # Lifting literals or canonicalizing would rename such a column to
+    # `p.vp * $p0` or `labels(n) [$p0]`, so items whose text would change
+    # get an alias with their original text first.
+    tokens = list(tokenize_spans(query))
+    inserts = []
+    depth = 0
+    i = 0
+    while i < len(tokens):
+        kind, text, _, _ = tokens[i]
+        if kind == "symbol" and text in "([{":
+            depth += 1
+        elif kind == "symbol" and text in ")]}":
+            depth -= 1
+        elif depth == 0 and kind == "word" and text.upper() == "RETURN":
+            i += 1
+            if i < len(tokens) and tokens[i][0] == "word" and tokens[i][1].upper() == "DISTINCT":
+                i += 1
+            item = []
+            item_depth = 0
+            while i < len(tokens):
+                kind, text, _, _ = tokens[i]
+                previous = tokens[i - 1][1]
+                if item_depth == 0 and (
+                    text == ";" or text == ","
+                    or kind == "word" and text.upper() in _RETURN_ENDS and previous != "."
+                ):
+                    inserts.append(_projection_alias(query, item))
+                    item = []
+                    if text != ",":
+                        break
+                else:
+                    if kind == "symbol" and text in "([{":
+                        item_depth += 1
+                    elif kind == "symbol" and text in ")]}":
+                        item_depth -= 1
+                    item.append(tokens[i])
+                i += 1
+            else:
+                inserts.append(_projection_alias(query, item))
+            continue
+        i += 1
+
+    for position, alias in sorted(filter(None, inserts), reverse=True):
+        query = query[:position] + alias + query[position:]
+    return query
+
+def _projection_alias(query: str, item: list):
+    # (offset, " AS `text`") for one RETURN item, or None when it keeps its name
+    if not item or item[0][1] == "*":
+        return None
+    if any(kind == "word" and text.upper() == "AS" and i and item[i - 1][1] != "."
+           for i, (kind, text, _, _) in enumerate(item)):
+        return None
+    text = query[item[0][2]:item[-1][3]]
+    if not any(kind in ("string", "number") for kind, _, _, _ in item) and canonicalize_query(text) == text:
+        return None
+    return item[-1][3], " AS `" + text.replace("`", "``") + "`"
+
+def parameterize_query(query: str, prefix: str = "p"):
+    # Lifts string, number and literal-list values into `$p0`, `$p1`, ... so
+    # queries that differ only in their values share one text (and one plan
+    # in Neo4j's plan cache). Equal values share a parameter. Values that
+    # cannot be parameters, such as variable-length bounds in `[*1..3]` or
+    # quantifiers in `{1,3}`, stay inline. Returns the canonicalized query and its parameters;
+    # RETURN columns keep their names (see alias_projections).
+    tokens = list(tokenize(alias_projections(query)))
+    existing = {text[1:] for kind, text in tokens if kind == "parameter"}
+    parameters = {}
+    names = {}
+
+    def lift(value):
+        key = json.dumps(value)
+        if key not in names:
+            name = f"{prefix}{len(names)}"
+            while name in existing:
+                name = "_" + name
+            names[key] = name
+            parameters[name] = value
+        return "$" + names[key]
+
+    parts = []
+    brackets = []
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        previous_kind, previous = (parts[-1] if parts else (None, None))
+        if kind == "symbol" and text == "[":
+            # a list literal follows an operator, keyword or opening bracket;
+            # after `-`, `<`, `)`, `]` or a name it is a pattern or an index
+            is_list = not (
+                previous in ("-", "<", ")", "]")
+                or (previous_kind in ("word", "identifier") and previous.upper() not in KEYWORDS)
+            )
+            end = i + 1
+            values = []
+            while is_list and end < len(tokens) and tokens[end][1] != "]":
+                item_kind, item = tokens[end]
+                if item_kind in ("string", "number"):
+                    values.append(parse_literal(item_kind, item))
+                elif item != ",":
+                    break
+                end += 1
+            else:
+                if is_list and end < len(tokens):
+                    parts.append(("parameter", lift(values)))
+                    i = end + 1
+                    continue
+            brackets.append("pattern" if previous in ("-", "<") else "[")
+        elif kind == "symbol" and text == "{":
+            # a quantifier such as ()-[:R]->(){1,3} rather than a map
+            brackets.append("pattern" if previous in (")", "-", ">") else "{")
+        elif kind == "symbol" and text == "(":
+            brackets.append(text)
+        elif kind == "symbol" and text in ")]}":
+            if brackets:
+                brackets.pop()
+        elif kind in ("string", "number"):
+            # *2..5 in a relationship pattern, {1,3} of a quantified path
+            if not (brackets and brackets[-1] == "pattern"):
+                parts.append(("parameter", lift(parse_literal(kind, text))))
+                i += 1
+                continue
+        parts.append((kind, text))
+        i += 1
+
+    rebuilt = " ".join(text for _, text in parts)
+    return canonicalize_query(rebuilt), parameters
@@ -0,0 +1,162 @@
+import threading
+from neo4j.exceptions import ClientError
+from backend import telemetry
+from backend.config import Config
+from backend.cypher_utils import (
+    bound_variable_length,
+    get_labels_and_types,
+    get_property_references,
+    inject_limit,
+    is_write_query,
+)
+from backend.schema_index import SchemaIndex
+
+class CypherValidationError(ValueError):
+    pass
+
+def _estimate_rows(plan: dict) -> tuple[float, float]:
+    # (rows estimated for the root operator, largest estimate anywhere in the plan)
+    root = plan.get("args", {}).get("EstimatedRows", 0.0)
+    largest = max([root] + [_estimate_rows(child)[1] for child in plan.get("children", [])])
+    return root, largest
+
+class ValidationResult:
+    def __init__(self, query: str, original: str, rewrites: list[str], estimated_rows=None, plan_rows=None):
+        self.query = query
+        self.original = original
+        # human readable description of every rewrite applied to `original`
+        self.rewrites = rewrites
+        self.estimated_rows = estimated_rows
+        self.plan_rows = plan_rows
+
+class CypherValidator:
+    # Checks generated Cypher before it runs: labels, relationship types and
+    # properties must exist in the schema, write clauses are refused, and
+    # variable-length paths are bounded. With `explain`, the planner's row
+    # estimates decide the rest: a result estimated above `max_result_rows`
+    # gets a LIMIT, a plan with any operator above `max_plan_rows` is refused.
+    def __init__(
+        self,
+        schema_index: SchemaIndex,
+        max_result_rows: int = 1000,
+        max_plan_rows: int = 1_000_000,
+        max_path_length: int = 6,
+        explain: bool = True,
+    ):
+        self._schema_index = schema_index
+        self._max_result_rows = max_result_rows
+        self._max_plan_rows = max_plan_rows
+        self._max_path_length = max_path_length
+        self._explain = explain
+        self._lock = threading.Lock()
+        self._stats = {"validated": 0, "rejected": 0, "rewritten": 0, "limits_injected": 0, "paths_bounded": 0}
+
+    @classmethod
+    def from_config(cls, schema: str, config: Config, schema_index: SchemaIndex | None = None):
+        settings = config.get_cypher_validation_settings()
+        if not settings["enabled"]:
+            return None
+        return cls(
+            schema_index or SchemaIndex(schema),
+            max_result_rows=settings["max_result_rows"],
+            max_plan_rows=settings["max_plan_rows"],
+            max_path_length=settings["max_path_length"],
+            explain=settings["explain"],
+        )
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _reject(self, message: str):
+        self._count(rejected=1)
+        telemetry.increment("rag_validation_total", result="rejected")
+        raise CypherValidationError(message)
+
+    def check(self, query: str) -> ValidationResult:
+        # schema and safety checks that need no database round trip
+        if not query.strip():
+            self._reject("empty query")
+        if is_write_query(query):
+            self._reject("write clauses are not allowed")
+
+        labels, rel_types = get_labels_and_types(query)
+        unknown_labels = sorted(labels - set(self._schema_index.labels))
+        if unknown_labels:
+            self._reject(f"unknown label(s): {', '.join(unknown_labels)}")
+        unknown_types = sorted(rel_types - self._schema_index.get_relationship_types())
+        if unknown_types:
+            self._reject(f"unknown relationship type(s): {', '.join(unknown_types)}")
+
+        bindings, references = get_property_references(query)
+        unknown_properties = set()
+        for variable, prop in references:
+            names = bindings.get(variable)
+            if not names:
+                # bound by WITH/UNWIND or unlabeled: nothing to check against
+                continue
+            known = set()
+            for name in names:
+                known |= self._schema_index.get_properties(name) | self._schema_index.get_relationship_properties(name)
+            if prop not in known:
+                unknown_properties.add(f"{'|'.join(sorted(names))}.{prop}")
+        if unknown_properties:
+            self._reject(f"unknown properties: {', '.join(sorted(unknown_properties))}")
+
+        rewritten, bounded = bound_variable_length(query, self._max_path_length)
+        rewrites = [f"bounded {pattern} to *..{self._max_path_length}" for pattern in bounded]
+        if bounded:
+            self._count(paths_bounded=len(bounded))
+        return ValidationResult(rewritten, query, rewrites)
+
+    def apply_plan(self, result: ValidationResult, plan: dict) -> ValidationResult:
+        estimated_rows, plan_rows = _estimate_rows(plan)
+        result.estimated_rows = estimated_rows
+        result.plan_rows = plan_rows
+        if plan_rows > self._max_plan_rows:
+            self._reject(f"plan too expensive: ~{plan_rows:.0f} rows in one operator (max {self._max_plan_rows})")
+        if estimated_rows > self._max_result_rows:
+            limited = inject_limit(result.query, self._max_result_rows)
+            if limited is not None and limited != result.query:
+                result.query = limited
+                result.rewrites.append(f"limited ~{estimated_rows:.0f} estimated rows to {self._max_result_rows}")
+                self._count(limits_injected=1)
+        return result
+
+    def _finish(self, result: ValidationResult, span):
+        self._count(validated=1, rewritten=1 if result.rewrites else 0)
+        telemetry.increment("rag_validation_total", result="rewritten" if result.rewrites else "ok")
+        span.set("estimated_rows", result.estimated_rows)
+        span.set("rewrites", result.rewrites)
+        return result
+
+    def validate(self, query: str, driver=None) -> ValidationResult:
+        # `driver` is a GraphDatabaseDriver; without one the plan is not checked
+        with telemetry.span("validate", query=query) as span:
+            result = self.check(query)
+            # planned on Neo4j even when the in-memory replica answers the
+            # query, so the row caps hold either way
+            if self._explain and driver is not None:
+                try:
+                    plan = driver.explain(result.query)
+                except ClientError as e:
+                    self._reject(f"invalid query: {e.message}")
+                self.apply_plan(result, plan)
+            return self._finish(result, span)
+
+    async def validate_async(self, query: str, driver=None) -> ValidationResult:
+        # same as validate() with an AsyncGraphDatabaseDriver
+        with telemetry.span("validate", query=query) as span:
+            result = self.check(query)
+            if self._explain and driver is not None:
+                try:
+                    plan = await driver.explain(result.query)
+                except ClientError as e:
+                    self._reject(f"invalid query: {e.message}")
+                self.apply_plan(result, plan)
+            return self._finish(result, span)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
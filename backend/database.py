@@ -1,36 +1,916 @@
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from backend import telemetry
 from backend.config import Config
+from backend.cypher_utils import (
+    canonicalize_query,
+    get_keywords,
+    get_labels_and_types,
+    has_untyped_relationship,
+    is_write_query,
+    parameterize_query,
+)
+from backend.graph_replica import GraphReplica
+from backend.local_executor import UnsupportedQuery
+from backend.query_log import QueryLog
+from neo4j import AsyncGraphDatabase as AsyncNeo4jDatabase
 from neo4j import GraphDatabase as Neo4jDatabase
+from neo4j.exceptions import ServiceUnavailable, SessionExpired
 
-class GraphDatabaseDriver:
+class DriverPool:
     def __init__(self, config: Config):
         self._config = config
+        self._settings = config.get_neo4j_pool_settings()
+        self._lock = threading.Lock()
         self._driver = None
+        self._last_health_check = None
+        # `open_sessions` counts session objects, not Bolt connections (a
+        # session only holds one while a query runs), and the setup times
+        # cover the pool lock, driver creation, health checks and session
+        # construction; waiting for a free connection happens inside the
+        # neo4j driver at the first query and is not measured here
+        self._stats = {
+            "drivers_created": 0,
+            "sessions_opened": 0,
+            "open_sessions": 0,
+            "queries_on_reused_session": 0,
+            "handshakes_avoided": 0,
+            "health_checks": 0,
+            "total_setup_time": 0.0,
+            "max_setup_time": 0.0,
+        }
+
+    def _create_driver(self):
+        kwargs = self._config.get_neo4j_driver_kwargs()
+        return Neo4jDatabase.driver(
+            **kwargs,
+            max_connection_pool_size=self._settings["max_connection_pool_size"],
+            connection_acquisition_timeout=self._settings["connection_acquisition_timeout"],
+            max_connection_lifetime=self._settings["max_connection_lifetime"],
+            liveness_check_timeout=self._settings["liveness_check_timeout"],
+        )
+
+    def _health_check_due(self):
+        if self._last_health_check is None:
+            return True
+        elapsed = time.monotonic() - self._last_health_check
+        return elapsed >= self._settings["health_check_interval"]
+
+    def acquire_driver(self):
+        start = time.perf_counter()
+        with self._lock:
+            if self._driver is None:
+                self._driver = self._create_driver()
+                self._stats["drivers_created"] += 1
+            else:
+                self._stats["handshakes_avoided"] += 1
+
+            if self._health_check_due():
+                self._driver.verify_connectivity()
+                self._last_health_check = time.monotonic()
+                self._stats["health_checks"] += 1
+
+            driver = self._driver
+        self._record_setup(time.perf_counter() - start)
+        return driver
+
+    def open_session(self, driver, **kwargs):
+        start = time.perf_counter()
+        session = driver.session(database=self._config.get_neo4j_database_name(), **kwargs)
+        with self._lock:
+            self._stats["sessions_opened"] += 1
+            self._stats["open_sessions"] += 1
+        self._record_setup(time.perf_counter() - start)
+        return session
+
+    def release_session(self, session):
+        try:
+            session.close()
+        finally:
+            with self._lock:
+                self._stats["open_sessions"] -= 1
+
+    def record_session_reuse(self):
+        with self._lock:
+            self._stats["queries_on_reused_session"] += 1
+
+    def mark_unhealthy(self):
+        # force verify_connectivity() on the next acquisition
+        with self._lock:
+            self._last_health_check = None
+
+    def _record_setup(self, seconds: float):
+        with self._lock:
+            self._stats["total_setup_time"] += seconds
+            self._stats["max_setup_time"] = max(self._stats["max_setup_time"], seconds)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        setups = stats["drivers_created"] + stats["handshakes_avoided"] + stats["sessions_opened"]
+        stats["avg_setup_time"] = stats["total_setup_time"] / setups if setups else 0.0
+        stats["max_connection_pool_size"] = self._settings["max_connection_pool_size"]
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._driver:
+                self._driver.close()
+            self._driver = None
+            self._last_health_check = None
+
+class QueryResultCache:
+    STATIC_VERSION = "static"
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        max_bytes: int = 16 * 1024 * 1024,
+        static_labels: list[str] | None = None,
+        static_relationship_types: list[str] | None = None,
+    ):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._static_labels = set(static_labels or [])
+        self._static_relationship_types = set(static_relationship_types or [])
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._total_bytes = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "uncacheable": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Config):
+        settings = config.get_result_cache_settings()
+        return cls(
+            max_entries=settings["max_entries"],
+            max_bytes=settings["max_bytes"],
+            static_labels=settings["static_labels"],
+            static_relationship_types=settings["static_relationship_types"],
+        )
+
+    def is_cacheable(self, query: str):
+        # procedures may write or depend on server state, so CALL is never
+        # cached, nor are SHOW commands (e.g. SHOW INDEXES)
+        keywords = get_keywords(query)
+        return not is_write_query(query) and not keywords & {"CALL", "SHOW"}
+
+    def is_static(self, query: str):
+        # A query is static when it only touches the board description, so it
+        # does not need the graph version check.
+        labels, rel_types = get_labels_and_types(query)
+        return (
+            bool(labels)
+            and labels <= self._static_labels
+            and rel_types <= self._static_relationship_types
+            and not has_untyped_relationship(query)
+        )
+
+    def make_key(self, query: str, parameters: dict | None = None):
+        if not parameters:
+            return canonicalize_query(query)
+        return canonicalize_query(query) + "\n" + json.dumps(parameters, sort_keys=True, default=str)
+
+    def record_uncacheable(self):
+        with self._lock:
+            self._stats["uncacheable"] += 1
+        telemetry.increment("rag_cache_lookups_total", cache="result", result="uncacheable")
+
+    def get(self, key: str, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                telemetry.increment("rag_cache_lookups_total", cache="result", result="miss")
+                return None
+            entry_version, rows, size = entry
+            if entry_version != version:
+                del self._entries[key]
+                self._total_bytes -= size
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+                telemetry.increment("rag_cache_lookups_total", cache="result", result="stale")
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            telemetry.increment("rag_cache_lookups_total", cache="result", result="hit")
+            return copy.deepcopy(rows)
+
+    def put(self, key: str, version, rows: list[dict]):
+        size = len(json.dumps(rows, default=str))
+        if size > self._max_bytes:
+            self.record_uncacheable()
+            return
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (version, copy.deepcopy(rows), size)
+            self._total_bytes += size
+            while len(self._entries) > self._max_entries or self._total_bytes > self._max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            self._stats["invalidations"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["total_bytes"] = self._total_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+class QueryShapeTracker:
+    # Counts how often each parameterized query text is sent. Neo4j caches
+    # plans by query text, so the reuse rate approximates plan cache hits.
+    def __init__(self, max_shapes: int = 1024):
+        self._max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._shapes: OrderedDict[str, int] = OrderedDict()
+        self._stats = {"queries": 0, "parameterized": 0, "literals_lifted": 0, "repeated": 0}
+
+    def prepare(self, query: str, parameters: dict | None, enabled: bool = True):
+        # Returns (query, parameters) to send. Queries that come with their
+        # own parameters are sent as they are.
+        if parameters is None and enabled:
+            query, parameters = parameterize_query(query)
+            lifted = len(parameters)
+        else:
+            lifted = 0
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["parameterized"] += 1 if lifted else 0
+            self._stats["literals_lifted"] += lifted
+            if query in self._shapes:
+                self._stats["repeated"] += 1
+                self._shapes[query] += 1
+                self._shapes.move_to_end(query)
+            else:
+                self._shapes[query] = 1
+                if len(self._shapes) > self._max_shapes:
+                    self._shapes.popitem(last=False)
+        return query, parameters or {}
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["distinct_shapes"] = len(self._shapes)
+        stats["shape_reuse_rate"] = stats["repeated"] / stats["queries"] if stats["queries"] else 0.0
+        return stats
+
+query_shapes = QueryShapeTracker()
+
+_shared_pools: dict[tuple, DriverPool] = {}
+_shared_result_caches: dict[tuple, QueryResultCache] = {}
+_shared_replicas: dict[tuple, GraphReplica | None] = {}
+_shared_query_logs: dict[tuple, QueryLog | None] = {}
+_shared_pools_lock = threading.Lock()
+
+def _get_database_key(config: Config):
+    kwargs = config.get_neo4j_driver_kwargs()
+    return (kwargs["uri"], kwargs["auth"][0], config.get_neo4j_database_name())
+
+def get_shared_pool(config: Config) -> DriverPool:
+    key = _get_database_key(config)
+    with _shared_pools_lock:
+        if key not in _shared_pools:
+            _shared_pools[key] = DriverPool(config)
+        return _shared_pools[key]
+
+def get_shared_result_cache(config: Config) -> QueryResultCache:
+    key = _get_database_key(config)
+    with _shared_pools_lock:
+        if key not in _shared_result_caches:
+            _shared_result_caches[key] = QueryResultCache.from_config(config)
+        return _shared_result_caches[key]
+
+def get_shared_replica(config: Config) -> GraphReplica | None:
+    key = _get_database_key(config)
+    with _shared_pools_lock:
+        created = key not in _shared_replicas
+        if created:
+            _shared_replicas[key] = GraphReplica.from_config(
+                config, lambda: GraphDatabaseDriver(config, use_replica=False)
+            )
+        replica = _shared_replicas[key]
+    # the first load opens its own driver (and takes the lock above)
+    if created and replica is not None:
+        replica.start()
+    return replica
+
+def get_shared_query_log(config: Config) -> QueryLog | None:
+    key = _get_database_key(config)
+    with _shared_pools_lock:
+        if key not in _shared_query_logs:
+            _shared_query_logs[key] = QueryLog.from_config(config)
+        return _shared_query_logs[key]
+
+def close_shared_pools():
+    with _shared_pools_lock:
+        for replica in _shared_replicas.values():
+            if replica is not None:
+                replica.close()
+        _shared_replicas.clear()
+        for pool in _shared_pools.values():
+            pool.close()
+        _shared_pools.clear()
+
+def _count_db_hits(plan: dict):
+    return plan.get("dbHits", 0) + sum(_count_db_hits(child) for child in plan.get("children", []))
+
+class QueryResult:
+    # Lazily iterated rows of one query. The query only starts running when
+    # iteration begins. Iteration stops at `max_rows` or `max_bytes` (sets
+    # `truncated`); stopping early, by a cap or by the caller, rolls the
+    # transaction back so the server stops working on the query. The summary
+    # is only available once the result was read to the end. Can be iterated
+    # once.
+    def __init__(
+        self,
+        query: str,
+        start=None,
+        rows: list[dict] | None = None,
+        max_rows: int | None = None,
+        max_bytes: int | None = None,
+        collect_rows: int = 0,
+        on_close=None,
+    ):
+        self.query = query
+        self._start = start
+        self._result = None
+        self._transaction = None
+        self._cached_rows = rows
+        self._max_rows = max_rows
+        self._max_bytes = max_bytes
+        self._collect_rows = collect_rows
+        self._on_close = on_close
+        self._collected = []
+        self._closed = False
+        self._started_at = time.perf_counter()
+        self.from_cache = rows is not None
+        self.keys = list(rows[0]) if rows else []
+        self.rows_read = 0
+        self.bytes_read = 0
+        self.truncated = False
+        self.exhausted = False
+        self.summary = None
+        self.elapsed = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        try:
+            if self.from_cache:
+                source = iter(self._cached_rows)
+            else:
+                # returns (result, transaction)
+                self._result, self._transaction = self._start()
+                self.keys = list(self._result.keys())
+                source = (record.data() for record in self._result)
+            for row in source:
+                size = len(json.dumps(row, default=str))
+                if (
+                    (self._max_rows is not None and self.rows_read >= self._max_rows)
+                    or (self._max_bytes is not None and self.bytes_read + size > self._max_bytes)
+                ):
+                    self.truncated = True
+                    break
+                self.rows_read += 1
+                self.bytes_read += size
+                if self._collected is not None and self.rows_read <= self._collect_rows:
+                    self._collected.append(row)
+                else:
+                    self._collected = None
+                yield row
+            else:
+                self.exhausted = True
+        finally:
+            self.close()
+
+    def get_rows(self) -> list[dict] | None:
+        # rows kept for the result cache, or None when the result was too large
+        return self._collected if self.exhausted else None
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._transaction is not None:
+                if self.exhausted:
+                    self.summary = self._result.consume()
+                    self._transaction.commit()
+                else:
+                    # also a no-op when the transaction already failed
+                    self._transaction.close()
+        finally:
+            self.elapsed = time.perf_counter() - self._started_at
+            if self._on_close is not None:
+                self._on_close(self)
+
+    def get_stats(self):
+        stats = {
+            "rows": self.rows_read,
+            "bytes": self.bytes_read,
+            "truncated": self.truncated,
+            "from_cache": self.from_cache,
+            "elapsed": self.elapsed,
+            "result_available_after": None,
+            "result_consumed_after": None,
+            "db_hits": None,
+        }
+        if self.summary is not None:
+            stats["result_available_after"] = self.summary.result_available_after
+            stats["result_consumed_after"] = self.summary.result_consumed_after
+            if self.summary.profile:
+                stats["db_hits"] = _count_db_hits(self.summary.profile)
+        return stats
+
+class GraphDatabaseDriver:
+    def __init__(self, config: Config, pooled: bool | None = None, use_replica: bool = True):
+        self._config = config
+        self._pooled = config.get_neo4j_pool_settings()["enabled"] if pooled is None else pooled
+        self._pool = get_shared_pool(config) if self._pooled else None
+        # read queries the in-memory replica supports never reach Neo4j
+        self._replica = get_shared_replica(config) if use_replica else None
+        cache_settings = config.get_result_cache_settings()
+        self._result_cache = get_shared_result_cache(config) if cache_settings["enabled"] else None
+        self._version_query = cache_settings["version_query"]
+        self._limits = config.get_query_limits_settings()
+        self._parameterize = config.get_query_parameterization_settings()["enabled"]
+        self._query_log = get_shared_query_log(config)
+        self._driver = None
+        self._session = None
         self._last_result_details = None
 
     def __enter__(self):
-        kwargs = self._config.get_neo4j_driver_kwargs()
-        self._driver = Neo4jDatabase.driver(**kwargs)
-        self._driver.verify_connectivity()
+        if self._pooled:
+            self._driver = self._pool.acquire_driver()
+        else:
+            kwargs = self._config.get_neo4j_driver_kwargs()
+            self._driver = Neo4jDatabase.driver(**kwargs)
+            self._driver.verify_connectivity()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if self._driver:
+        if self._pooled:
+            if self._session is not None:
+                self._pool.release_session(self._session)
+                self._session = None
+            if exc_type in (ServiceUnavailable, SessionExpired):
+                self._pool.mark_unhealthy()
+            # the shared driver outlives this context
+            self._driver = None
+        elif self._driver:
             self._driver.close()
 
-    def execute_query(self, query: str):
-        database_name = self._config.get_neo4j_database_name()
-        with self._driver.session(database=database_name) as session:
-            self._last_result_details = session.run(query)
-            return self._last_result_details.data()
-        
+    def _get_session(self):
+        if self._session is None:
+            self._session = self._pool.open_session(self._driver, fetch_size=self._limits["fetch_size"])
+        else:
+            self._pool.record_session_reuse()
+        return self._session
+
+    def _open(
+        self,
+        query: str,
+        parameters: dict,
+        max_rows: int | None,
+        max_bytes: int | None,
+        timeout: float | None,
+        collect_rows: int = 0,
+        on_close=None,
+        log: bool = True,
+    ):
+        # with the query log on, sampled read queries run with PROFILE and
+        # are logged with their plan's db hits once read to the end
+        query_log = self._query_log if log else None
+        if query_log is not None and not query_log.should_profile(query):
+            query_log = None
+        run_query = f"PROFILE {query}" if query_log is not None else query
+        sessions = []
+        spans = []
+
+        def start():
+            spans.append(telemetry.start_span("db.execute", query=query, parameters=parameters))
+            if self._pooled:
+                session = self._get_session()
+            else:
+                session = self._driver.session(
+                    database=self._config.get_neo4j_database_name(),
+                    fetch_size=self._limits["fetch_size"],
+                )
+                sessions.append(session)
+            try:
+                # the transaction timeout makes the server abort runaway queries
+                transaction = session.begin_transaction(timeout=timeout)
+                try:
+                    return transaction.run(run_query, parameters), transaction
+                except Exception:
+                    transaction.close()
+                    raise
+            except (ServiceUnavailable, SessionExpired):
+                if self._pooled:
+                    self._pool.mark_unhealthy()
+                raise
+
+        def close(query_result: QueryResult):
+            try:
+                if on_close is not None:
+                    on_close(query_result)
+                if query_log is not None and query_result.summary is not None:
+                    query_log.record(query, parameters, query_result.get_stats(), query_result.summary.profile)
+            finally:
+                for session in sessions:
+                    session.close()
+                for span in spans:
+                    for key, value in query_result.get_stats().items():
+                        span.set(key, value)
+                    span.end()
+                    telemetry.observe("rag_db_rows", query_result.rows_read)
+
+        return QueryResult(
+            query,
+            start=start,
+            max_rows=max_rows,
+            max_bytes=max_bytes,
+            collect_rows=collect_rows,
+            on_close=close,
+        )
+
+    def _run(self, query: str, parameters: dict | None = None, keep_details: bool = True):
+        query_result = self._open(
+            query,
+            parameters or {},
+            self._limits["max_rows"],
+            self._limits["max_bytes"],
+            self._limits["timeout_seconds"],
+            log=keep_details,
+        )
+        try:
+            rows = list(query_result)
+        except (ServiceUnavailable, SessionExpired):
+            if self._pooled:
+                self._pool.mark_unhealthy()
+            raise
+        if keep_details:
+            self._last_result_details = (rows, query_result)
+        return rows
+
+    def explain(self, query: str, parameters: dict | None = None) -> dict:
+        # the planner's plan (with EstimatedRows per operator) without running
+        # the query; syntax and semantic errors are raised here as well. The
+        # plan is cached for the parameterized text the query later runs as.
+        if parameters is None and self._parameterize:
+            query, parameters = parameterize_query(query)
+        if self._pooled:
+            session = self._get_session()
+            return session.run(f"EXPLAIN {query}", parameters).consume().plan
+        with self._driver.session(database=self._config.get_neo4j_database_name()) as session:
+            return session.run(f"EXPLAIN {query}", parameters).consume().plan
+
+    def profile(self, query: str, parameters: dict | None = None) -> dict:
+        # Runs the query with PROFILE straight on Neo4j (no replica, cache,
+        # row caps or query log) and returns its stats, db_hits included.
+        if parameters is None and self._parameterize:
+            query, parameters = parameterize_query(query)
+        query_result = self._open(
+            f"PROFILE {query}", parameters or {}, None, None, self._limits["timeout_seconds"], log=False
+        )
+        for _ in query_result:
+            pass
+        return query_result.get_stats()
+
+    def get_graph_version(self):
+        rows = self._run(self._version_query, keep_details=False)
+        if not rows:
+            return None
+        return next(iter(rows[0].values()))
+
+    def _lookup_cache(self, query: str, parameters: dict):
+        # Returns (key, version, rows) for a cacheable query, or None when the
+        # query has to bypass the cache. `rows` is None on a miss.
+        cache = self._result_cache
+        if cache is None:
+            return None
+
+        if not cache.is_cacheable(query):
+            cache.record_uncacheable()
+            return None
+
+        if cache.is_static(query):
+            version = cache.STATIC_VERSION
+        else:
+            version = self.get_graph_version()
+            if version is None:
+                # without a version token game state could be served stale
+                cache.record_uncacheable()
+                return None
+
+        key = cache.make_key(query, parameters)
+        return key, version, cache.get(key, version)
+
+    def _execute_locally(self, query: str, parameters: dict):
+        # rows from the replica, or None when the query has to go to Neo4j
+        if self._replica is None or is_write_query(query):
+            return None
+        try:
+            return self._replica.execute(query, parameters)
+        except UnsupportedQuery:
+            return None
+
+    def _record_write(self):
+        if self._result_cache is not None:
+            self._result_cache.invalidate()
+        if self._replica is not None:
+            self._replica.mark_stale()
+
+    def execute_query(self, query: str, parameters: dict | None = None):
+        # Literal values are lifted into parameters unless `parameters` is
+        # given, so queries differing only in values share Neo4j's cached plan.
+        query, parameters = query_shapes.prepare(query, parameters, self._parameterize)
+        rows = self._execute_locally(query, parameters)
+        if rows is not None:
+            self._last_result_details = (rows, QueryResult(query, rows=rows))
+            return rows
+
+        lookup = self._lookup_cache(query, parameters)
+        if lookup is None:
+            rows = self._run(query, parameters)
+            if is_write_query(query):
+                self._record_write()
+            return rows
+
+        key, version, rows = lookup
+        if rows is not None:
+            self._last_result_details = (rows, QueryResult(query, rows=rows))
+            return rows
+        rows = self._run(query, parameters)
+        # rows cut short by the caps are not the query's whole result, as in
+        # stream_query
+        if not self._last_result_details[1].truncated:
+            self._result_cache.put(key, version, rows)
+        return rows
+
+    def execute_write(self, statements: list[tuple[str, dict]]) -> list[list[dict]]:
+        # Runs (query, parameters) statements in one transaction, so readers
+        # never see half of a change; the rows of each statement are returned.
+        # Bypasses the replica and result cache, and invalidates both.
+        if self._pooled:
+            session = self._get_session()
+        else:
+            session = self._driver.session(database=self._config.get_neo4j_database_name())
+        try:
+            with telemetry.span("db.write", statements=len(statements)):
+                with session.begin_transaction(timeout=self._limits["timeout_seconds"]) as transaction:
+                    results = [transaction.run(query, parameters).data() for query, parameters in statements]
+                    transaction.commit()
+        except (ServiceUnavailable, SessionExpired):
+            if self._pooled:
+                self._pool.mark_unhealthy()
+            raise
+        finally:
+            if not self._pooled:
+                session.close()
+        self._record_write()
+        return results
+
+    def stream_query(
+        self,
+        query: str,
+        parameters: dict | None = None,
+        max_rows: int | None = None,
+        max_bytes: int | None = None,
+        timeout: float | None = None,
+    ) -> QueryResult:
+        # Like execute_query, but rows are fetched from the server in
+        # `fetch_size` batches while the caller iterates, so a consumer that
+        # stops early (e.g. a token budget) never materializes the rest.
+        # Caps and timeout default to the [query_limits] settings.
+        max_rows = self._limits["max_rows"] if max_rows is None else max_rows
+        max_bytes = self._limits["max_bytes"] if max_bytes is None else max_bytes
+        timeout = self._limits["timeout_seconds"] if timeout is None else timeout
+
+        query, parameters = query_shapes.prepare(query, parameters, self._parameterize)
+        rows = self._execute_locally(query, parameters)
+        if rows is not None:
+            query_result = QueryResult(query, rows=rows, max_rows=max_rows, max_bytes=max_bytes)
+            self._last_result_details = (rows, query_result)
+            return query_result
+
+        lookup = self._lookup_cache(query, parameters)
+        if lookup is not None and lookup[2] is not None:
+            query_result = QueryResult(query, rows=lookup[2], max_rows=max_rows, max_bytes=max_bytes)
+            self._last_result_details = (lookup[2], query_result)
+            return query_result
+
+        def on_close(query_result: QueryResult):
+            if lookup is None:
+                if is_write_query(query) and query_result.exhausted:
+                    self._record_write()
+            elif not query_result.truncated and query_result.get_rows() is not None:
+                key, version, _ = lookup
+                self._result_cache.put(key, version, query_result.get_rows())
+            self._last_result_details = (query_result.get_rows(), query_result)
+
+        # only results that stay small are kept for the result cache
+        collect_rows = self._limits["max_cached_rows"] if lookup is not None else 0
+        return self._open(query, parameters, max_rows, max_bytes, timeout, collect_rows=collect_rows, on_close=on_close)
+
     def get_last_result_details(self):
-        return self._last_result_details.to_eager_result()
+        # (rows, summary, keys) of the last query; rows is None for streamed
+        # results that were too large to keep, summary is None for results
+        # served from the cache or abandoned before the end
+        if self._last_result_details is None:
+            return None
+        rows, query_result = self._last_result_details
+        return rows, query_result.summary, query_result.keys
+
+    def get_last_result_stats(self):
+        if self._last_result_details is None:
+            return None
+        return self._last_result_details[1].get_stats()
+
+    def get_result_cache_stats(self):
+        if self._result_cache is None:
+            return None
+        return self._result_cache.get_stats()
+
+    def get_replica_stats(self):
+        if self._replica is None:
+            return None
+        return self._replica.get_stats()
+
+    def get_pool_stats(self):
+        if not self._pooled:
+            return None
+        return self._pool.get_stats()
+
+    def get_query_log_stats(self):
+        if self._query_log is None:
+            return None
+        return self._query_log.get_stats()
+
+class AsyncGraphDatabaseDriver:
+    # asyncio counterpart of GraphDatabaseDriver for the async pipeline. Every
+    # query gets its own session so independent queries can run concurrently
+    # over the driver's connection pool.
+    def __init__(self, config: Config):
+        self._config = config
+        self._settings = config.get_neo4j_pool_settings()
+        self._driver = None
+        cache_settings = config.get_result_cache_settings()
+        self._result_cache = get_shared_result_cache(config) if cache_settings["enabled"] else None
+        self._version_query = cache_settings["version_query"]
+        self._limits = config.get_query_limits_settings()
+        self._parameterize = config.get_query_parameterization_settings()["enabled"]
+        # shared with GraphDatabaseDriver; executing from it is CPU-only
+        self._replica = get_shared_replica(config)
+        self._query_log = get_shared_query_log(config)
+
+    async def __aenter__(self):
+        kwargs = self._config.get_neo4j_driver_kwargs()
+        self._driver = AsyncNeo4jDatabase.driver(
+            **kwargs,
+            max_connection_pool_size=self._settings["max_connection_pool_size"],
+            connection_acquisition_timeout=self._settings["connection_acquisition_timeout"],
+            max_connection_lifetime=self._settings["max_connection_lifetime"],
+            liveness_check_timeout=self._settings["liveness_check_timeout"],
+        )
+        await self._driver.verify_connectivity()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self._driver:
+            await self._driver.close()
+
+    async def _run(self, query: str, parameters: dict | None = None, log: bool = True):
+        return (await self._fetch(query, parameters, log))[0]
+
+    async def _fetch(self, query: str, parameters: dict | None = None, log: bool = True):
+        # (rows, truncated), with the same caps, fetch size, server timeout
+        # and query log as GraphDatabaseDriver; leaving the transaction early
+        # rolls it back on the server
+        database_name = self._config.get_neo4j_database_name()
+        max_rows = self._limits["max_rows"]
+        max_bytes = self._limits["max_bytes"]
+        query_log = self._query_log if log else None
+        if query_log is not None and not query_log.should_profile(query):
+            query_log = None
+        run_query = f"PROFILE {query}" if query_log is not None else query
+        start = time.perf_counter()
+        async with self._driver.session(database=database_name, fetch_size=self._limits["fetch_size"]) as session:
+            transaction = await session.begin_transaction(timeout=self._limits["timeout_seconds"])
+            span = telemetry.start_span("db.execute", query=query, parameters=parameters)
+            try:
+                result = await transaction.run(run_query, parameters or {})
+                rows = []
+                total_bytes = 0
+                truncated = False
+                async for record in result:
+                    row = record.data()
+                    total_bytes += len(json.dumps(row, default=str))
+                    if len(rows) >= max_rows or total_bytes > max_bytes:
+                        truncated = True
+                        break
+                    rows.append(row)
+                else:
+                    summary = await result.consume()
+                    await transaction.commit()
+                    if query_log is not None:
+                        query_log.record(query, parameters, {
+                            "rows": len(rows),
+                            "elapsed": time.perf_counter() - start,
+                            "result_available_after": summary.result_available_after,
+                            "result_consumed_after": summary.result_consumed_after,
+                            "db_hits": _count_db_hits(summary.profile) if summary.profile else None,
+                        }, summary.profile)
+                span.set("rows", len(rows))
+                span.set("truncated", truncated)
+                telemetry.observe("rag_db_rows", len(rows))
+                return rows, truncated
+            finally:
+                await transaction.close()
+                span.end()
+
+    async def explain(self, query: str, parameters: dict | None = None) -> dict:
+        if parameters is None and self._parameterize:
+            query, parameters = parameterize_query(query)
+        async with self._driver.session(database=self._config.get_neo4j_database_name()) as session:
+            result = await session.run(f"EXPLAIN {query}", parameters)
+            return (await result.consume()).plan
+
+    async def get_graph_version(self):
+        rows = await self._run(self._version_query, log=False)
+        if not rows:
+            return None
+        return next(iter(rows[0].values()))
+
+    async def execute_query(self, query: str, parameters: dict | None = None):
+        query, parameters = query_shapes.prepare(query, parameters, self._parameterize)
+        if self._replica is not None and not is_write_query(query):
+            try:
+                return self._replica.execute(query, parameters)
+            except UnsupportedQuery:
+                pass
+
+        cache = self._result_cache
+        if cache is None or not cache.is_cacheable(query):
+            if cache is not None:
+                cache.record_uncacheable()
+            rows = await self._run(query, parameters)
+            if is_write_query(query):
+                if cache is not None:
+                    cache.invalidate()
+                if self._replica is not None:
+                    self._replica.mark_stale()
+            return rows
+
+        if cache.is_static(query):
+            version = cache.STATIC_VERSION
+        else:
+            version = await self.get_graph_version()
+            if version is None:
+                cache.record_uncacheable()
+                return await self._run(query, parameters)
+
+        key = cache.make_key(query, parameters)
+        rows = cache.get(key, version)
+        if rows is not None:
+            return rows
+        rows, truncated = await self._fetch(query, parameters)
+        # rows cut short by the caps are not the query's whole result
+        if not truncated:
+            cache.put(key, version, rows)
+        return rows
 
 if __name__ == "__main__":
-    with GraphDatabaseDriver() as driver:
+    from backend.config import load_config
+
+    # straight to Neo4j, so the result summary below is the server's
+    with GraphDatabaseDriver(load_config(), use_replica=False) as driver:
         results = driver.execute_query("""
-            MATCH (p:Player)-[:SHARES]->(l:Level)
-            RETURN p.username AS username, l.name AS level_name
+            MATCH (p:Player)
+            RETURN p.name AS name, p.vp AS vp
             """
         )
 
@@ -0,0 +1,55 @@
+import hashlib
+import re
+import numpy as np
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9:]+")
+
+class HashingEmbedder:
+    # Dependency-free embedding: word unigrams plus character trigrams hashed
+    # into a fixed-size vector. Good enough to match reworded short questions.
+    def __init__(self, n_features: int = 1024, char_ngram: int = 3):
+        self._n_features = n_features
+        self._char_ngram = char_ngram
+
+    @property
+    def dim(self):
+        return self._n_features
+
+    def _features(self, text: str):
+        words = _TOKEN_PATTERN.findall(text.lower())
+        for word in words:
+            yield "w:" + word, 1.0
+            padded = f" {word} "
+            for i in range(len(padded) - self._char_ngram + 1):
+                yield "c:" + padded[i:i + self._char_ngram], 0.5
+
+    def _bucket(self, feature: str):
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        sign = 1.0 if value & 1 else -1.0
+        return (value >> 1) % self._n_features, sign
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self._n_features, dtype=np.float32)
+        for feature, weight in self._features(text):
+            index, sign = self._bucket(feature)
+            vector[index] += sign * weight
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def embed_many(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self._n_features), dtype=np.float32)
+        return np.stack([self.embed(text) for text in texts])
+
+def cosine_top_k(matrix: np.ndarray, query: np.ndarray, k: int = 1):
+    # rows of `matrix` and `query` are expected to be L2-normalized
+    if matrix.shape[0] == 0:
+        return []
+    scores = matrix @ query
+    k = min(k, scores.shape[0])
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [(int(i), float(scores[i])) for i in top]
@@ -0,0 +1,61 @@
+import time
+from threading import Event
+import torch
+from transformers import StoppingCriteria
+from backend import telemetry
+
+# Imported lazily by the model-backed classes so that importing them does not
+# pull in torch/transformers.
+
+class StopOnSequences(StoppingCriteria):
+    def __init__(self, tokenizer, prompt_length: int, stop_sequences: list[str], cancel_event: Event | None = None):
+        self._tokenizer = tokenizer
+        self._prompt_length = prompt_length
+        self._stop_sequences = stop_sequences
+        self._cancel_event = cancel_event
+        # only the tail of the output has to be decoded to spot a new stop sequence
+        self._window = max(len(s) for s in stop_sequences) + 4
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            return torch.ones(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        tails = self._tokenizer.batch_decode(
+            input_ids[:, self._prompt_length:][:, -self._window:],
+            skip_special_tokens=True
+        )
+        done = [any(s in tail for s in self._stop_sequences) for tail in tails]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+class MaxNewTokensPerRow(StoppingCriteria):
+    # generate() only takes one max_new_tokens, so per-request limits in a
+    # batch are enforced here
+    def __init__(self, prompt_length: int, max_new_tokens: list[int]):
+        self._prompt_length = prompt_length
+        self._max_new_tokens = torch.tensor(max_new_tokens)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids.shape[1] - self._prompt_length
+        return (self._max_new_tokens <= generated).to(input_ids.device)
+
+class TokenTimer(StoppingCriteria):
+    # Never stops generation; records when the first token (end of prefill)
+    # and the last token were produced and how many decoding steps ran.
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.last_token_at = None
+        self.steps = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.last_token_at = now
+        self.steps += 1
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+    def record(self, stage: str):
+        if self.first_token_at is None:
+            return
+        telemetry.record_span(f"{stage}.prefill", self.first_token_at - self.started_at)
+        telemetry.record_span(f"{stage}.decode", self.last_token_at - self.first_token_at, steps=self.steps)
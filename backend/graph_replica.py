@@ -0,0 +1,343 @@
+import json
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+from backend import telemetry
+from backend.config import Config
+from backend.local_executor import LocalExecutor, UnsupportedQuery, parse_query
+
+NODES_QUERY = "MATCH (n) RETURN elementId(n) AS id, labels(n) AS labels, properties(n) AS properties"
+RELATIONSHIPS_QUERY = (
+    "MATCH (a)-[r]->(b) "
+    "RETURN elementId(a) AS start, type(r) AS type, elementId(b) AS end, properties(r) AS properties"
+)
+# game state only: everything that is not part of the static board description
+DYNAMIC_NODES_QUERY = (
+    "MATCH (n) WHERE size(labels(n)) = 0 OR any(l IN labels(n) WHERE NOT l IN $static_labels) "
+    "RETURN elementId(n) AS id, labels(n) AS labels, properties(n) AS properties"
+)
+DYNAMIC_RELATIONSHIPS_QUERY = (
+    "MATCH (a)-[r]->(b) "
+    "WHERE NOT (type(r) IN $static_types "
+    "AND size(labels(a)) > 0 AND all(l IN labels(a) WHERE l IN $static_labels) "
+    "AND size(labels(b)) > 0 AND all(l IN labels(b) WHERE l IN $static_labels)) "
+    "RETURN elementId(a) AS start, type(r) AS type, elementId(b) AS end, properties(r) AS properties"
+)
+
+def _index_key(value):
+    # true = 1 in Python but not in Cypher
+    return (isinstance(value, bool), value)
+
+class GraphSnapshot:
+    # Read-only copy of the graph in compact arrays: nodes are numbered
+    # 0..n-1, relationships 0..m-1, and each relationship type has CSR
+    # adjacency (offsets into relationship ids sorted by start and by end
+    # node). Label lookups are arrays, property lookups a lazily built
+    # hash index per (label, property).
+    def __init__(self, nodes: list[dict], relationships: list[dict]):
+        # same records as the benchmark fixture: nodes {"id", "labels",
+        # "properties"}, relationships {"type", "start", "end", "properties"}
+        self.node_ids = [node["id"] for node in nodes]
+        self.labels = [tuple(node["labels"]) for node in nodes]
+        self.properties = [node["properties"] for node in nodes]
+        self.node_count = len(nodes)
+        position = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+        members = defaultdict(list)
+        for i, labels in enumerate(self.labels):
+            for label in labels:
+                members[label].append(i)
+        self._label_index = {label: np.array(indices, dtype=np.int32) for label, indices in members.items()}
+
+        # relationships whose end points are missing (read while the graph
+        # changed) are dropped; the next refresh picks them up
+        kept = [r for r in relationships if r["start"] in position and r["end"] in position]
+        self.relationship_types = sorted({r["type"] for r in kept})
+        type_ids = {rel_type: i for i, rel_type in enumerate(self.relationship_types)}
+        self._start = np.array([position[r["start"]] for r in kept], dtype=np.int32)
+        self._end = np.array([position[r["end"]] for r in kept], dtype=np.int32)
+        self._type = np.array([type_ids[r["type"]] for r in kept], dtype=np.int32)
+        self.relationship_properties = [r["properties"] for r in kept]
+        self.relationship_count = len(kept)
+
+        self._adjacency = {}
+        for rel_type, type_id in type_ids.items():
+            ids = np.flatnonzero(self._type == type_id).astype(np.int32)
+            self._adjacency[rel_type] = (
+                self._csr(self._start[ids], ids),
+                self._csr(self._end[ids], ids),
+            )
+        self._property_index = {}
+        self._lock = threading.Lock()
+
+    def _csr(self, sources: np.ndarray, ids: np.ndarray):
+        order = np.argsort(sources, kind="stable")
+        offsets = np.zeros(self.node_count + 1, dtype=np.int32)
+        np.cumsum(np.bincount(sources, minlength=self.node_count), out=offsets[1:])
+        return offsets, ids[order]
+
+    @classmethod
+    def from_data(cls, data: dict):
+        return cls(data["nodes"], data["relationships"])
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as fp:
+            return cls.from_data(json.load(fp))
+
+    def nodes_with_label(self, label: str) -> list[int]:
+        nodes = self._label_index.get(label)
+        return [] if nodes is None else nodes.tolist()
+
+    def find(self, label: str, key: str, value) -> list[int]:
+        # nodes with `label` whose `key` equals `value`
+        try:
+            index_key = _index_key(value)
+            hash(index_key)
+        except TypeError:
+            return [n for n in self.nodes_with_label(label) if self.properties[n].get(key) == value]
+        with self._lock:
+            index = self._property_index.get((label, key))
+            if index is None:
+                index = defaultdict(list)
+                for node in self.nodes_with_label(label):
+                    node_value = self.properties[node].get(key)
+                    try:
+                        index[_index_key(node_value)].append(node)
+                    except TypeError:
+                        pass
+                self._property_index[(label, key)] = index
+        return index.get(index_key, [])
+
+    def expand(self, node: int, types: list[str], directions: tuple):
+        # (relationship, other node) for each relationship of `types` (any
+        # type when empty) leaving ("out") or entering ("in") `node`
+        for rel_type in types or self.relationship_types:
+            adjacency = self._adjacency.get(rel_type)
+            if adjacency is None:
+                continue
+            for direction in directions:
+                offsets, ids = adjacency[0] if direction == "out" else adjacency[1]
+                others = self._end if direction == "out" else self._start
+                for relationship in ids[offsets[node]:offsets[node + 1]].tolist():
+                    yield relationship, int(others[relationship])
+
+    def relationship_start(self, relationship: int) -> int:
+        return int(self._start[relationship])
+
+    def relationship_end(self, relationship: int) -> int:
+        return int(self._end[relationship])
+
+    def relationship_type(self, relationship: int) -> str:
+        return self.relationship_types[self._type[relationship]]
+
+    def execute(self, query: str, parameters: dict | None = None) -> list[dict]:
+        return LocalExecutor(self).execute(query, parameters)
+
+class GraphReplica:
+    # Keeps a GraphSnapshot of the graph in process and answers the read
+    # queries the local executor supports from it, without a round trip to
+    # Neo4j. A background thread polls the graph version token every
+    # `refresh_interval_seconds` and, when it changed, re-reads only the game
+    # state (the static board description is read once). Without a version
+    # token the game state is re-read on every poll. After a write through
+    # the driver the replica refuses queries until it has caught up.
+    def __init__(
+        self,
+        driver_factory,
+        refresh_interval_seconds: float = 1.0,
+        static_labels: list[str] | None = None,
+        static_relationship_types: list[str] | None = None,
+        max_records: int = 1_000_000,
+    ):
+        # `driver_factory` returns a GraphDatabaseDriver that does not use
+        # the replica itself
+        self._driver_factory = driver_factory
+        self._refresh_interval = refresh_interval_seconds
+        self._static_labels = list(static_labels or [])
+        self._static_relationship_types = list(static_relationship_types or [])
+        self._max_records = max_records
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._static_records = None
+        self._version = None
+        # bumped by every write; the replica is current when the last refresh
+        # started after the last write
+        self._writes = 0
+        self._refreshed_writes = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._stats = {
+            "local_queries": 0,
+            "unsupported": 0,
+            "not_ready": 0,
+            "local_time": 0.0,
+            "full_loads": 0,
+            "incremental_loads": 0,
+            "version_checks": 0,
+            "refresh_errors": 0,
+            "last_error": None,
+            "last_refresh_time": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Config, driver_factory):
+        settings = config.get_graph_replica_settings()
+        if not settings["enabled"]:
+            return None
+        cache_settings = config.get_result_cache_settings()
+        return cls(
+            driver_factory,
+            refresh_interval_seconds=settings["refresh_interval_seconds"],
+            static_labels=cache_settings["static_labels"],
+            static_relationship_types=cache_settings["static_relationship_types"],
+            max_records=settings["max_records"],
+        )
+
+    def start(self):
+        # first load on the caller's thread so the replica is ready when
+        # this returns (unless Neo4j is unreachable; then it keeps retrying)
+        self.refresh()
+        self._thread = threading.Thread(target=self._poll, name="graph-replica", daemon=True)
+        self._thread.start()
+        return self
+
+    def _poll(self):
+        while not self._closed:
+            self._wake.wait(self._refresh_interval)
+            self._wake.clear()
+            if not self._closed:
+                self.refresh()
+
+    def _read(self, driver, query: str, parameters: dict | None = None) -> list[dict]:
+        with driver.stream_query(query, parameters or {}, max_rows=self._max_records, max_bytes=float("inf")) as result:
+            rows = list(result)
+        if result.truncated:
+            raise RuntimeError(f"graph has more than {self._max_records} records to replicate")
+        return rows
+
+    def _split(self, nodes: list[dict], relationships: list[dict]):
+        static_labels = set(self._static_labels)
+        static_types = set(self._static_relationship_types)
+        static_nodes = [n for n in nodes if n["labels"] and set(n["labels"]) <= static_labels]
+        static_ids = {n["id"] for n in static_nodes}
+        static_relationships = [
+            r for r in relationships
+            if r["type"] in static_types and r["start"] in static_ids and r["end"] in static_ids
+        ]
+        return static_nodes, static_relationships
+
+    def refresh(self):
+        writes = self._writes
+        start = time.perf_counter()
+        try:
+            with telemetry.background_span("replica.refresh") as span, self._driver_factory() as driver:
+                version = driver.get_graph_version()
+                with self._lock:
+                    self._stats["version_checks"] += 1
+                    current = (
+                        self._snapshot is not None
+                        and version is not None
+                        and version == self._version
+                        and self._refreshed_writes == writes
+                    )
+                if current:
+                    span.set("loaded", "none")
+                    return
+                if self._static_records is None:
+                    nodes = self._read(driver, NODES_QUERY)
+                    relationships = self._read(driver, RELATIONSHIPS_QUERY)
+                    static_records = self._split(nodes, relationships)
+                    kind = "full_loads"
+                else:
+                    parameters = {
+                        "static_labels": self._static_labels,
+                        "static_types": self._static_relationship_types,
+                    }
+                    static_records = self._static_records
+                    nodes = static_records[0] + self._read(driver, DYNAMIC_NODES_QUERY, parameters)
+                    relationships = static_records[1] + self._read(driver, DYNAMIC_RELATIONSHIPS_QUERY, parameters)
+                    kind = "incremental_loads"
+                snapshot = GraphSnapshot(nodes, relationships)
+                span.set("loaded", kind)
+                span.set("nodes", snapshot.node_count)
+                span.set("relationships", snapshot.relationship_count)
+        except Exception as error:
+            with self._lock:
+                self._stats["refresh_errors"] += 1
+                self._stats["last_error"] = str(error)
+            return
+
+        with self._lock:
+            self._static_records = static_records
+            self._snapshot = snapshot
+            self._version = version
+            self._refreshed_writes = writes
+            self._stats[kind] += 1
+            self._stats["last_refresh_time"] = time.perf_counter() - start
+            self._stats["last_error"] = None
+
+    def mark_stale(self):
+        # called after a write; queries go to Neo4j until the next refresh
+        with self._lock:
+            self._writes += 1
+        self._wake.set()
+
+    def supports(self, query: str) -> bool:
+        # the replica is current and the executor understands the query
+        with self._lock:
+            if self._snapshot is None or self._refreshed_writes != self._writes:
+                return False
+        try:
+            parse_query(query)
+        except UnsupportedQuery:
+            return False
+        return True
+
+    def execute(self, query: str, parameters: dict | None = None) -> list[dict]:
+        # raises UnsupportedQuery when the query (or the replica's state)
+        # needs Neo4j
+        with self._lock:
+            snapshot = self._snapshot
+            ready = snapshot is not None and self._refreshed_writes == self._writes
+            if not ready:
+                self._stats["not_ready"] += 1
+        if not ready:
+            telemetry.increment("rag_cache_lookups_total", cache="replica", result="not_ready")
+            raise UnsupportedQuery("the replica is not loaded or behind a write")
+
+        start = time.perf_counter()
+        try:
+            with telemetry.span("db.local", query=query) as span:
+                rows = snapshot.execute(query, parameters)
+                span.set("rows", len(rows))
+        except UnsupportedQuery:
+            with self._lock:
+                self._stats["unsupported"] += 1
+            telemetry.increment("rag_cache_lookups_total", cache="replica", result="unsupported")
+            raise
+        with self._lock:
+            self._stats["local_queries"] += 1
+            self._stats["local_time"] += time.perf_counter() - start
+        telemetry.increment("rag_cache_lookups_total", cache="replica", result="hit")
+        telemetry.observe("rag_db_rows", len(rows))
+        return rows
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            snapshot = self._snapshot
+            stats["version"] = self._version
+        stats["nodes"] = snapshot.node_count if snapshot else 0
+        stats["relationships"] = snapshot.relationship_count if snapshot else 0
+        local_time = stats.pop("local_time")
+        stats["avg_local_ms"] = local_time / stats["local_queries"] * 1000 if stats["local_queries"] else 0.0
+        queries = stats["local_queries"] + stats["unsupported"] + stats["not_ready"]
+        stats["local_rate"] = stats["local_queries"] / queries if queries else 0.0
+        return stats
@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from backend import telemetry
+from backend.config import Config
+from backend.cypher_utils import canonicalize_query
+from backend.cypher_validator import CypherValidationError
+
+async def _iterate(candidates: list[str]):
+    for candidate in candidates:
+        yield candidate
+
+class CandidateCancelled(Exception):
+    # raised inside a losing candidate once another one has won
+    pass
+
+class HedgeOutcome:
+    def __init__(self, candidates: list[str]):
+        # deduplicated candidates, in the order they were generated
+        self.candidates = candidates
+        # the winning (possibly rewritten) query and its rows; the first
+        # candidate that ran without error when every result was empty
+        self.query = None
+        self.rows = []
+        self.index = None
+        # (candidate, error) for rejected and failed candidates
+        self.rejected = []
+        self.errors = []
+        self.cancelled = 0
+
+    @property
+    def found(self):
+        return bool(self.rows)
+
+class HedgedExecutor:
+    # Runs N alternative Cypher candidates for one question at once and keeps
+    # the first that returns rows. Candidates that normalize to the same
+    # query run once. `execute(query)` validates and runs one candidate and
+    # returns (query as run, rows); a CypherValidationError counts as a
+    # rejection. Losers are cancelled: asyncio tasks directly, threads at
+    # their next row through the `cancelled` event they are passed.
+    def __init__(self, candidates: int = 3, temperature: float = 0.8, timeout_seconds: float = 30.0):
+        self.candidates = candidates
+        self.temperature = temperature
+        self._timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=candidates * 4, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self._stats = {
+            "races": 0,
+            "found": 0,
+            "generated": 0,
+            "duplicates": 0,
+            "rejected": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "race_time": 0.0,
+            # how often the candidate at each position won
+            "wins_by_candidate": {},
+        }
+
+    @classmethod
+    def from_config(cls, config: Config):
+        settings = config.get_hedging_settings()
+        if not settings["enabled"]:
+            return None
+        return cls(
+            candidates=settings["candidates"],
+            temperature=settings["temperature"],
+            timeout_seconds=settings["timeout_seconds"],
+        )
+
+    def deduplicate(self, candidates: list[str]) -> list[str]:
+        unique = {}
+        for candidate in candidates:
+            if not candidate.strip():
+                continue
+            unique.setdefault(canonicalize_query(candidate), candidate)
+        with self._lock:
+            self._stats["generated"] += len(candidates)
+            self._stats["duplicates"] += len(candidates) - len(unique)
+        return list(unique.values())
+
+    def _settle(self, outcome: HedgeOutcome, index: int, candidate: str, result=None, error=None) -> bool:
+        # records one finished candidate; True when it wins the race
+        if error is not None:
+            target = outcome.rejected if isinstance(error, CypherValidationError) else outcome.errors
+            target.append((candidate, error))
+            return False
+        query, rows = result
+        if rows:
+            outcome.query, outcome.rows, outcome.index = query, list(rows), index
+            return True
+        if outcome.query is None or index < outcome.index:
+            outcome.query, outcome.index = query, index
+        return False
+
+    def _finish(self, outcome: HedgeOutcome, elapsed: float, span):
+        with self._lock:
+            self._stats["races"] += 1
+            self._stats["found"] += outcome.found
+            self._stats["rejected"] += len(outcome.rejected)
+            self._stats["failed"] += len(outcome.errors)
+            self._stats["cancelled"] += outcome.cancelled
+            self._stats["race_time"] += elapsed
+            if outcome.found:
+                wins = self._stats["wins_by_candidate"]
+                wins[outcome.index] = wins.get(outcome.index, 0) + 1
+        span.set("winner", outcome.index)
+        span.set("found", outcome.found)
+        span.set("cancelled", outcome.cancelled)
+        telemetry.increment("rag_hedged_candidates_total", len(outcome.rejected), result="rejected")
+        telemetry.increment("rag_hedged_candidates_total", len(outcome.errors), result="failed")
+        telemetry.increment("rag_hedged_candidates_total", outcome.cancelled, result="cancelled")
+        return outcome
+
+    def race(self, candidates: list[str], execute) -> HedgeOutcome:
+        # thread-based race; `execute(query, cancelled)` should stop with
+        # CandidateCancelled once `cancelled` is set
+        outcome = HedgeOutcome(self.deduplicate(candidates))
+        start = time.perf_counter()
+        cancelled = threading.Event()
+        with telemetry.span("db.hedged", candidates=len(outcome.candidates)) as span:
+            futures = {
+                self._executor.submit(contextvars.copy_context().run, execute, candidate, cancelled): (index, candidate)
+                for index, candidate in enumerate(outcome.candidates)
+            }
+            pending = set(futures)
+            deadline = start + self._timeout_seconds
+            while pending:
+                done, pending = wait(pending, timeout=max(deadline - time.perf_counter(), 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                won = False
+                for future in sorted(done, key=lambda f: futures[f][0]):
+                    index, candidate = futures[future]
+                    error = future.exception()
+                    won = self._settle(outcome, index, candidate, None if error else future.result(), error) or won
+                    if won:
+                        break
+                if won:
+                    break
+            cancelled.set()
+            for future in pending:
+                future.cancel()
+            outcome.cancelled = len(pending)
+            return self._finish(outcome, time.perf_counter() - start, span)
+
+    async def race_async(self, candidates, execute) -> HedgeOutcome:
+        # asyncio race; `execute(query)` is a coroutine function. `candidates`
+        # is a list or an async iterator (e.g. stream_candidates()), whose
+        # candidates start running as they arrive; the timeout counts from
+        # the first one. An iterator that fails before yielding any raises.
+        if not hasattr(candidates, "__aiter__"):
+            candidates = _iterate(candidates)
+        outcome = HedgeOutcome([])
+        seen = set()
+        start = time.perf_counter()
+        deadline = None
+        with telemetry.span("db.hedged") as span:
+            tasks = {}
+            arrival = asyncio.ensure_future(anext(candidates, None))
+            pending = {arrival}
+            try:
+                while pending:
+                    timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+                    done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        break
+                    if arrival in done:
+                        candidate = arrival.result()
+                        arrival = None
+                        if candidate is not None:
+                            arrival = asyncio.ensure_future(anext(candidates, None))
+                            pending.add(arrival)
+                            key = canonicalize_query(candidate) if candidate.strip() else None
+                            with self._lock:
+                                self._stats["generated"] += 1
+                                self._stats["duplicates"] += key is None or key in seen
+                            if key is not None and key not in seen:
+                                seen.add(key)
+                                outcome.candidates.append(candidate)
+                                task = asyncio.ensure_future(execute(candidate))
+                                tasks[task] = (len(outcome.candidates) - 1, candidate)
+                                pending.add(task)
+                                if deadline is None:
+                                    deadline = time.perf_counter() + self._timeout_seconds
+                    won = False
+                    for task in sorted((t for t in done if t in tasks), key=lambda t: tasks[t][0]):
+                        index, candidate = tasks[task]
+                        error = task.exception()
+                        won = self._settle(outcome, index, candidate, None if error else task.result(), error) or won
+                        if won:
+                            break
+                    if won:
+                        break
+            finally:
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+                if hasattr(candidates, "aclose"):
+                    await candidates.aclose()
+            outcome.cancelled = sum(1 for task in pending if task in tasks)
+            span.set("candidates", len(outcome.candidates))
+            return self._finish(outcome, time.perf_counter() - start, span)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["wins_by_candidate"] = dict(self._stats["wins_by_candidate"])
+        stats["found_rate"] = stats["found"] / stats["races"] if stats["races"] else 0.0
+        stats["avg_race_time"] = stats.pop("race_time") / stats["races"] if stats["races"] else 0.0
+        return stats
+
+def neo4j_candidate(driver_factory, validator=None):
+    # `execute` for race(): every candidate gets its own driver context (a
+    # pooled driver's session is not shared between threads), is validated
+    # and then streamed, so a loser stops at its next row
+    def execute(query: str, cancelled: threading.Event):
+        with driver_factory() as driver:
+            if validator is not None:
+                query = validator.validate(query, driver).query
+            rows = []
+            with driver.stream_query(query) as result:
+                for row in result:
+                    if cancelled.is_set():
+                        raise CandidateCancelled(query)
+                    rows.append(row)
+            return query, rows
+    return execute
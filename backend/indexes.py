@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import re
+from neo4j.exceptions import Neo4jError
+from backend.config import Config, load_config
+from backend.database import GraphDatabaseDriver
+from backend.query_log import QueryLog
+from backend.schema_index import SchemaIndex
+
+# single-property node indexes; constraint-backed ones are uniqueness constraints
+SHOW_INDEXES = """SHOW INDEXES
+YIELD name, type, entityType, labelsOrTypes, properties, owningConstraint
+WHERE entityType = 'NODE' AND size(properties) = 1
+RETURN name, type, labelsOrTypes[0] AS label, properties[0] AS property, owningConstraint IS NOT NULL AS backs_constraint"""
+AWAIT_INDEXES = "CALL db.awaitIndexes($timeout)"
+
+_RANGE_TYPES = {"STRING", "INTEGER", "FLOAT", "BOOLEAN"}
+# predicate kinds of the query log -> the index that serves them
+_INDEX_FOR_KIND = {"equality": "RANGE", "range": "RANGE", "prefix": "RANGE", "text": "TEXT"}
+_CAMEL_CASE_PATTERN = re.compile(r"(?<=[a-z])(?=[A-Z])")
+
+class IndexSpec:
+    # One index or constraint on a single node property. `kind` is UNIQUE
+    # (a uniqueness constraint, which comes with a range index), RANGE or TEXT.
+    def __init__(self, kind: str, label: str, prop: str):
+        self.kind = kind
+        self.label = label
+        self.property = prop
+
+    @property
+    def key(self):
+        return self.kind, self.label, self.property
+
+    @property
+    def name(self):
+        label = _CAMEL_CASE_PATTERN.sub("_", self.label).lower()
+        return f"{self.kind.lower()}_{label}_{self.property}"
+
+    @property
+    def statement(self):
+        if self.kind == "UNIQUE":
+            return (
+                f"CREATE CONSTRAINT {self.name} IF NOT EXISTS "
+                f"FOR (n:`{self.label}`) REQUIRE n.`{self.property}` IS UNIQUE"
+            )
+        return f"CREATE {self.kind} INDEX {self.name} IF NOT EXISTS FOR (n:`{self.label}`) ON (n.`{self.property}`)"
+
+    def to_dict(self):
+        return {"name": self.name, "kind": self.kind, "label": self.label, "property": self.property,
+                "statement": self.statement}
+
+def schema_indexes(schema_index: SchemaIndex) -> list[IndexSpec]:
+    # What schema.txt implies:
+    #   - `id`, and `name` of the catalog labels (its options are listed): UNIQUE
+    #   - every other scalar property: RANGE (equality, IN, ranges, STARTS WITH)
+    #   - STRING properties without listed options: TEXT too, for CONTAINS /
+    #     ENDS WITH; `description`s only get TEXT (they are prose, too long
+    #     to be worth a range index)
+    specs = []
+    for label in schema_index.labels:
+        enumerated = schema_index.get_enumerated_properties(label)
+        for prop, prop_type in schema_index.get_property_types(label).items():
+            if prop == "id" or (prop == "name" and prop in enumerated):
+                specs.append(IndexSpec("UNIQUE", label, prop))
+                continue
+            if prop_type not in _RANGE_TYPES:
+                continue
+            if prop != "description":
+                specs.append(IndexSpec("RANGE", label, prop))
+            if prop_type == "STRING" and prop not in enumerated:
+                specs.append(IndexSpec("TEXT", label, prop))
+    return specs
+
+def existing_indexes(driver: GraphDatabaseDriver) -> dict[tuple, str]:
+    # (kind, label, property) -> name of what Neo4j already has
+    existing = {}
+    for row in driver.execute_query(SHOW_INDEXES, {}):
+        kind = "UNIQUE" if row["backs_constraint"] else row["type"]
+        existing[(kind, row["label"], row["property"])] = row["name"]
+    return existing
+
+def _covered_by(spec: IndexSpec, existing: dict[tuple, str]):
+    # name of the existing index serving `spec`, if any
+    kinds = ["UNIQUE", "RANGE"] if spec.kind == "RANGE" else [spec.kind]
+    for kind in kinds:
+        name = existing.get((kind, spec.label, spec.property))
+        if name:
+            return name
+    return None
+
+def bootstrap(driver: GraphDatabaseDriver, specs: list[IndexSpec], timeout_seconds: int = 300) -> dict:
+    # Creates the specs Neo4j does not have yet, one statement each so one
+    # failure (e.g. duplicate values under a uniqueness constraint) does not
+    # stop the rest, then waits for the new indexes to come online. Running
+    # it again creates nothing.
+    existing = existing_indexes(driver)
+    report = {"created": [], "existing": [], "conflicts": [], "failed": {}}
+    for spec in specs:
+        if _covered_by(spec, existing):
+            report["existing"].append(spec.name)
+        elif spec.kind == "UNIQUE" and (("RANGE", spec.label, spec.property) in existing):
+            # a constraint cannot be added over an equivalent plain index
+            report["conflicts"].append({
+                "name": spec.name,
+                "index": existing[("RANGE", spec.label, spec.property)],
+            })
+        else:
+            try:
+                driver.execute_write([(spec.statement, {})])
+            except Neo4jError as error:
+                report["failed"][spec.name] = error.message or str(error)
+                continue
+            report["created"].append(spec.name)
+            existing[spec.key] = spec.name
+    if report["created"]:
+        driver.execute_query(AWAIT_INDEXES, {"timeout": timeout_seconds})
+    return report
+
+class IndexAdvisor:
+    # Aggregates query log entries by the predicates their plans filtered
+    # without an index, weighted by the entries' db hits, and recommends a
+    # RANGE or TEXT index for those seen in at least `min_queries` queries
+    # totalling `min_db_hits`. Predicates on a function of the property
+    # (e.g. toLower(p.name) CONTAINS ...) cannot use any index and are
+    # reported separately.
+    def __init__(self, min_queries: int = 5, min_db_hits: int = 1000):
+        self._min_queries = min_queries
+        self._min_db_hits = min_db_hits
+
+    @classmethod
+    def from_config(cls, config: Config):
+        settings = config.get_index_settings()
+        return cls(min_queries=settings["min_queries"], min_db_hits=settings["min_db_hits"])
+
+    def advise(self, entries: list[dict], existing: dict[tuple, str] | None = None) -> dict:
+        existing = existing or {}
+        hot = {}
+        unindexable = {}
+        for entry in entries:
+            db_hits = entry.get("db_hits") or 0
+            keys = set()
+            functions = set()
+            for predicate in entry.get("predicates", []):
+                if predicate.get("function"):
+                    functions.add((predicate["label"], predicate["property"], predicate["kind"], predicate["function"]))
+                else:
+                    keys.add((_INDEX_FOR_KIND[predicate["kind"]], predicate["label"], predicate["property"]))
+            for key in keys:
+                totals = hot.setdefault(key, {"queries": 0, "db_hits": 0})
+                totals["queries"] += 1
+                totals["db_hits"] += db_hits
+            for key in functions:
+                totals = unindexable.setdefault(key, {"queries": 0, "db_hits": 0})
+                totals["queries"] += 1
+                totals["db_hits"] += db_hits
+
+        recommendations = []
+        for key, totals in hot.items():
+            spec = IndexSpec(*key)
+            if totals["queries"] < self._min_queries or totals["db_hits"] < self._min_db_hits:
+                continue
+            if _covered_by(spec, existing):
+                continue
+            recommendations.append({**spec.to_dict(), **totals})
+        recommendations.sort(key=lambda item: item["db_hits"], reverse=True)
+        return {
+            "queries": len(entries),
+            "recommendations": recommendations,
+            "unindexable": sorted(
+                (
+                    {"label": label, "property": prop, "kind": kind, "function": function, **totals}
+                    for (label, prop, kind, function), totals in unindexable.items()
+                ),
+                key=lambda item: item["db_hits"],
+                reverse=True,
+            ),
+        }
+
+def hot_queries(entries: list[dict], limit: int = 20) -> list[tuple[str, dict]]:
+    # (query, parameters) of the logged queries with the most db hits in
+    # total, with the parameters of their last run
+    totals = {}
+    for entry in entries:
+        query = entry["query"]
+        hits, _ = totals.get(query, (0, None))
+        totals[query] = (hits + (entry.get("db_hits") or 0), entry.get("parameters") or {})
+    ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+    return [(query, parameters) for query, (_, parameters) in ranked[:limit]]
+
+def profile_queries(driver: GraphDatabaseDriver, queries: list[tuple[str, dict]]) -> dict[str, int | None]:
+    db_hits = {}
+    for query, parameters in queries:
+        try:
+            db_hits[query] = driver.profile(query, parameters)["db_hits"]
+        except Neo4jError:
+            db_hits[query] = None
+    return db_hits
+
+def compare_db_hits(before: dict[str, int | None], after: dict[str, int | None]) -> dict:
+    rows = []
+    total_before = total_after = 0
+    for query, hits_before in before.items():
+        hits_after = after.get(query)
+        reduction = None
+        if hits_before is not None and hits_after is not None:
+            total_before += hits_before
+            total_after += hits_after
+            reduction = 1 - hits_after / hits_before if hits_before else 0.0
+        rows.append({"query": query, "before": hits_before, "after": hits_after, "reduction": reduction})
+    rows.sort(key=lambda row: row["reduction"] or 0.0, reverse=True)
+    return {
+        "before": total_before,
+        "after": total_after,
+        "reduction": 1 - total_after / total_before if total_before else 0.0,
+        "queries": rows,
+    }
+
+def apply_and_measure(driver: GraphDatabaseDriver, specs: list[IndexSpec], entries: list[dict], limit: int = 20) -> dict:
+    # bootstrap(specs), with the db hits of the hottest logged queries
+    # profiled before and after
+    queries = hot_queries(entries, limit)
+    before = profile_queries(driver, queries)
+    report = bootstrap(driver, specs)
+    after = profile_queries(driver, queries)
+    return {"indexes": report, "db_hits": compare_db_hits(before, after)}
+
+def bootstrap_from_config(config: Config, schema: str):
+    # startup hook: None unless [indexes] bootstrap is on; an unreachable
+    # database is reported rather than raised
+    if not config.get_index_settings()["bootstrap"]:
+        return None
+    try:
+        with GraphDatabaseDriver(config, use_replica=False) as driver:
+            return bootstrap(driver, schema_indexes(SchemaIndex(schema)))
+    except Exception as error:
+        return {"error": str(error)}
+
+def load_entries(config: Config, path: str | None = None) -> list[dict]:
+    path = path or config.get_query_log_settings()["path"]
+    return QueryLog.load(path) if path and os.path.exists(path) else []
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the indexes schema.txt implies, or those the query log asks for.")
+    parser.add_argument("command", choices=["bootstrap", "advise"])
+    parser.add_argument("--schema", default="schema.txt")
+    parser.add_argument("--log", help="Query log to read (defaults to [query_log] path).")
+    parser.add_argument("--apply", action="store_true", help="advise: also create the recommended indexes.")
+    parser.add_argument("--dry-run", action="store_true", help="bootstrap: only print the statements.")
+    args = parser.parse_args()
+    config = load_config()
+    settings = config.get_index_settings()
+    entries = load_entries(config, args.log)
+
+    if args.command == "bootstrap":
+        with open(args.schema, encoding="utf-8") as fp:
+            specs = schema_indexes(SchemaIndex(fp.read()))
+        if args.dry_run:
+            print("\n".join(spec.statement for spec in specs))
+            return
+        with GraphDatabaseDriver(config, use_replica=False) as driver:
+            result = apply_and_measure(driver, specs, entries, settings["measure_queries"])
+    else:
+        with GraphDatabaseDriver(config, use_replica=False) as driver:
+            result = IndexAdvisor.from_config(config).advise(entries, existing_indexes(driver))
+            if args.apply and result["recommendations"]:
+                specs = [IndexSpec(item["kind"], item["label"], item["property"]) for item in result["recommendations"]]
+                result.update(apply_and_measure(driver, specs, entries, settings["measure_queries"]))
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import os
+import warnings
+from backend.config import Config
+
+# torch is imported inside the methods so that importing this module stays
+# cheap, like the model-backed classes that use it
+
+class InferenceBackend:
+    # CPU execution options for a local causal LM, applied once after loading:
+    # dynamic int8 quantization of the Linear layers, torch.compile of the
+    # forward pass, intra-/inter-op thread counts and CPU affinity, and a
+    # preallocated (static) KV cache. All off is the plain eager path.
+    def __init__(
+        self,
+        dtype: str = "auto",
+        quantize: bool = False,
+        compile: bool = False,
+        compile_mode: str = "default",
+        num_threads: int = 0,
+        num_interop_threads: int = 0,
+        cpu_affinity: list[int] | None = None,
+        static_cache: bool = False,
+    ):
+        self._dtype = dtype
+        self._quantize = quantize
+        self._compile = compile
+        self._compile_mode = compile_mode
+        self._num_threads = num_threads
+        self._num_interop_threads = num_interop_threads
+        self._cpu_affinity = list(cpu_affinity or [])
+        self._static_cache = static_cache
+        self._info = {}
+
+    @classmethod
+    def from_config(cls, config: Config):
+        settings = config.get_inference_settings()
+        return cls(
+            dtype=settings["dtype"],
+            quantize=settings["quantize"],
+            compile=settings["compile"],
+            compile_mode=settings["compile_mode"],
+            num_threads=settings["num_threads"],
+            num_interop_threads=settings["num_interop_threads"],
+            cpu_affinity=settings["cpu_affinity"],
+            static_cache=settings["static_cache"],
+        )
+
+    @classmethod
+    def from_name(cls, name: str, **kwargs):
+        # "eager", "int8", "compile", "static" or a "+"-joined combination,
+        # e.g. "int8+compile"; used by the inference benchmark
+        parts = set(name.split("+")) - {"eager"}
+        unknown = parts - {"int8", "compile", "static"}
+        if unknown:
+            raise ValueError(f"unknown inference backend option(s): {', '.join(sorted(unknown))}")
+        return cls(quantize="int8" in parts, compile="compile" in parts, static_cache="static" in parts, **kwargs)
+
+    @property
+    def name(self):
+        parts = [
+            part for part, enabled in (
+                ("int8", self._quantize), ("compile", self._compile), ("static", self._static_cache)
+            ) if enabled
+        ]
+        return "+".join(parts) or "eager"
+
+    def configure_threads(self):
+        # process-wide, so call it before the model runs for the first time
+        import torch
+
+        if self._cpu_affinity and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self._cpu_affinity)
+        if self._num_threads:
+            torch.set_num_threads(self._num_threads)
+        if self._num_interop_threads:
+            try:
+                torch.set_num_interop_threads(self._num_interop_threads)
+            except RuntimeError:
+                # only possible before any inter-op parallel work started
+                pass
+        self._info["num_threads"] = torch.get_num_threads()
+        self._info["num_interop_threads"] = torch.get_num_interop_threads()
+        if hasattr(os, "sched_getaffinity"):
+            self._info["cpus"] = len(os.sched_getaffinity(0))
+
+    def load_kwargs(self):
+        # from_pretrained() arguments; quantize_dynamic needs float32 weights
+        import torch
+
+        dtype = torch.float32 if self._quantize else self._dtype
+        return {"dtype": dtype, "device_map": "cpu"}
+
+    def prepare(self, model):
+        # Returns the model to run, converted in place where possible.
+        import torch
+
+        if self._quantize:
+            if model.dtype != torch.float32:
+                model = model.float()
+            with warnings.catch_warnings():
+                # torch.ao points to torchao, which is not a dependency here
+                warnings.simplefilter("ignore", DeprecationWarning)
+                warnings.simplefilter("ignore", UserWarning)
+                model = torch.ao.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+                )
+            self._info["quantized_linear_layers"] = sum(
+                1 for module in model.modules() if type(module).__module__.startswith("torch.ao.nn.quantized")
+            )
+
+        if self._compile:
+            if self._static_cache:
+                # generate() compiles the decoding step itself when the cache
+                # is static; on CPU it has to be told to
+                from transformers import CompileConfig
+
+                compile_config = CompileConfig(mode=self._compile_mode)
+                compile_config._compile_all_devices = True
+                model.generation_config.compile_config = compile_config
+            else:
+                # dynamic shapes: the dynamic cache grows every step
+                model.forward = torch.compile(model.forward, mode=self._compile_mode, dynamic=True)
+
+        self._info["backend"] = self.name
+        self._info["dtype"] = str(model.dtype).replace("torch.", "")
+        self._info["model_bytes"] = model_size_bytes(model)
+        return model
+
+    def generate_kwargs(self, model_inputs: dict):
+        # The static cache is sized to prompt + max_new_tokens by generate().
+        # It cannot be combined with the prefix cache's DynamicCache, so
+        # those requests keep the dynamic cache.
+        if self._static_cache and model_inputs.get("past_key_values") is None:
+            return {"cache_implementation": "static"}
+        return {}
+
+    def get_info(self):
+        return dict(self._info)
+
+def model_size_bytes(model) -> int:
+    # parameters and buffers, plus the packed weights of dynamically
+    # quantized layers, which are neither
+    total = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            weight, bias = packed._weight_bias()
+            total += weight.numel() * weight.element_size()
+            if bias is not None:
+                total += bias.numel() * bias.element_size()
+    return total
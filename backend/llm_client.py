@@ -0,0 +1,427 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, OpenAI
+from backend import telemetry
+from backend.config import Config
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# 408 and 409 are retried by the OpenAI SDK as well
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+def percentile(samples, fraction: float):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def parse_retry_after(headers, now: float | None = None) -> float | None:
+    # Seconds the server asks us to wait, from Retry-After (seconds or an
+    # HTTP date), retry-after-ms, or OpenRouter's X-RateLimit-Reset (epoch
+    # milliseconds). None when the response says nothing.
+    if headers is None:
+        return None
+    now = time.time() if now is None else now
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is not None:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(email.utils.parsedate_to_datetime(value).timestamp() - now, 0.0)
+            except (TypeError, ValueError):
+                pass
+    value = headers.get("x-ratelimit-reset")
+    if value is not None:
+        try:
+            reset = float(value)
+        except ValueError:
+            return None
+        # epoch milliseconds, epoch seconds, or seconds from now
+        if reset > 1e11:
+            reset /= 1000
+        return max(reset - now, 0.0) if reset > 1e9 else max(reset, 0.0)
+    return None
+
+class RateLimiter:
+    # Token bucket shared by every call of one client: `rate` requests per
+    # second with bursts of `burst`. pause() stops all callers until a time
+    # the server named, so one 429 does not trigger a retry storm.
+    def __init__(self, rate: float = 0.0, burst: int = 1):
+        self._rate = rate
+        self._burst = max(burst, 1)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def reserve(self) -> float:
+        # takes a token and returns how long the caller has to wait for it
+        with self._lock:
+            now = time.monotonic()
+            wait_time = max(self._paused_until - now, 0.0)
+            if not self._rate:
+                return wait_time
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens < 0:
+                wait_time = max(wait_time, -self._tokens / self._rate)
+            return wait_time
+
+    def try_acquire(self) -> bool:
+        # a token only if one is free right now; used for optional hedges
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return False
+            if not self._rate:
+                return True
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+class LLMClient:
+    # OpenAI-compatible chat client for OpenRouter with what the SDK's
+    # defaults lack under load:
+    # - one pooled keep-alive HTTP transport (sync and async) per client
+    # - a timeout per attempt and a deadline for the whole call
+    # - retries on 429/5xx/timeouts with full-jitter exponential backoff,
+    #   or the delay the rate-limit headers ask for
+    # - client-side rate limiting (token bucket)
+    # - optional hedging: a second identical request once the first has
+    #   run longer than the `hedge_percentile` latency of recent calls
+    # - prompt/completion token accounting per call
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = OPENROUTER_BASE_URL,
+        timeout_seconds: float = 20.0,
+        connect_timeout_seconds: float = 5.0,
+        deadline_seconds: float = 60.0,
+        max_retries: int = 4,
+        backoff_base_seconds: float = 0.5,
+        backoff_max_seconds: float = 8.0,
+        rate_limit_per_second: float = 0.0,
+        rate_limit_burst: int = 4,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry_seconds: float = 30.0,
+    ):
+        self._api_key = api_key
+        self._base_url = base_url
+        self._timeout = httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds)
+        self._timeout_seconds = timeout_seconds
+        self._deadline_seconds = deadline_seconds
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base_seconds
+        self._backoff_max = backoff_max_seconds
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry_seconds,
+        )
+        self._limiter = RateLimiter(rate_limit_per_second, rate_limit_burst)
+        self._hedge_percentile = hedge_percentile
+        self._hedge_min_samples = hedge_min_samples
+        self._latencies = deque(maxlen=200)
+        self._calls = deque(maxlen=50)
+        # retries and deadlines are handled here, not by the SDK
+        self._client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=httpx.Client(limits=self._limits, timeout=self._timeout),
+        )
+        self._async_client = None
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="llm-hedge")
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "failures": 0,
+            "deadline_exceeded": 0,
+            "rate_limited": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "errors_by_status": {},
+        }
+
+    @classmethod
+    def from_config(cls, config: Config):
+        settings = config.get_llm_client_settings()
+        return cls(
+            config.get_openai_key(),
+            base_url=settings["base_url"],
+            timeout_seconds=settings["timeout_seconds"],
+            connect_timeout_seconds=settings["connect_timeout_seconds"],
+            deadline_seconds=settings["deadline_seconds"],
+            max_retries=settings["max_retries"],
+            backoff_base_seconds=settings["backoff_base_seconds"],
+            backoff_max_seconds=settings["backoff_max_seconds"],
+            rate_limit_per_second=settings["rate_limit_per_second"],
+            rate_limit_burst=settings["rate_limit_burst"],
+            hedge_percentile=settings["hedge_percentile"],
+            hedge_min_samples=settings["hedge_min_samples"],
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive_connections"],
+            keepalive_expiry_seconds=settings["keepalive_expiry_seconds"],
+        )
+
+    def _get_async_client(self):
+        # created on first use, inside the event loop that will use it
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self._api_key,
+                base_url=self._base_url,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=self._limits, timeout=self._timeout),
+            )
+        return self._async_client
+
+    def _hedge_delay(self) -> float | None:
+        if not self._hedge_percentile:
+            return None
+        with self._lock:
+            if len(self._latencies) < self._hedge_min_samples:
+                return None
+            return percentile(self._latencies, self._hedge_percentile)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float | None:
+        # seconds before the next attempt, or None when `error` is final
+        if isinstance(error, APIStatusError):
+            status = error.status_code
+            with self._lock:
+                errors = self._stats["errors_by_status"]
+                errors[status] = errors.get(status, 0) + 1
+            if status not in RETRYABLE_STATUS:
+                return None
+            requested = parse_retry_after(error.response.headers)
+            if status == 429:
+                with self._lock:
+                    self._stats["rate_limited"] += 1
+                if requested is not None:
+                    self._limiter.pause(requested)
+            if requested is not None:
+                # a little jitter so paused callers do not return in lockstep
+                return requested + random.uniform(0, self._backoff_base)
+        elif not isinstance(error, (APITimeoutError, APIConnectionError)):
+            return None
+        return random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** attempt))
+
+    def _note_headers(self, headers):
+        # an exhausted window pauses the limiter before the server has to 429
+        if headers.get("x-ratelimit-remaining") == "0":
+            requested = parse_retry_after({"x-ratelimit-reset": headers.get("x-ratelimit-reset")})
+            if requested:
+                self._limiter.pause(requested)
+
+    def _record(self, response, latency: float, attempt_latency: float, attempts: int, hedged: bool, span):
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        with self._lock:
+            # hedging compares single attempts, so backoff is not counted
+            self._latencies.append(attempt_latency)
+            self._stats["calls"] += 1
+            self._stats["prompt_tokens"] += prompt_tokens
+            self._stats["completion_tokens"] += completion_tokens
+            self._stats["cached_prompt_tokens"] += cached_tokens
+            self._calls.append({
+                "model": getattr(response, "model", None),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cached_prompt_tokens": cached_tokens,
+                "latency": latency,
+                "attempts": attempts,
+                "hedged": hedged,
+            })
+        span.set("attempts", attempts)
+        span.set("hedged", hedged)
+        span.set("cached_prompt_tokens", cached_tokens)
+        telemetry.increment("rag_llm_requests_total", status="ok")
+
+    def _fail(self, error: Exception, deadline_exceeded: bool):
+        with self._lock:
+            self._stats["failures"] += 1
+            self._stats["deadline_exceeded"] += deadline_exceeded
+        telemetry.increment("rag_llm_requests_total", status="deadline" if deadline_exceeded else "error")
+        if deadline_exceeded:
+            raise DeadlineExceeded(f"no response within {self._deadline_seconds}s: {error}") from error
+        raise error
+
+    def _attempt(self, kwargs: dict, timeout: float):
+        raw = self._client.chat.completions.with_raw_response.create(**kwargs, timeout=timeout)
+        self._note_headers(raw.headers)
+        return raw.parse()
+
+    def _hedged_attempt(self, kwargs: dict, timeout: float):
+        # (response, hedged, hedge won)
+        delay = self._hedge_delay()
+        if delay is None or delay >= timeout:
+            return self._attempt(kwargs, timeout), False, False
+        primary = self._hedge_executor.submit(self._attempt, kwargs, timeout)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._limiter.try_acquire():
+            return primary.result(), False, False
+        with self._lock:
+            self._stats["hedges"] += 1
+        hedge = self._hedge_executor.submit(self._attempt, kwargs, max(timeout - delay, 0.001))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # the slower request finishes on its own and is ignored
+                    return future.result(), True, future is hedge
+                error = future.exception()
+        raise error
+
+    def chat(self, **kwargs):
+        # chat.completions.create() with the client's timeouts, retries,
+        # rate limit and hedging; raises DeadlineExceeded when the deadline
+        # passes first
+        deadline = time.monotonic() + self._deadline_seconds
+        start = time.perf_counter()
+        with telemetry.span("llm.chat", model=kwargs.get("model")) as span:
+            for attempt in range(self._max_retries + 1):
+                wait_time = self._limiter.reserve()
+                if time.monotonic() + wait_time >= deadline:
+                    self._fail(TimeoutError("rate limit wait"), True)
+                if wait_time:
+                    time.sleep(wait_time)
+                with self._lock:
+                    self._stats["attempts"] += 1
+                    self._stats["retries"] += attempt > 0
+                timeout = min(self._timeout_seconds, deadline - time.monotonic())
+                attempt_start = time.perf_counter()
+                try:
+                    response, hedged, hedge_won = self._hedged_attempt(kwargs, timeout)
+                except Exception as error:
+                    delay = self._retry_delay(error, attempt)
+                    if delay is None or attempt == self._max_retries:
+                        self._fail(error, False)
+                    if time.monotonic() + delay >= deadline:
+                        self._fail(error, True)
+                    telemetry.increment("rag_llm_requests_total", status="retry")
+                    time.sleep(delay)
+                    continue
+                with self._lock:
+                    self._stats["hedge_wins"] += hedge_won
+                now = time.perf_counter()
+                self._record(response, now - start, now - attempt_start, attempt + 1, hedged, span)
+                return response
+
+    async def _attempt_async(self, kwargs: dict, timeout: float):
+        raw = await self._get_async_client().chat.completions.with_raw_response.create(**kwargs, timeout=timeout)
+        self._note_headers(raw.headers)
+        return raw.parse()
+
+    async def _hedged_attempt_async(self, kwargs: dict, timeout: float):
+        delay = self._hedge_delay()
+        if delay is None or delay >= timeout:
+            return await self._attempt_async(kwargs, timeout), False, False
+        primary = asyncio.ensure_future(self._attempt_async(kwargs, timeout))
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done or not self._limiter.try_acquire():
+            return await primary, False, False
+        with self._lock:
+            self._stats["hedges"] += 1
+        hedge = asyncio.ensure_future(self._attempt_async(kwargs, max(timeout - delay, 0.001)))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), True, task is hedge
+                    error = task.exception()
+            raise error
+        finally:
+            # the slower request is cancelled, which closes its connection
+            for task in pending:
+                task.cancel()
+
+    async def chat_async(self, **kwargs):
+        # chat() for the async pipeline
+        deadline = time.monotonic() + self._deadline_seconds
+        start = time.perf_counter()
+        with telemetry.span("llm.chat", model=kwargs.get("model")) as span:
+            for attempt in range(self._max_retries + 1):
+                wait_time = self._limiter.reserve()
+                if time.monotonic() + wait_time >= deadline:
+                    self._fail(TimeoutError("rate limit wait"), True)
+                if wait_time:
+                    await asyncio.sleep(wait_time)
+                with self._lock:
+                    self._stats["attempts"] += 1
+                    self._stats["retries"] += attempt > 0
+                timeout = min(self._timeout_seconds, deadline - time.monotonic())
+                attempt_start = time.perf_counter()
+                try:
+                    response, hedged, hedge_won = await self._hedged_attempt_async(kwargs, timeout)
+                except Exception as error:
+                    delay = self._retry_delay(error, attempt)
+                    if delay is None or attempt == self._max_retries:
+                        self._fail(error, False)
+                    if time.monotonic() + delay >= deadline:
+                        self._fail(error, True)
+                    telemetry.increment("rag_llm_requests_total", status="retry")
+                    await asyncio.sleep(delay)
+                    continue
+                with self._lock:
+                    self._stats["hedge_wins"] += hedge_won
+                now = time.perf_counter()
+                self._record(response, now - start, now - attempt_start, attempt + 1, hedged, span)
+                return response
+
+    def get_recent_calls(self):
+        # per-call token usage and latency of the most recent calls
+        with self._lock:
+            return list(self._calls)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["errors_by_status"] = dict(self._stats["errors_by_status"])
+            latencies = list(self._latencies)
+        if latencies:
+            stats["p50_latency"] = percentile(latencies, 0.5)
+            stats["p95_latency"] = percentile(latencies, 0.95)
+            stats["p99_latency"] = percentile(latencies, 0.99)
+        stats["hedge_after"] = self._hedge_delay()
+        return stats
+
+    def close(self):
+        self._client.close()
+        self._hedge_executor.shutdown(wait=False)
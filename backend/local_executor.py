@@ -0,0 +1,990 @@
+import functools
+import math
+from backend.cypher_utils import parse_literal, tokenize_spans
+
+class UnsupportedQuery(Exception):
+    # The query is outside the subset the local executor answers; the caller
+    # sends it to Neo4j instead.
+    pass
+
+AGGREGATES = {"count", "sum", "avg", "min", "max", "collect"}
+
+# clauses and expressions the executor does not implement
+_UNSUPPORTED_KEYWORDS = {
+    "OPTIONAL", "WITH", "UNWIND", "CALL", "UNION", "CASE", "EXISTS", "FOREACH",
+    "CREATE", "MERGE", "SET", "DELETE", "DETACH", "REMOVE", "DROP", "LOAD",
+    "EXPLAIN", "PROFILE", "XOR", "YIELD",
+}
+_COMPARISONS = {"=", "<>", "!=", "<", ">", "<=", ">="}
+
+class _Node:
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, _Node) and other.index == self.index
+
+    def __hash__(self):
+        return hash(("node", self.index))
+
+class _Relationship:
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, _Relationship) and other.index == self.index
+
+    def __hash__(self):
+        return hash(("relationship", self.index))
+
+class NodePattern:
+    def __init__(self, variable: str, labels: list[str], properties: list[tuple]):
+        self.variable = variable
+        self.labels = labels
+        self.properties = properties
+
+class RelationshipPattern:
+    def __init__(self, variable: str, types: list[str], properties: list[tuple], direction: str):
+        self.variable = variable
+        # empty means any type
+        self.types = types
+        self.properties = properties
+        # "out" for ()-[]->(), "in" for ()<-[]-(), "both" for ()-[]-()
+        self.direction = direction
+
+class ReturnItem:
+    def __init__(self, expression, column: str, text: str):
+        self.expression = expression
+        self.column = column
+        self.text = text
+        self.aggregates = []
+
+class ParsedQuery:
+    def __init__(self):
+        # [(chains, where)], a chain is ([NodePattern], [RelationshipPattern])
+        self.matches = []
+        self.distinct = False
+        self.items: list[ReturnItem] = []
+        # [(expression, text, descending)]
+        self.order = []
+        self.skip = None
+        self.limit = None
+
+class _Parser:
+    # Recursive descent over the read-only subset: MATCH chains with fixed
+    # relationship types, WHERE, RETURN [DISTINCT] with aggregates, ORDER BY,
+    # SKIP and LIMIT. Anything else raises UnsupportedQuery.
+    def __init__(self, query: str):
+        self._query = query
+        self._tokens = list(tokenize_spans(query))
+        self._position = 0
+        self._anonymous = 0
+
+    def _peek(self, offset: int = 0):
+        position = self._position + offset
+        return self._tokens[position] if position < len(self._tokens) else (None, None, len(self._query), len(self._query))
+
+    def _text(self, offset: int = 0):
+        return self._peek(offset)[1]
+
+    def _keyword(self, offset: int = 0):
+        kind, text, _, _ = self._peek(offset)
+        return text.upper() if kind == "word" else None
+
+    def _next(self):
+        token = self._peek()
+        if token[0] is None:
+            raise UnsupportedQuery("unexpected end of query")
+        self._position += 1
+        return token
+
+    def _accept(self, text: str):
+        if self._text() == text:
+            self._position += 1
+            return True
+        return False
+
+    def _accept_keyword(self, *keywords: str):
+        if self._keyword() in keywords:
+            self._position += 1
+            return True
+        return False
+
+    def _expect(self, text: str):
+        if not self._accept(text):
+            raise UnsupportedQuery(f"expected {text!r} at {self._text()!r}")
+
+    def _name(self):
+        kind, text, _, _ = self._next()
+        if kind == "word":
+            return text
+        if kind == "identifier":
+            return text[1:-1]
+        raise UnsupportedQuery(f"expected a name at {text!r}")
+
+    def _anonymous_variable(self):
+        # cannot collide with a user variable
+        self._anonymous += 1
+        return f" anonymous{self._anonymous}"
+
+    def parse(self) -> ParsedQuery:
+        for kind, text, _, _ in self._tokens:
+            if kind == "word" and text.upper() in _UNSUPPORTED_KEYWORDS:
+                raise UnsupportedQuery(f"{text.upper()} is not supported locally")
+        parsed = ParsedQuery()
+        while self._accept_keyword("MATCH"):
+            chains = [self._chain()]
+            while self._accept(","):
+                chains.append(self._chain())
+            where = self._expression() if self._accept_keyword("WHERE") else None
+            parsed.matches.append((chains, where))
+        if not parsed.matches or not self._accept_keyword("RETURN"):
+            raise UnsupportedQuery("only MATCH ... RETURN queries are supported locally")
+        self._return(parsed)
+        self._accept(";")
+        if self._peek()[0] is not None:
+            raise UnsupportedQuery(f"unexpected {self._text()!r}")
+        return parsed
+
+    def _chain(self):
+        if self._peek()[0] == "word" and self._text(1) == "=":
+            raise UnsupportedQuery("path variables are not supported locally")
+        nodes = [self._node()]
+        relationships = []
+        while self._text() in ("-", "<"):
+            relationships.append(self._relationship())
+            nodes.append(self._node())
+        return nodes, relationships
+
+    def _node(self):
+        self._expect("(")
+        variable = None
+        if self._peek()[0] in ("word", "identifier"):
+            variable = self._name()
+        labels = []
+        while self._accept(":"):
+            labels.append(self._name())
+        properties = self._properties() if self._text() == "{" else []
+        self._expect(")")
+        return NodePattern(variable or self._anonymous_variable(), labels, properties)
+
+    def _relationship(self):
+        incoming = self._accept("<")
+        self._expect("-")
+        variable, types, properties = None, [], []
+        if self._accept("["):
+            if self._peek()[0] in ("word", "identifier"):
+                variable = self._name()
+            if self._accept(":"):
+                types.append(self._name())
+                while self._accept("|"):
+                    self._accept(":")
+                    types.append(self._name())
+            if self._text() == "*":
+                raise UnsupportedQuery("variable-length relationships are not supported locally")
+            if self._text() == "{":
+                properties = self._properties()
+            self._expect("]")
+        self._expect("-")
+        outgoing = self._accept(">")
+        if incoming and outgoing:
+            raise UnsupportedQuery("relationship with two directions")
+        direction = "in" if incoming else "out" if outgoing else "both"
+        return RelationshipPattern(variable or self._anonymous_variable(), types, properties, direction)
+
+    def _properties(self):
+        self._expect("{")
+        properties = []
+        if not self._accept("}"):
+            while True:
+                key = self._name()
+                self._expect(":")
+                properties.append((key, self._expression()))
+                if self._accept("}"):
+                    break
+                self._expect(",")
+        return properties
+
+    def _return(self, parsed: ParsedQuery):
+        parsed.distinct = self._accept_keyword("DISTINCT")
+        if self._text() == "*":
+            raise UnsupportedQuery("RETURN * is not supported locally")
+        while True:
+            start = self._peek()[2]
+            expression = self._expression()
+            # Neo4j names an unaliased column after the expression as written
+            text = self._query[start:self._peek(-1)[3]]
+            column = self._name() if self._accept_keyword("AS") else text
+            parsed.items.append(ReturnItem(expression, column, text))
+            if not self._accept(","):
+                break
+
+        if self._accept_keyword("ORDER"):
+            if not self._accept_keyword("BY"):
+                raise UnsupportedQuery("expected BY")
+            while True:
+                start = self._peek()[2]
+                expression = self._expression()
+                text = self._query[start:self._peek(-1)[3]]
+                descending = self._keyword() in ("DESC", "DESCENDING")
+                self._accept_keyword("ASC", "ASCENDING", "DESC", "DESCENDING")
+                parsed.order.append((expression, text, descending))
+                if not self._accept(","):
+                    break
+        if self._accept_keyword("SKIP"):
+            parsed.skip = self._expression()
+        if self._accept_keyword("LIMIT"):
+            parsed.limit = self._expression()
+
+    # expressions, lowest precedence first
+
+    def _expression(self):
+        left = self._and()
+        while self._accept_keyword("OR"):
+            left = ("or", left, self._and())
+        return left
+
+    def _and(self):
+        left = self._not()
+        while self._accept_keyword("AND"):
+            left = ("and", left, self._not())
+        return left
+
+    def _not(self):
+        if self._accept_keyword("NOT"):
+            return ("not", self._not())
+        return self._comparison()
+
+    def _comparison(self):
+        left = self._additive()
+        while True:
+            text, keyword = self._text(), self._keyword()
+            if text in _COMPARISONS:
+                self._next()
+                left = ("compare", "<>" if text == "!=" else text, left, self._additive())
+            elif keyword == "CONTAINS":
+                self._next()
+                left = ("contains", left, self._additive())
+            elif keyword in ("STARTS", "ENDS") and self._keyword(1) == "WITH":
+                self._position += 2
+                left = ("starts" if keyword == "STARTS" else "ends", left, self._additive())
+            elif keyword == "IN":
+                self._next()
+                left = ("in", left, self._additive())
+            elif keyword == "IS":
+                self._next()
+                negated = self._accept_keyword("NOT")
+                if not self._accept_keyword("NULL"):
+                    raise UnsupportedQuery("expected NULL")
+                left = ("is_null", left, negated)
+            elif text == "=~":
+                raise UnsupportedQuery("regular expressions are not supported locally")
+            else:
+                return left
+
+    def _additive(self):
+        left = self._multiplicative()
+        while self._text() in ("+", "-"):
+            # `-` directly followed by `[` or `-` belongs to a pattern
+            if self._text(1) in ("[", "-", ">"):
+                raise UnsupportedQuery("pattern expressions are not supported locally")
+            operator = self._next()[1]
+            left = ("arithmetic", operator, left, self._multiplicative())
+        return left
+
+    def _multiplicative(self):
+        left = self._unary()
+        while self._text() in ("*", "/", "%"):
+            operator = self._next()[1]
+            left = ("arithmetic", operator, left, self._unary())
+        return left
+
+    def _unary(self):
+        if self._accept("-"):
+            return ("negate", self._unary())
+        self._accept("+")
+        return self._postfix()
+
+    def _postfix(self):
+        expression = self._atom()
+        while True:
+            if self._accept("."):
+                expression = ("property", expression, self._name())
+            elif self._accept("["):
+                if self._text() == ".." or self._text() == ".":
+                    raise UnsupportedQuery("list slices are not supported locally")
+                index = self._expression()
+                if self._text() == ".":
+                    raise UnsupportedQuery("list slices are not supported locally")
+                self._expect("]")
+                expression = ("index", expression, index)
+            else:
+                return expression
+
+    def _atom(self):
+        kind, text, _, _ = self._next()
+        if kind in ("string", "number"):
+            return ("literal", parse_literal(kind, text))
+        if kind == "parameter":
+            return ("parameter", text[1:])
+        if text == "(":
+            expression = self._expression()
+            self._expect(")")
+            return expression
+        if text == "[":
+            items = []
+            if not self._accept("]"):
+                while True:
+                    items.append(self._expression())
+                    if self._accept("]"):
+                        break
+                    self._expect(",")
+            return ("list", items)
+        if kind == "identifier":
+            return ("variable", text[1:-1])
+        if kind != "word":
+            raise UnsupportedQuery(f"unexpected {text!r}")
+
+        upper = text.upper()
+        if upper in ("TRUE", "FALSE"):
+            return ("literal", upper == "TRUE")
+        if upper == "NULL":
+            return ("literal", None)
+        if self._text() != "(":
+            return ("variable", text)
+
+        self._next()
+        name = text.lower()
+        if name not in AGGREGATES and name not in _FUNCTIONS:
+            raise UnsupportedQuery(f"function {text}() is not supported locally")
+        distinct = self._accept_keyword("DISTINCT")
+        if self._accept("*"):
+            if name != "count":
+                raise UnsupportedQuery(f"{text}(*)")
+            self._expect(")")
+            return ("aggregate", "count", None, False)
+        arguments = []
+        if not self._accept(")"):
+            while True:
+                arguments.append(self._expression())
+                if self._accept(")"):
+                    break
+                self._expect(",")
+        if name in AGGREGATES:
+            if len(arguments) != 1:
+                raise UnsupportedQuery(f"{text}() takes one argument")
+            return ("aggregate", name, arguments[0], distinct)
+        if distinct:
+            raise UnsupportedQuery(f"DISTINCT in {text}()")
+        return ("call", name, arguments)
+
+@functools.lru_cache(maxsize=512)
+def parse_query(query: str) -> ParsedQuery:
+    # parameterized queries repeat, so their parse is cached by text
+    parsed = _Parser(query).parse()
+    for item in parsed.items:
+        item.expression = _extract_aggregates(item.expression, item.aggregates)
+    return parsed
+
+def _extract_aggregates(expression, aggregates: list):
+    # replaces each aggregate call by ("aggregated", i), i into `aggregates`
+    if not isinstance(expression, tuple):
+        return expression
+    if expression[0] == "aggregate":
+        if _contains_aggregate(expression[2]):
+            raise UnsupportedQuery("nested aggregates")
+        aggregates.append(expression)
+        return ("aggregated", len(aggregates) - 1)
+    if expression[0] == "list":
+        return ("list", [_extract_aggregates(item, aggregates) for item in expression[1]])
+    if expression[0] == "call":
+        return ("call", expression[1], [_extract_aggregates(a, aggregates) for a in expression[2]])
+    return tuple(_extract_aggregates(part, aggregates) for part in expression)
+
+def _contains_aggregate(expression):
+    if not isinstance(expression, (tuple, list)):
+        return False
+    if isinstance(expression, tuple) and expression and expression[0] == "aggregate":
+        return True
+    return any(_contains_aggregate(part) for part in expression)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _equals(left, right):
+    # Cypher equality: null when either side is null, false across types
+    if left is None or right is None:
+        return None
+    if _is_number(left) and _is_number(right):
+        return left == right
+    if type(left) is not type(right) and not (isinstance(left, (list, tuple)) and isinstance(right, (list, tuple))):
+        return False
+    if isinstance(left, (list, tuple)):
+        if len(left) != len(right):
+            return False
+        result = True
+        for a, b in zip(left, right):
+            equal = _equals(a, b)
+            if equal is False:
+                return False
+            if equal is None:
+                result = None
+        return result
+    return left == right
+
+def _compare(operator: str, left, right):
+    if operator == "=":
+        return _equals(left, right)
+    if operator == "<>":
+        equal = _equals(left, right)
+        return None if equal is None else not equal
+    if left is None or right is None:
+        return None
+    if not (
+        (_is_number(left) and _is_number(right))
+        or (isinstance(left, str) and isinstance(right, str))
+        or (isinstance(left, bool) and isinstance(right, bool))
+    ):
+        return None
+    if operator == "<":
+        return left < right
+    if operator == ">":
+        return left > right
+    if operator == "<=":
+        return left <= right
+    return left >= right
+
+def _string_function(function):
+    return lambda value: None if value is None else function(value)
+
+def _to_integer(value):
+    if value is None:
+        return None
+    try:
+        return int(float(value)) if isinstance(value, str) else int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_float(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_string(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def _round(value, precision=0):
+    if value is None:
+        return None
+    # Cypher rounds half up, Python's round() to even
+    factor = 10 ** precision
+    return math.floor(value * factor + 0.5) / factor
+
+_FUNCTIONS = {
+    "tolower": _string_function(str.lower),
+    "lower": _string_function(str.lower),
+    "toupper": _string_function(str.upper),
+    "upper": _string_function(str.upper),
+    "trim": _string_function(str.strip),
+    "ltrim": _string_function(str.lstrip),
+    "rtrim": _string_function(str.rstrip),
+    "tostring": _to_string,
+    "tointeger": _to_integer,
+    "tofloat": _to_float,
+    "abs": lambda value: None if value is None else abs(value),
+    "round": _round,
+    "size": lambda value: None if value is None else len(value),
+    "coalesce": lambda *values: next((v for v in values if v is not None), None),
+    "replace": lambda value, search, replacement: None if value is None else value.replace(search, replacement),
+    "split": lambda value, separator: None if value is None else value.split(separator),
+    "left": lambda value, length: None if value is None else value[:length],
+    "right": lambda value, length: None if value is None else value[len(value) - length:],
+    "substring": lambda value, start, length=None: (
+        None if value is None else value[start:] if length is None else value[start:start + length]
+    ),
+    # these need the snapshot and are evaluated in _evaluate
+    "labels": None,
+    "type": None,
+    "properties": None,
+    "keys": None,
+}
+
+def _freeze(value):
+    # hashable stand-in for grouping and DISTINCT; nodes and relationships
+    # stay themselves, so they compare by snapshot index, not by properties
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return ("list",) + tuple(_freeze(v) for v in value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _order_key(value):
+    # Cypher's ascending order across types, null last
+    if value is None:
+        return (1, 0, 0)
+    if isinstance(value, dict):
+        return (0, 0, str(sorted(value.items())))
+    if isinstance(value, _Node):
+        return (0, 1, value.index)
+    if isinstance(value, _Relationship):
+        return (0, 2, value.index)
+    if isinstance(value, (list, tuple)):
+        return (0, 3, tuple(_order_key(v) for v in value))
+    if isinstance(value, str):
+        return (0, 4, value)
+    if isinstance(value, bool):
+        return (0, 5, value)
+    if isinstance(value, float) and math.isnan(value):
+        return (0, 6, math.inf)
+    return (0, 6, value)
+
+class LocalExecutor:
+    # Evaluates a parsed read query against a GraphSnapshot. Rows have the
+    # shape of the Neo4j driver's record.data(): nodes become property dicts,
+    # relationships (start properties, type, end properties) tuples.
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def execute(self, query: str, parameters: dict | None = None) -> list[dict]:
+        parsed = parse_query(query)
+        parameters = parameters or {}
+        bindings = [{}]
+        for chains, where in parsed.matches:
+            bindings = self._match(chains, where, bindings, parameters)
+        return self._project(parsed, bindings, parameters)
+
+    # pattern matching
+
+    def _match(self, chains, where, bindings: list[dict], parameters: dict):
+        pushed = _pushdown_equalities(where)
+        # within one MATCH every relationship is matched at most once
+        states = [(binding, frozenset()) for binding in bindings]
+        for nodes, relationships in chains:
+            states = [
+                state
+                for binding, used in states
+                for state in self._match_chain(nodes, relationships, binding, used, parameters, pushed)
+            ]
+        matched = [binding for binding, _ in states]
+        if where is None:
+            return matched
+        return [binding for binding in matched if self._evaluate(where, binding, parameters) is True]
+
+    def _node_equalities(self, pattern: NodePattern, binding: dict, parameters: dict, pushed: dict):
+        equalities = [(key, self._evaluate(value, binding, parameters)) for key, value in pattern.properties]
+        for key, value in pushed.get(pattern.variable, []):
+            equalities.append((key, self._evaluate(value, {}, parameters)))
+        return equalities
+
+    def _anchor_candidates(self, pattern: NodePattern, binding: dict, parameters: dict, pushed: dict):
+        bound = binding.get(pattern.variable)
+        if bound is not None:
+            return [bound.index] if isinstance(bound, _Node) and self._node_matches(bound.index, pattern, binding, parameters) else []
+        equalities = self._node_equalities(pattern, binding, parameters, pushed)
+        if any(value is None for _, value in equalities):
+            # {prop: null} never matches
+            return []
+        if pattern.labels and equalities:
+            key, value = equalities[0]
+            candidates = self._snapshot.find(pattern.labels[0], key, value)
+        elif pattern.labels:
+            candidates = self._snapshot.nodes_with_label(pattern.labels[0])
+        else:
+            candidates = range(self._snapshot.node_count)
+        properties = self._snapshot.properties
+        return [
+            node for node in candidates
+            if self._node_matches(node, pattern, binding, parameters)
+            and all(_equals(properties[node].get(key), value) for key, value in equalities)
+        ]
+
+    def _node_matches(self, node: int, pattern: NodePattern, binding: dict, parameters: dict):
+        labels = self._snapshot.labels[node]
+        if any(label not in labels for label in pattern.labels):
+            return False
+        properties = self._snapshot.properties[node]
+        return all(
+            _equals(properties.get(key), self._evaluate(value, binding, parameters)) is True
+            for key, value in pattern.properties
+        )
+
+    def _relationship_matches(self, relationship: int, pattern: RelationshipPattern, binding: dict, parameters: dict):
+        properties = self._snapshot.relationship_properties[relationship]
+        return all(
+            _equals(properties.get(key), self._evaluate(value, binding, parameters)) is True
+            for key, value in pattern.properties
+        )
+
+    def _anchor(self, nodes: list[NodePattern], binding: dict, pushed: dict):
+        # start from a bound node, else one with a property equality, else
+        # the one with the smallest label
+        def cost(pattern: NodePattern):
+            if pattern.variable in binding:
+                return (0, 0)
+            if pattern.properties or pattern.variable in pushed:
+                return (1, 0)
+            if pattern.labels:
+                return (2, len(self._snapshot.nodes_with_label(pattern.labels[0])))
+            return (3, 0)
+        return min(range(len(nodes)), key=lambda i: cost(nodes[i]))
+
+    def _match_chain(self, nodes, relationships, binding: dict, used: frozenset, parameters: dict, pushed: dict):
+        anchor = self._anchor(nodes, binding, pushed)
+        # (relationship position, from node position, to node position)
+        steps = [(i, i, i + 1) for i in range(anchor, len(relationships))]
+        steps += [(i, i + 1, i) for i in range(anchor - 1, -1, -1)]
+
+        def extend(step: int, binding: dict, used: frozenset):
+            if step == len(steps):
+                yield binding, used
+                return
+            position, source, target = steps[step]
+            pattern = relationships[position]
+            target_pattern = nodes[target]
+            bound_relationship = binding.get(pattern.variable)
+            bound_target = binding.get(target_pattern.variable)
+            if pattern.direction == "both":
+                directions = ("out", "in")
+            elif (pattern.direction == "out") == (target > source):
+                directions = ("out",)
+            else:
+                directions = ("in",)
+            for relationship, other in self._snapshot.expand(binding[nodes[source].variable].index, pattern.types, directions):
+                if relationship in used:
+                    continue
+                if bound_relationship is not None and bound_relationship != _Relationship(relationship):
+                    continue
+                if bound_target is not None:
+                    if bound_target != _Node(other):
+                        continue
+                elif not self._node_matches(other, target_pattern, binding, parameters):
+                    continue
+                if not self._relationship_matches(relationship, pattern, binding, parameters):
+                    continue
+                extended = dict(binding)
+                extended[pattern.variable] = _Relationship(relationship)
+                extended[target_pattern.variable] = _Node(other)
+                yield from extend(step + 1, extended, used | {relationship})
+
+        for node in self._anchor_candidates(nodes[anchor], binding, parameters, pushed):
+            start = dict(binding)
+            start[nodes[anchor].variable] = _Node(node)
+            yield from extend(0, start, used)
+
+    # projection
+
+    def _project(self, parsed: ParsedQuery, bindings: list[dict], parameters: dict):
+        items = parsed.items
+        aggregating = any(item.aggregates for item in items)
+        if aggregating:
+            rows = self._aggregate(items, bindings, parameters)
+        else:
+            rows = []
+            for binding in bindings:
+                values = [self._evaluate(item.expression, binding, parameters) for item in items]
+                rows.append((values, binding))
+
+        if parsed.distinct:
+            seen = set()
+            unique = []
+            for values, binding in rows:
+                key = tuple(_freeze(value) for value in values)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append((values, binding))
+            rows = unique
+
+        if parsed.order:
+            columns = {item.column: i for i, item in enumerate(items)}
+            texts = {_normalize(item.text): i for i, item in enumerate(items)}
+            for expression, text, descending in reversed(parsed.order):
+                position = texts.get(_normalize(text))
+                if position is None and expression[0] == "variable":
+                    position = columns.get(expression[1])
+                if position is None and (aggregating or parsed.distinct):
+                    if _contains_aggregate(expression):
+                        raise UnsupportedQuery("ORDER BY on an aggregate that is not returned")
+                    # only returned columns are visible after aggregation or DISTINCT
+                    key = lambda row, expression=expression: _order_key(self._evaluate(
+                        expression, {item.column: value for item, value in zip(items, row[0])}, parameters
+                    ))
+                elif position is None:
+                    key = lambda row, expression=expression: _order_key(self._evaluate(
+                        expression, {**row[1], **{item.column: value for item, value in zip(items, row[0])}}, parameters
+                    ))
+                else:
+                    key = lambda row, position=position: _order_key(row[0][position])
+                rows.sort(key=key, reverse=descending)
+
+        skip = self._count_argument(parsed.skip, parameters)
+        limit = self._count_argument(parsed.limit, parameters)
+        if skip:
+            rows = rows[skip:]
+        if limit is not None:
+            rows = rows[:limit]
+        return [{item.column: self._output(value) for item, value in zip(items, values)} for values, _ in rows]
+
+    def _count_argument(self, expression, parameters: dict):
+        if expression is None:
+            return None
+        value = self._evaluate(expression, {}, parameters)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise UnsupportedQuery("SKIP and LIMIT take a non-negative integer")
+        return value
+
+    def _aggregate(self, items: list[ReturnItem], bindings: list[dict], parameters: dict):
+        keys = [i for i, item in enumerate(items) if not item.aggregates]
+        groups = {}
+        for binding in bindings:
+            key_values = [self._evaluate(items[i].expression, binding, parameters) for i in keys]
+            group_key = tuple(_freeze(value) for value in key_values)
+            if group_key not in groups:
+                groups[group_key] = (key_values, binding, [[[] for _ in item.aggregates] for item in items])
+            inputs = groups[group_key][2]
+            for i, item in enumerate(items):
+                for j, (_, function, argument, _) in enumerate(item.aggregates):
+                    inputs[i][j].append(True if argument is None else self._evaluate(argument, binding, parameters))
+        if not groups and not keys:
+            # aggregating nothing still returns one row, e.g. count(*) = 0
+            groups[()] = ([], {}, [[[] for _ in item.aggregates] for item in items])
+
+        rows = []
+        for key_values, binding, inputs in groups.values():
+            key_iter = iter(key_values)
+            values = []
+            for i, item in enumerate(items):
+                if not item.aggregates:
+                    values.append(next(key_iter))
+                    continue
+                results = [
+                    _apply_aggregate(function, distinct, inputs[i][j])
+                    for j, (_, function, _, distinct) in enumerate(item.aggregates)
+                ]
+                values.append(self._evaluate(item.expression, binding, parameters, results))
+            rows.append((values, binding))
+        return rows
+
+    def _output(self, value):
+        if isinstance(value, _Node):
+            return dict(self._snapshot.properties[value.index])
+        if isinstance(value, _Relationship):
+            snapshot = self._snapshot
+            return (
+                dict(snapshot.properties[snapshot.relationship_start(value.index)]),
+                snapshot.relationship_type(value.index),
+                dict(snapshot.properties[snapshot.relationship_end(value.index)]),
+            )
+        if isinstance(value, list):
+            return [self._output(v) for v in value]
+        return value
+
+    # expressions
+
+    def _evaluate(self, expression, binding: dict, parameters: dict, aggregated: list | None = None):
+        kind = expression[0]
+        if kind == "literal":
+            return expression[1]
+        if kind == "parameter":
+            if expression[1] not in parameters:
+                raise UnsupportedQuery(f"missing parameter ${expression[1]}")
+            return parameters[expression[1]]
+        if kind == "variable":
+            if expression[1] not in binding:
+                raise UnsupportedQuery(f"unknown variable {expression[1]}")
+            return binding[expression[1]]
+        if kind == "aggregated":
+            if aggregated is None:
+                raise UnsupportedQuery("aggregate outside RETURN")
+            return aggregated[expression[1]]
+
+        evaluate = lambda part: self._evaluate(part, binding, parameters, aggregated)
+        if kind == "property":
+            target = evaluate(expression[1])
+            if target is None:
+                return None
+            if isinstance(target, _Node):
+                return self._snapshot.properties[target.index].get(expression[2])
+            if isinstance(target, _Relationship):
+                return self._snapshot.relationship_properties[target.index].get(expression[2])
+            if isinstance(target, dict):
+                return target.get(expression[2])
+            raise UnsupportedQuery("property access on a non-entity")
+        if kind == "and":
+            left, right = evaluate(expression[1]), evaluate(expression[2])
+            if left is False or right is False:
+                return False
+            return None if left is None or right is None else True
+        if kind == "or":
+            left, right = evaluate(expression[1]), evaluate(expression[2])
+            if left is True or right is True:
+                return True
+            return None if left is None or right is None else False
+        if kind == "not":
+            value = evaluate(expression[1])
+            return None if value is None else not value
+        if kind == "compare":
+            return _compare(expression[1], evaluate(expression[2]), evaluate(expression[3]))
+        if kind in ("contains", "starts", "ends"):
+            value, search = evaluate(expression[1]), evaluate(expression[2])
+            if not isinstance(value, str) or not isinstance(search, str):
+                return None
+            if kind == "contains":
+                return search in value
+            return value.startswith(search) if kind == "starts" else value.endswith(search)
+        if kind == "in":
+            value, candidates = evaluate(expression[1]), evaluate(expression[2])
+            if candidates is None:
+                return None
+            if not isinstance(candidates, (list, tuple)):
+                raise UnsupportedQuery("IN takes a list")
+            result = False
+            for candidate in candidates:
+                equal = _equals(value, candidate)
+                if equal:
+                    return True
+                if equal is None:
+                    result = None
+            return result
+        if kind == "is_null":
+            value = evaluate(expression[1])
+            return (value is not None) if expression[2] else (value is None)
+        if kind == "list":
+            return [evaluate(item) for item in expression[1]]
+        if kind == "index":
+            target, index = evaluate(expression[1]), evaluate(expression[2])
+            if target is None or index is None:
+                return None
+            if isinstance(target, (list, tuple)) and isinstance(index, int):
+                return target[index] if -len(target) <= index < len(target) else None
+            if isinstance(target, dict) and isinstance(index, str):
+                return target.get(index)
+            raise UnsupportedQuery("unsupported subscript")
+        if kind == "negate":
+            value = evaluate(expression[1])
+            if value is None:
+                return None
+            if not _is_number(value):
+                raise UnsupportedQuery("- on a non-number")
+            return -value
+        if kind == "arithmetic":
+            return _arithmetic(expression[1], evaluate(expression[2]), evaluate(expression[3]))
+        if kind == "call":
+            return self._call(expression[1], [evaluate(argument) for argument in expression[2]])
+        raise UnsupportedQuery(f"unsupported expression {kind}")
+
+    def _call(self, name: str, arguments: list):
+        snapshot = self._snapshot
+        try:
+            if name == "labels":
+                node = arguments[0]
+                return None if node is None else list(snapshot.labels[node.index])
+            if name == "type":
+                return None if arguments[0] is None else snapshot.relationship_type(arguments[0].index)
+            if name in ("properties", "keys"):
+                entity = arguments[0]
+                if entity is None:
+                    return None
+                if isinstance(entity, _Node):
+                    properties = snapshot.properties[entity.index]
+                elif isinstance(entity, _Relationship):
+                    properties = snapshot.relationship_properties[entity.index]
+                else:
+                    properties = entity
+                return dict(properties) if name == "properties" else list(properties)
+            return _FUNCTIONS[name](*arguments)
+        except (AttributeError, TypeError, IndexError) as error:
+            # wrong argument types; let Neo4j report the error
+            raise UnsupportedQuery(f"{name}(): {error}") from error
+
+def _arithmetic(operator: str, left, right):
+    if left is None or right is None:
+        return None
+    if operator == "+" and (isinstance(left, str) or isinstance(right, str)):
+        if not all(isinstance(value, str) or _is_number(value) for value in (left, right)):
+            # e.g. list concatenation; Neo4j has the exact semantics
+            raise UnsupportedQuery("+ on a string and a non-string")
+        return _to_string(left) + _to_string(right)
+    if not (_is_number(left) and _is_number(right)):
+        raise UnsupportedQuery(f"{operator} on non-numbers")
+    if operator == "+":
+        return left + right
+    if operator == "-":
+        return left - right
+    if operator == "*":
+        return left * right
+    if right == 0:
+        raise UnsupportedQuery("division by zero")
+    if isinstance(left, int) and isinstance(right, int):
+        # integer division truncates toward zero in Cypher
+        quotient = abs(left) // abs(right) * (1 if (left < 0) == (right < 0) else -1)
+        return quotient if operator == "/" else left - quotient * right
+    return left / right if operator == "/" else math.fmod(left, right)
+
+def _apply_aggregate(function: str, distinct: bool, values: list):
+    values = [v for v in values if v is not None]
+    if distinct:
+        seen = set()
+        unique = []
+        for value in values:
+            key = _freeze(value)
+            if key not in seen:
+                seen.add(key)
+                unique.append(value)
+        values = unique
+    if function == "count":
+        return len(values)
+    if function == "collect":
+        return values
+    if not values:
+        return 0 if function == "sum" else None
+    if function in ("sum", "avg") and not all(_is_number(value) for value in values):
+        # durations, or a type error Neo4j should report
+        raise UnsupportedQuery(f"{function}() over non-numbers")
+    if function == "sum":
+        return sum(values)
+    if function == "avg":
+        return sum(values) / len(values)
+    try:
+        return min(values) if function == "min" else max(values)
+    except TypeError as error:
+        raise UnsupportedQuery(f"{function}() over mixed types") from error
+
+def _normalize(text: str) -> str:
+    return "".join(text.split())
+
+def _pushdown_equalities(where):
+    # {variable: [(property, expression)]} for top-level `v.prop = value`
+    # conjuncts whose value does not depend on the match, used to pick
+    # candidate nodes from the property index
+    pushed = {}
+    if where is None:
+        return pushed
+    conjuncts = [where]
+    while conjuncts:
+        expression = conjuncts.pop()
+        if expression[0] == "and":
+            conjuncts += [expression[1], expression[2]]
+            continue
+        if expression[0] != "compare" or expression[1] != "=":
+            continue
+        for left, right in ((expression[2], expression[3]), (expression[3], expression[2])):
+            if (
+                left[0] == "property" and left[1][0] == "variable"
+                and right[0] in ("literal", "parameter")
+            ):
+                pushed.setdefault(left[1][1], []).append((left[2], right))
+                break
+    return pushed
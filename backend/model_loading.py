@@ -0,0 +1,42 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# component -> seconds, in the order the components finished
+_startup_times: dict[str, float] = {}
+_startup_lock = threading.Lock()
+
+@contextmanager
+def startup_timer(component: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _startup_lock:
+            _startup_times[component] = time.perf_counter() - start
+
+def get_startup_times():
+    with _startup_lock:
+        return dict(_startup_times)
+
+def load_tokenizer(model_name: str, component: str):
+    with startup_timer(f"{component}.import"):
+        from transformers import AutoTokenizer
+    with startup_timer(f"{component}.tokenizer"):
+        return AutoTokenizer.from_pretrained(model_name)
+
+def load_causal_lm(model_name: str, component: str, use_safetensors: bool | None = True, **kwargs):
+    # low_cpu_mem_usage loads weights straight into the model instead of into
+    # a randomly initialized copy first; safetensors checkpoints are memory
+    # mapped, so pages are only read as tensors are materialized
+    with startup_timer(f"{component}.import"):
+        from transformers import AutoModelForCausalLM
+    with startup_timer(f"{component}.weights"):
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            low_cpu_mem_usage=True,
+            use_safetensors=use_safetensors,
+            **kwargs,
+        )
+    model.eval()
+    return model
@@ -0,0 +1,408 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from backend import telemetry
+from backend.config import Config
+from backend.cypher_templates import TemplateMatcher
+from backend.cypher_validator import CypherValidator, ValidationResult
+from backend.database import AsyncGraphDatabaseDriver
+from backend.hedging import HedgedExecutor, HedgeOutcome
+from backend.question_cache import QuestionCache
+from backend.result_formatter import ResultFormatter
+from backend.vector_index import VectorIndex
+
+class PipelineOverloadedError(RuntimeError):
+    pass
+
+class AsyncPipeline:
+    # Runs text-to-Cypher, Neo4j execution and answer generation as asyncio
+    # stages. Each stage has its own concurrency limit; requests beyond
+    # `max_in_flight` wait for admission and requests beyond `max_pending`
+    # waiting requests are rejected instead of queueing without bound.
+    def __init__(
+        self,
+        text_to_cypher,
+        generator,
+        config: Config,
+        question_cache: QuestionCache | None = None,
+        cypher_concurrency: int = 8,
+        db_concurrency: int = 16,
+        answer_workers: int = 1,
+        max_in_flight: int = 32,
+        max_pending: int = 128,
+        result_formatter: ResultFormatter | None = None,
+        validator: CypherValidator | None = None,
+        template_matcher: TemplateMatcher | None = None,
+        hedger: HedgedExecutor | None = None,
+        vector_index: VectorIndex | None = None,
+    ):
+        # with `hedger`, each question gets several Cypher candidates and the
+        # first one that returns rows answers it; with `vector_index`,
+        # descriptive questions are answered by retrieval after the templates
+        self._text_to_cypher = text_to_cypher
+        self._generator = generator
+        self._config = config
+        self._question_cache = question_cache
+        self._result_formatter = result_formatter or ResultFormatter()
+        self._validator = validator
+        self._template_matcher = template_matcher
+        self._hedger = hedger
+        self._vector_index = vector_index
+        self._cypher_semaphore = asyncio.Semaphore(cypher_concurrency)
+        self._db_semaphore = asyncio.Semaphore(db_concurrency)
+        self._answer_semaphore = asyncio.Semaphore(answer_workers)
+        self._admission = asyncio.Semaphore(max_in_flight)
+        self._max_pending = max_pending
+        self._pending = 0
+        # local models run here so they never block the event loop; the sync
+        # text-to-Cypher backends (v3, cached v2) get their own threads
+        self._answer_executor = ThreadPoolExecutor(max_workers=answer_workers, thread_name_prefix="answer")
+        self._cypher_executor = ThreadPoolExecutor(max_workers=cypher_concurrency, thread_name_prefix="cypher")
+        self._driver = None
+        self._stats = {"requests": 0, "rejected": 0, "in_flight": 0, "stage_time": {}}
+
+    @classmethod
+    def from_config(
+        cls,
+        text_to_cypher,
+        generator,
+        config: Config,
+        question_cache: QuestionCache | None = None,
+        result_formatter: ResultFormatter | None = None,
+        validator: CypherValidator | None = None,
+        template_matcher: TemplateMatcher | None = None,
+        hedger: HedgedExecutor | None = None,
+        vector_index: VectorIndex | None = None,
+    ):
+        settings = config.get_pipeline_settings()
+        return cls(
+            text_to_cypher,
+            generator,
+            config,
+            question_cache=question_cache,
+            cypher_concurrency=settings["cypher_concurrency"],
+            db_concurrency=settings["db_concurrency"],
+            answer_workers=settings["answer_workers"],
+            max_in_flight=settings["max_in_flight"],
+            max_pending=settings["max_pending"],
+            result_formatter=result_formatter or ResultFormatter.from_config(config),
+            validator=validator,
+            template_matcher=template_matcher,
+            hedger=hedger,
+            vector_index=vector_index,
+        )
+
+    @property
+    def hedger(self):
+        return self._hedger
+
+    async def start(self):
+        self._driver = AsyncGraphDatabaseDriver(self._config)
+        await self._driver.__aenter__()
+        return self
+
+    async def close(self):
+        if self._driver is not None:
+            await self._driver.__aexit__(None, None, None)
+            self._driver = None
+        self._answer_executor.shutdown(wait=False)
+        self._cypher_executor.shutdown(wait=False)
+
+    async def _run_in_executor(self, executor: ThreadPoolExecutor, function, *args):
+        # carries the current span over to the worker thread
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(executor, functools.partial(context.run, function, *args))
+
+    def _record_stage(self, stage: str, seconds: float):
+        total, count = self._stats["stage_time"].get(stage, (0.0, 0))
+        self._stats["stage_time"][stage] = (total + seconds, count + 1)
+
+    async def generate_cypher(self, question: str) -> list[str]:
+        if self._template_matcher is not None:
+            # may re-read the entity catalog from the graph, so off the loop
+            found = await self._run_in_executor(self._cypher_executor, self._template_matcher.match, question)
+            if found is not None:
+                return [found.cypher]
+
+        if self._vector_index is not None:
+            # may refresh the index from the graph, so off the loop
+            retrieved = await self._run_in_executor(self._cypher_executor, self._vector_index.match, question)
+            if retrieved is not None:
+                return [retrieved.cypher]
+
+        if self._question_cache is not None:
+            cached = self._question_cache.lookup(question)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        async with self._cypher_semaphore:
+            with telemetry.span("cypher"):
+                if inspect.iscoroutinefunction(self._text_to_cypher.__call__):
+                    cypher_queries = await self._text_to_cypher(question)
+                else:
+                    cypher_queries = await self._run_in_executor(self._cypher_executor, self._text_to_cypher, question)
+        elapsed = time.perf_counter() - start
+        self._record_stage("cypher", elapsed)
+        if self._template_matcher is not None:
+            self._template_matcher.record_llm_time(elapsed)
+
+        if isinstance(cypher_queries, str):
+            cypher_queries = [cypher_queries]
+        if self._question_cache is not None and cypher_queries and all(q.strip() for q in cypher_queries):
+            self._question_cache.store(question, cypher_queries, elapsed)
+        return cypher_queries
+
+    async def _lookup_candidates(self, question: str) -> list[str] | None:
+        # the single query of a template, retrieval or question cache hit
+        if self._template_matcher is not None:
+            found = await self._run_in_executor(self._cypher_executor, self._template_matcher.match, question)
+            if found is not None:
+                return [found.cypher]
+
+        if self._vector_index is not None:
+            retrieved = await self._run_in_executor(self._cypher_executor, self._vector_index.match, question)
+            if retrieved is not None:
+                return [retrieved.cypher]
+
+        if self._question_cache is not None:
+            return self._question_cache.lookup(question)
+        return None
+
+    async def generate_cypher_candidates(self, question: str) -> tuple[list[str], float | None]:
+        # (candidates, generation time); the time is None for template,
+        # retrieval and question cache hits, whose single query is the only
+        # candidate
+        found = await self._lookup_candidates(question)
+        if found is not None:
+            return found, None
+
+        count, temperature = self._hedger.candidates, self._hedger.temperature
+        start = time.perf_counter()
+        async with self._cypher_semaphore:
+            with telemetry.span("cypher", candidates=count):
+                if inspect.iscoroutinefunction(self._text_to_cypher.generate_candidates):
+                    candidates = await self._text_to_cypher.generate_candidates(question, count, temperature)
+                else:
+                    candidates = await self._run_in_executor(
+                        self._cypher_executor, self._text_to_cypher.generate_candidates, question, count, temperature
+                    )
+        elapsed = time.perf_counter() - start
+        self._record_stage("cypher", elapsed)
+        if self._template_matcher is not None:
+            self._template_matcher.record_llm_time(elapsed)
+        return candidates, elapsed
+
+    async def _execute_candidate(self, query: str):
+        if self._validator is not None:
+            query = (await self._validate(query)).query
+        return query, await self._execute(query)
+
+    async def execute_candidates(self, question: str, candidates: list[str], generation_time: float | None = None) -> HedgeOutcome:
+        # validates and runs the candidates concurrently; the first with rows
+        # wins and the others are cancelled. A generated winner is stored in
+        # the question cache.
+        start = time.perf_counter()
+        outcome = await self._hedger.race_async(candidates, self._execute_candidate)
+        self._record_stage("db", time.perf_counter() - start)
+        if self._question_cache is not None and outcome.found and generation_time is not None:
+            self._question_cache.store(question, [outcome.query], generation_time)
+        return outcome
+
+    @property
+    def streams_candidates(self):
+        return inspect.isasyncgenfunction(getattr(self._text_to_cypher, "stream_candidates", None))
+
+    async def _stream_generated(self, question: str, arrivals: dict):
+        # stream_candidates() under the Cypher concurrency limit; `arrivals`
+        # gets the seconds each candidate took to come in
+        count, temperature = self._hedger.candidates, self._hedger.temperature
+        start = time.perf_counter()
+        try:
+            async with self._cypher_semaphore:
+                async for candidate in self._text_to_cypher.stream_candidates(question, count, temperature):
+                    arrivals.setdefault(candidate, time.perf_counter() - start)
+                    yield candidate
+        finally:
+            elapsed = time.perf_counter() - start
+            self._record_stage("cypher", elapsed)
+            if self._template_matcher is not None:
+                self._template_matcher.record_llm_time(elapsed)
+
+    async def race_generated(self, question: str) -> HedgeOutcome:
+        # generate_cypher_candidates() + execute_candidates(), except that
+        # generated candidates start running as each request finishes, so
+        # the slowest sampled request no longer delays the race
+        found = await self._lookup_candidates(question)
+        if found is not None:
+            return await self.execute_candidates(question, found)
+        arrivals = {}
+        with telemetry.span("hedge", candidates=self._hedger.candidates):
+            outcome = await self._hedger.race_async(self._stream_generated(question, arrivals), self._execute_candidate)
+        if self._question_cache is not None and outcome.found:
+            generation_time = arrivals.get(outcome.candidates[outcome.index])
+            self._question_cache.store(question, [outcome.query], generation_time)
+        return outcome
+
+    async def _validate(self, query: str):
+        async with self._db_semaphore:
+            return await self._validator.validate_async(query, self._driver)
+
+    async def validate_queries(self, cypher_queries: list[str]):
+        # ValidationResult per query (possibly rewritten); a rejected query
+        # is returned as its CypherValidationError
+        if self._validator is None:
+            return [ValidationResult(q, q, []) for q in cypher_queries]
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self._validate(q) for q in cypher_queries),
+            return_exceptions=True
+        )
+        self._record_stage("validate", time.perf_counter() - start)
+        return results
+
+    async def _execute(self, query: str):
+        async with self._db_semaphore:
+            return await self._driver.execute_query(query)
+
+    async def execute_queries(self, cypher_queries: list[str]):
+        # independent queries run concurrently; a failing query is returned
+        # as its exception so the others still count
+        start = time.perf_counter()
+        with telemetry.span("db", queries=len(cypher_queries)):
+            results = await asyncio.gather(
+                *(self._execute(q) for q in cypher_queries),
+                return_exceptions=True
+            )
+        self._record_stage("db", time.perf_counter() - start)
+        return results
+
+    async def generate_answer(self, question: str, query: str, context_str: str) -> str:
+        start = time.perf_counter()
+        async with self._answer_semaphore:
+            with telemetry.span("answer"):
+                answer = await self._run_in_executor(
+                    self._answer_executor, self._generator, question, query, context_str
+                )
+        self._record_stage("answer", time.perf_counter() - start)
+        return answer
+
+    async def answer(self, question: str):
+        if self._pending >= self._max_pending:
+            self._stats["rejected"] += 1
+            telemetry.increment("rag_requests_total", stage="pipeline", status="rejected")
+            raise PipelineOverloadedError(f"{self._pending} requests are already waiting")
+
+        self._pending += 1
+        try:
+            await self._admission.acquire()
+        finally:
+            self._pending -= 1
+
+        self._stats["requests"] += 1
+        self._stats["in_flight"] += 1
+        try:
+            stage_seconds = {}
+            stage_start = time.perf_counter()
+
+            def stage_done(stage: str):
+                # wall time of this request's stage, semaphore waits included
+                nonlocal stage_start
+                now = time.perf_counter()
+                stage_seconds[stage] = now - stage_start
+                stage_start = now
+
+            with telemetry.span("request", question=question) as request_span:
+                if self._hedger is not None:
+                    if self.streams_candidates:
+                        # generation and execution overlap
+                        outcome = await self.race_generated(question)
+                        stage_done("hedge")
+                    else:
+                        candidates, generation_time = await self.generate_cypher_candidates(question)
+                        stage_done("cypher")
+                        outcome = await self.execute_candidates(question, candidates, generation_time)
+                        stage_done("db")
+                    errors = [error for _, error in outcome.rejected + outcome.errors]
+                    cypher_queries = [outcome.query] if outcome.query is not None else []
+                    results = [outcome.rows] if outcome.query is not None else []
+                else:
+                    generated = await self.generate_cypher(question)
+                    stage_done("cypher")
+                    validations = await self.validate_queries(generated)
+                    stage_done("validate")
+                    errors = [v for v in validations if isinstance(v, Exception)]
+                    cypher_queries = [v.query for v in validations if not isinstance(v, Exception)]
+                    results = await self.execute_queries(cypher_queries)
+                    stage_done("db")
+
+                rows = []
+                successful = []
+                for result in results:
+                    if isinstance(result, Exception):
+                        errors.append(result)
+                    else:
+                        rows.extend(result or [])
+                        successful.append(result or [])
+
+                if rows:
+                    context_str, _ = self._result_formatter.format_all(successful)
+                elif errors:
+                    context_str = f"(error occurred: {errors[0]})"
+                else:
+                    context_str = "(no result)"
+
+                answer = await self.generate_answer(question, "\n\n".join(cypher_queries), context_str)
+                stage_done("answer")
+            telemetry.increment("rag_requests_total", stage="pipeline", status="ok")
+            return {
+                "question": question,
+                "cypher_queries": cypher_queries,
+                "results": rows,
+                "errors": [str(e) for e in errors],
+                "answer": answer,
+                # (depth, span, milliseconds); empty when telemetry is disabled
+                "timings": request_span.breakdown(),
+                "stage_seconds": stage_seconds,
+            }
+        finally:
+            self._stats["in_flight"] -= 1
+            self._admission.release()
+
+    def get_stats(self):
+        stats = {key: value for key, value in self._stats.items() if key != "stage_time"}
+        stats["pending"] = self._pending
+        for stage, (total, count) in self._stats["stage_time"].items():
+            stats[f"avg_{stage}_time"] = total / count
+        return stats
+
+class PipelineRunner:
+    # Owns an event loop on a background thread so synchronous callers (one
+    # Streamlit script thread per user) can share one AsyncPipeline.
+    def __init__(self, pipeline: AsyncPipeline):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self.pipeline = pipeline
+        self.run(pipeline.start())
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(self._with_span(coroutine, telemetry.current_span()), self._loop)
+
+    async def _with_span(self, coroutine, span):
+        # spans opened by the pipeline nest under the caller's current span
+        with telemetry.use_span(span):
+            return await coroutine
+
+    def run(self, coroutine, timeout: float | None = None):
+        return self.submit(coroutine).result(timeout)
+
+    def close(self):
+        self.run(self.pipeline.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
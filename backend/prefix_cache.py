@@ -0,0 +1,99 @@
+import copy
+import hashlib
+import threading
+from backend import telemetry
+
+PROMPT_SENTINEL = "\u0000PROMPT_SUFFIX\u0000"
+
+def split_static_prefix(prompt_with_sentinel: str) -> str:
+    # Everything before the first per-request field, cut back to a line
+    # boundary so the prefix tokenizes the same way on its own.
+    prefix = prompt_with_sentinel.split(PROMPT_SENTINEL, 1)[0]
+    newline = prefix.rfind("\n")
+    return prefix[:newline + 1] if newline >= 0 else ""
+
+class PrefixCache:
+    # Holds the past_key_values of a static prompt prefix (system prompt,
+    # instructions, schema) so each request only prefills its own suffix.
+    def __init__(self, model, tokenizer):
+        self._model = model
+        self._tokenizer = tokenizer
+        self._lock = threading.Lock()
+        self._prefix_text = None
+        self._prefix_key = None
+        self._prefix_ids = None
+        self._cache = None
+        self._stats = {"builds": 0, "hits": 0, "misses": 0, "prefix_tokens": 0, "prefill_tokens_saved": 0}
+
+    def _build(self, prefix_text: str, prefix_key: str):
+        import torch
+        from transformers import DynamicCache
+
+        prefix_ids = self._tokenizer(prefix_text, return_tensors="pt").input_ids.to(self._model.device)
+        cache = DynamicCache(config=self._model.config)
+        with torch.no_grad():
+            self._model(input_ids=prefix_ids, past_key_values=cache, use_cache=True)
+        self._prefix_text = prefix_text
+        self._prefix_key = prefix_key
+        self._prefix_ids = prefix_ids[0].tolist()
+        self._cache = cache
+        self._stats["builds"] += 1
+        self._stats["prefix_tokens"] = len(self._prefix_ids)
+
+    def warm(self, prefix_text: str):
+        # (re)computes the prefix state when the schema or template changed
+        prefix_key = hashlib.sha256(prefix_text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if prefix_key != self._prefix_key:
+                self._build(prefix_text, prefix_key)
+
+    def prepare_inputs(self, prefix_text: str, texts: list[str]):
+        # Returns generate() kwargs with a batch-expanded copy of the prefix
+        # cache, or None when a prompt does not start with the prefix. Rows
+        # are padded between prefix and suffix; generate() derives position
+        # ids from the attention mask, so the padding is skipped.
+        if not prefix_text or not all(text.startswith(prefix_text) for text in texts):
+            with self._lock:
+                self._stats["misses"] += 1
+            telemetry.increment("rag_cache_lookups_total", cache="prefix", result="miss")
+            return None
+
+        self.warm(prefix_text)
+        with self._lock:
+            prefix_ids = self._prefix_ids
+            cache = copy.deepcopy(self._cache)
+            self._stats["hits"] += 1
+            self._stats["prefill_tokens_saved"] += len(prefix_ids) * len(texts)
+        telemetry.increment("rag_cache_lookups_total", cache="prefix", result="hit")
+
+        suffixes = [
+            self._tokenizer(text[len(prefix_text):], add_special_tokens=False).input_ids
+            for text in texts
+        ]
+        width = max(len(suffix) for suffix in suffixes)
+        pad_token_id = self._tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = self._tokenizer.eos_token_id
+
+        input_ids = []
+        attention_mask = []
+        for suffix in suffixes:
+            padding = width - len(suffix)
+            input_ids.append(prefix_ids + [pad_token_id] * padding + suffix)
+            attention_mask.append([1] * len(prefix_ids) + [0] * padding + [1] * len(suffix))
+
+        if len(texts) > 1:
+            cache.batch_repeat_interleave(len(texts))
+
+        import torch
+
+        device = self._model.device
+        return {
+            "input_ids": torch.tensor(input_ids, device=device),
+            "attention_mask": torch.tensor(attention_mask, device=device),
+            "past_key_values": cache,
+        }
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
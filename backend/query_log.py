@@ -0,0 +1,175 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from backend.config import Config
+from backend.cypher_utils import is_write_query
+
+# queries that are not profiled: plans, admin commands and procedures
+_UNPROFILED_PREFIXES = ("EXPLAIN", "PROFILE", "SHOW", "CALL", "CYPHER", "USE")
+
+# `p:Player` in operator details; relationship types are inside [ ]
+_VARIABLE_LABEL = re.compile(r"`?(\w+)`?:`?(\w+)`?")
+_BRACKETS = re.compile(r"\[[^\]]*\]")
+# `p.name = $p0`, `h.id IN $p1`, `toLower(r.description) CONTAINS $p2`, ...
+_PREDICATE = re.compile(
+    r"(?:(\w+)\(\s*)?`?(\w+)`?\.`?(\w+)`?\s*\)?\s*(=|<=|>=|<>|<|>|IN\b|STARTS WITH|ENDS WITH|CONTAINS)",
+    re.IGNORECASE,
+)
+_PREDICATE_KINDS = {
+    "=": "equality",
+    "IN": "equality",
+    "<": "range",
+    ">": "range",
+    "<=": "range",
+    ">=": "range",
+    "STARTS WITH": "prefix",
+    "CONTAINS": "text",
+    "ENDS WITH": "text",
+}
+
+def _operators(plan: dict):
+    yield plan
+    for child in plan.get("children", []):
+        yield from _operators(child)
+
+def _operator_type(operator: dict) -> str:
+    # "Filter@neo4j" -> "Filter"
+    return operator.get("operatorType", "").split("@")[0]
+
+def _details(operator: dict) -> str:
+    return str(operator.get("args", {}).get("Details", ""))
+
+def plan_predicates(plan: dict) -> list[dict]:
+    # The property predicates a profiled plan still evaluates row by row, i.e.
+    # the ones no index answered: {"label", "property", "kind", "function"}
+    # per Filter predicate on a labelled variable. `kind` is equality, range,
+    # prefix or text; `function` is set when the property is wrapped in one
+    # (e.g. toLower), which no index can serve.
+    if not plan:
+        return []
+    labels = {}
+    for operator in _operators(plan):
+        for variable, label in _VARIABLE_LABEL.findall(_BRACKETS.sub("", _details(operator))):
+            labels.setdefault(variable, label)
+
+    predicates = []
+    seen = set()
+    for operator in _operators(plan):
+        if _operator_type(operator) != "Filter":
+            continue
+        for function, variable, prop, operator_text in _PREDICATE.findall(_details(operator)):
+            if variable not in labels or operator_text == "<>":
+                continue
+            key = (labels[variable], prop, _PREDICATE_KINDS[operator_text.upper()], function or None)
+            if key not in seen:
+                seen.add(key)
+                predicates.append(dict(zip(("label", "property", "kind", "function"), key)))
+    return predicates
+
+def plan_label_scans(plan: dict) -> dict[str, int]:
+    # db hits of the NodeByLabelScan / AllNodesScan operators, by label
+    scans = {}
+    for operator in _operators(plan or {}):
+        operator_type = _operator_type(operator)
+        if operator_type in ("NodeByLabelScan", "AllNodesScan"):
+            found = _VARIABLE_LABEL.findall(_details(operator))
+            label = found[0][1] if found else "*"
+            scans[label] = scans.get(label, 0) + operator.get("dbHits", 0)
+    return scans
+
+class QueryLog:
+    # The read queries that reached Neo4j, run with PROFILE, with their db
+    # hits, timings and the predicates their plans filtered without an index.
+    # Keeps the last `max_entries` in memory and, with a `path`, appends each
+    # entry as a JSON line (reloaded on start), so the index advisor can
+    # aggregate what the app ran. `sample_rate` is the share of queries
+    # profiled; PROFILE makes a query a little slower.
+    def __init__(self, max_entries: int = 10000, sample_rate: float = 1.0, path: str | None = None):
+        self._entries = deque(maxlen=max_entries)
+        self._sample_rate = sample_rate
+        self._path = path
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._stats = {"profiled": 0, "skipped": 0, "write_errors": 0}
+        if path and os.path.exists(path):
+            self._entries.extend(self.load(path))
+
+    @classmethod
+    def from_config(cls, config: Config):
+        settings = config.get_query_log_settings()
+        if not settings["enabled"]:
+            return None
+        return cls(
+            max_entries=settings["max_entries"],
+            sample_rate=settings["sample_rate"],
+            path=settings["path"] or None,
+        )
+
+    @staticmethod
+    def load(path: str) -> list[dict]:
+        # entries of a log file; a line cut off by a crash is skipped
+        entries = []
+        with open(path, encoding="utf-8", errors="replace") as fp:
+            for line in fp:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return entries
+
+    def should_profile(self, query: str) -> bool:
+        words = query.lstrip().split(None, 1)
+        if not words or words[0].upper() in _UNPROFILED_PREFIXES or is_write_query(query):
+            return False
+        with self._lock:
+            if self._random.random() < self._sample_rate:
+                return True
+            self._stats["skipped"] += 1
+        return False
+
+    def record(self, query: str, parameters: dict | None, stats: dict, plan: dict | None):
+        # `stats` as QueryResult.get_stats() returns them, `plan` the profile
+        entry = {
+            "time": time.time(),
+            "query": query,
+            "parameters": parameters or {},
+            "db_hits": stats["db_hits"],
+            "rows": stats["rows"],
+            "elapsed_ms": stats["elapsed"] * 1000 if stats["elapsed"] is not None else None,
+            "available_after_ms": stats["result_available_after"],
+            "consumed_after_ms": stats["result_consumed_after"],
+            "predicates": plan_predicates(plan),
+            "label_scans": plan_label_scans(plan),
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self._entries.append(entry)
+            self._stats["profiled"] += 1
+            if self._path:
+                try:
+                    os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+                    with open(self._path, "a", encoding="utf-8") as fp:
+                        fp.write(line + "\n")
+                except OSError:
+                    self._stats["write_errors"] += 1
+        return entry
+
+    def entries(self) -> list[dict]:
+        with self._lock:
+            return list(self._entries)
+
+    def get_stats(self):
+        entries = self.entries()
+        hits = [entry["db_hits"] for entry in entries if entry.get("db_hits") is not None]
+        with self._lock:
+            stats = dict(self._stats)
+        stats["entries"] = len(entries)
+        stats["distinct_queries"] = len({entry["query"] for entry in entries})
+        stats["total_db_hits"] = sum(hits)
+        stats["mean_db_hits"] = sum(hits) / len(hits) if hits else 0.0
+        stats["label_scan_queries"] = sum(1 for entry in entries if entry.get("label_scans"))
+        return stats
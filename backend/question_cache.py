@@ -0,0 +1,401 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from backend import telemetry
+from backend.config import Config
+from backend.embeddings import HashingEmbedder, cosine_top_k
+
+_PUNCTUATION_PATTERN = re.compile(r"[^\w\s:'\"]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_QUOTED_PATTERN = re.compile(r"['\"]([^'\"]+)['\"]")
+_NUMBER_PATTERN = re.compile(r"\d+(?::\d+)?")
+_CAPITALIZED_PATTERN = re.compile(r"\b[A-Z][a-zA-Z]+\b")
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_CONTRACTION_PATTERN = re.compile(r"n't\b|\bcannot\b")
+_CAMEL_CASE_PATTERN = re.compile(r"(?<=[a-z])(?=[A-Z])")
+_SCHEMA_LABEL_PATTERN = re.compile(r"^- \*\*(\w+)\*\*", re.MULTILINE)
+_SCHEMA_PROPERTY_PATTERN = re.compile(r"^- `(\w+)`", re.MULTILINE)
+_SCHEMA_VALUE_PATTERN = re.compile(r'"([^"]+)"')
+
+# words that negate, compare or rank: "most" and "fewest", or "own" and
+# "do not own", must not share a query however similar the rest is
+MEANING_WORDS = {
+    "not", "no", "never", "without", "none", "nobody", "nothing", "neither", "nor", "except", "only",
+    "most", "least", "fewest", "fewer", "more", "less", "highest", "lowest", "largest", "smallest",
+    "biggest", "longest", "shortest", "greatest", "best", "worst", "top", "bottom", "max", "maximum",
+    "min", "minimum", "over", "under", "above", "below", "exactly", "than", "first", "last",
+    "average", "total", "all", "every", "any",
+}
+
+def normalize_question(question: str) -> str:
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = _PUNCTUATION_PATTERN.sub(" ", question)
+    question = _WHITESPACE_PATTERN.sub(" ", question)
+    return question.strip()
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def _words(text: str) -> list[str]:
+    text = _CONTRACTION_PATTERN.sub(" not", text.lower())
+    return [_stem(word) for word in _WORD_PATTERN.findall(text)]
+
+def schema_terms(schema: str) -> set[tuple[str, ...]]:
+    # labels, properties and listed values of schema.txt as stemmed word
+    # sequences: ("dev", "card", "type"), ("vp",), ("year", "of", "plenty")
+    names = _SCHEMA_LABEL_PATTERN.findall(schema) + _SCHEMA_PROPERTY_PATTERN.findall(schema)
+    terms = {tuple(_words(_CAMEL_CASE_PATTERN.sub(" ", name).replace("_", " "))) for name in names}
+    terms.update(tuple(_words(value)) for value in _SCHEMA_VALUE_PATTERN.findall(schema))
+    terms.discard(())
+    return terms
+
+def entity_signature(question: str, terms: set[tuple[str, ...]] = frozenset(), catalog=None) -> list[str]:
+    # What changes the meaning of a query: names, numbers, ratios, negation
+    # and comparison words, the schema `terms` mentioned and, with a
+    # `catalog` (cypher_templates.EntityCatalog), the graph's entities in any
+    # case or spelling. Two questions are only allowed to share a cached
+    # query if these match.
+    entities = set(_NUMBER_PATTERN.findall(question))
+    entities.update(x.lower() for x in _QUOTED_PATTERN.findall(question))
+    first_word_start = len(question) - len(question.lstrip())
+    for match in _CAPITALIZED_PATTERN.finditer(question):
+        if match.start() == first_word_start:
+            continue
+        entities.add(match.group(0).lower())
+    words = _words(question)
+    entities.update(word for word in words if word in MEANING_WORDS)
+    for term in terms:
+        width = len(term)
+        if any(tuple(words[i:i + width]) == term for i in range(len(words) - width + 1)):
+            entities.add(" ".join(term))
+    if catalog is not None:
+        found, _ = catalog.extract(question)
+        entities.update(f"{kind}:{value}".lower() for kind, values in found.items() for value in values)
+    return sorted(entities)
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class QuestionCache:
+    def __init__(
+        self,
+        path: str | None = None,
+        schema_path: str = "schema.txt",
+        max_entries: int = 1000,
+        ttl_seconds: float = 7 * 24 * 3600,
+        similarity_threshold: float = 0.85,
+        embedder: HashingEmbedder | None = None,
+        catalog_loader=None,
+        catalog_ttl_seconds: float = 300.0,
+        schema_transform=None,
+        save_interval_seconds: float = 5.0,
+    ):
+        # `catalog_loader() -> EntityCatalog` lets lowercase and misspelled
+        # names count as entities; while it cannot load, only exact matches
+        # are reused. `schema_transform(schema) -> schema` is applied to
+        # schema.txt's text, e.g. shortcuts.with_shortcuts, so entries are
+        # dropped when what the LLM saw changes. Changes are written to
+        # `path` by a background thread every `save_interval_seconds` (and
+        # at exit), not on the request path; embeddings are recomputed on load.
+        self._path = path
+        self._schema_path = schema_path
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._similarity_threshold = similarity_threshold
+        self._embedder = embedder or HashingEmbedder()
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self._schema_mtime = None
+        self._schema_hash = None
+        self._terms = set()
+        self._catalog_loader = catalog_loader
+        self._schema_transform = schema_transform
+        self._save_interval = save_interval_seconds
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._saver = None
+        self._catalog_ttl_seconds = catalog_ttl_seconds
+        self._catalog = None
+        self._catalog_loaded_at = None
+        self._stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "latency_saved": 0.0,
+        }
+        self._refresh_schema_hash()
+        self._load()
+        if path:
+            atexit.register(self.flush)
+
+    @classmethod
+    def from_config(cls, config: Config, schema_path: str = "schema.txt", catalog_loader=None, schema_transform=None):
+        settings = config.get_question_cache_settings()
+        if not settings["enabled"]:
+            return None
+        return cls(
+            path=settings["path"],
+            schema_path=schema_path,
+            max_entries=settings["max_entries"],
+            ttl_seconds=settings["ttl_seconds"],
+            similarity_threshold=settings["similarity_threshold"],
+            catalog_loader=catalog_loader,
+            schema_transform=schema_transform,
+            save_interval_seconds=settings["save_interval_seconds"],
+        )
+
+    def _refresh_schema_hash(self):
+        # cheap mtime check first, hash only when the file was touched
+        if not os.path.exists(self._schema_path):
+            return False
+        mtime = os.path.getmtime(self._schema_path)
+        if mtime == self._schema_mtime:
+            return False
+        self._schema_mtime = mtime
+        with open(self._schema_path, encoding="utf-8") as fp:
+            schema = fp.read().strip()
+        if self._schema_transform is not None:
+            schema = self._schema_transform(schema)
+        schema_hash = _hash_text(schema)
+        self._terms = schema_terms(schema)
+        changed = self._schema_hash is not None and schema_hash != self._schema_hash
+        self._schema_hash = schema_hash
+        return changed
+
+    def _check_schema(self):
+        if self._refresh_schema_hash():
+            self._entries.clear()
+            self._matrix = None
+            self._stats["invalidations"] += 1
+            self._mark_dirty()
+
+    def _load(self):
+        if not self._path or not os.path.exists(self._path):
+            return
+        try:
+            with open(self._path, encoding="utf-8") as fp:
+                data = json.load(fp)
+        except (OSError, json.JSONDecodeError):
+            return
+        if data.get("schema_hash") != self._schema_hash:
+            return
+        now = time.time()
+        entries = [entry for entry in data.get("entries", []) if now - entry["created_at"] <= self._ttl_seconds]
+        # the embeddings are not stored: recomputing them is cheaper than
+        # reading 1024 floats per entry back from JSON
+        embeddings = self._embedder.embed_many([entry["key"] for entry in entries]) if entries else []
+        for entry, embedding in zip(entries, embeddings):
+            entry["embedding"] = embedding
+            self._entries[entry["key"]] = entry
+
+    def _mark_dirty(self):
+        # called under the lock; the saver thread writes the file later
+        if not self._path:
+            return
+        self._dirty = True
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._save_periodically, name="question-cache-saver", daemon=True)
+            self._saver.start()
+
+    def _save_periodically(self):
+        while True:
+            time.sleep(self._save_interval)
+            self.flush()
+
+    def flush(self):
+        # writes the entries if they changed since the last write; the
+        # snapshot is taken under the lock, serialized outside of it
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                entries = [
+                    {name: value for name, value in entry.items() if name != "embedding"}
+                    for entry in self._entries.values()
+                ]
+                data = {"schema_hash": self._schema_hash, "entries": entries}
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+                tmp_path = self._path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as fp:
+                    json.dump(data, fp)
+                os.replace(tmp_path, self._path)
+            except OSError:
+                # retried at the next interval
+                with self._lock:
+                    self._dirty = True
+
+    def _is_expired(self, entry: dict, now: float):
+        return now - entry["created_at"] > self._ttl_seconds
+
+    def _drop_expired(self, now: float):
+        expired = [key for key, entry in self._entries.items() if self._is_expired(entry, now)]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+            self._stats["evictions"] += len(expired)
+
+    def _get_matrix(self):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            embeddings = [self._entries[key]["embedding"] for key in self._matrix_keys]
+            self._matrix = self._embedder.embed_many([]) if not embeddings else np.stack(embeddings)
+        return self._matrix
+
+    def _get_catalog(self):
+        # the entity catalog, reloaded after the ttl; None when there is no
+        # loader, False while it cannot be loaded
+        if self._catalog_loader is None:
+            return None
+        now = time.monotonic()
+        if self._catalog_loaded_at is None or now - self._catalog_loaded_at >= self._catalog_ttl_seconds:
+            self._catalog_loaded_at = now
+            try:
+                self._catalog = self._catalog_loader()
+            except Exception:
+                # keep the previous catalog, if any
+                pass
+        return self._catalog if self._catalog is not None else False
+
+    def _signature(self, question: str, catalog):
+        return entity_signature(question, self._terms, catalog or None)
+
+    def _hit(self, key: str, kind: str, lookup_time: float):
+        entry = self._entries[key]
+        entry["last_used_at"] = time.time()
+        entry["hits"] += 1
+        self._entries.move_to_end(key)
+        self._stats[kind] += 1
+        telemetry.increment("rag_cache_lookups_total", cache="question", result=kind.removesuffix("s"))
+        self._stats["latency_saved"] += max(entry["generation_time"] - lookup_time, 0.0)
+        return list(entry["cypher"])
+
+    def lookup(self, question: str):
+        start = time.perf_counter()
+        key = normalize_question(question)
+        # may query the graph, so outside the lock
+        catalog = self._get_catalog()
+        with self._lock:
+            self._check_schema()
+            self._drop_expired(time.time())
+
+            if key in self._entries:
+                return self._hit(key, "exact_hits", time.perf_counter() - start)
+
+            matrix = self._get_matrix()
+            if matrix.shape[0] > 0 and catalog is not False:
+                signature = self._signature(question, catalog)
+                query_embedding = self._embedder.embed(key)
+                for index, score in cosine_top_k(matrix, query_embedding, k=3):
+                    if score < self._similarity_threshold:
+                        break
+                    candidate_key = self._matrix_keys[index]
+                    if self._signature(self._entries[candidate_key]["question"], catalog) == signature:
+                        return self._hit(candidate_key, "semantic_hits", time.perf_counter() - start)
+
+            self._stats["misses"] += 1
+            telemetry.increment("rag_cache_lookups_total", cache="question", result="miss")
+            return None
+
+    def store(self, question: str, cypher: list[str], generation_time: float):
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "key": key,
+                "question": question,
+                "cypher": list(cypher),
+                "embedding": self._embedder.embed(key),
+                "generation_time": generation_time,
+                "created_at": now,
+                "last_used_at": now,
+                "hits": 0,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            self._matrix = None
+            self._mark_dirty()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._mark_dirty()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
+
+class CachedTextToCypher:
+    # Wraps any TextToCypher backend (v2, v3, ...) that maps a question to a
+    # list of Cypher queries.
+    def __init__(self, text_to_cypher, cache: QuestionCache):
+        self._text_to_cypher = text_to_cypher
+        self._cache = cache
+        self.last_cache_hit = False
+
+    @classmethod
+    def from_config(
+        cls, text_to_cypher, config: Config, schema_path: str = "schema.txt", catalog_loader=None, schema_transform=None
+    ):
+        cache = QuestionCache.from_config(config, schema_path, catalog_loader, schema_transform)
+        if cache is None:
+            return text_to_cypher
+        return cls(text_to_cypher, cache)
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def __getattr__(self, name):
+        return getattr(self._text_to_cypher, name)
+
+    def __call__(self, question: str):
+        cached = self._cache.lookup(question)
+        if cached is not None:
+            self.last_cache_hit = True
+            return cached
+
+        self.last_cache_hit = False
+        start = time.perf_counter()
+        cypher = self._text_to_cypher(question)
+        generation_time = time.perf_counter() - start
+
+        if isinstance(cypher, str):
+            cypher = [cypher]
+        if cypher and all(q.strip() for q in cypher):
+            self._cache.store(question, cypher, generation_time)
+        return cypher
+
+    def generate_candidates(self, question: str, count: int, temperature: float = 0.8) -> list[str]:
+        # A hit is the single query that won before. Candidates are not
+        # stored: the caller stores the winner once it is known.
+        cached = self._cache.lookup(question)
+        if cached is not None:
+            self.last_cache_hit = True
+            return cached
+        self.last_cache_hit = False
+        return self._text_to_cypher.generate_candidates(question, count, temperature)
@@ -1,4 +1,11 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from concurrent.futures import Future
+from threading import Event, Thread
+from backend import telemetry
+from backend.inference import InferenceBackend
+from backend.model_loading import load_causal_lm, load_tokenizer, startup_timer
+from backend.prefix_cache import PROMPT_SENTINEL, PrefixCache, split_static_prefix
+from backend.schema_index import SchemaIndex
+from backend.speculative import SpeculativeDecoder
 
 SYSTEM_PROMPT = """
     You are a helpful and strict assistant for Catan Base Game Rules & Strategy.
@@ -26,29 +33,151 @@ USER_PROMPT_TEMPLATE = """
     Based on the evidence above, provide the answer:
 """.strip()
 
+STOP_SEQUENCES = ["###"]
+
+def truncate_response(response: str, stop_sequences: list[str]):
+    for s in stop_sequences:
+        if s in response:
+            response = response.split(s)[0]
+    return response.strip()
+
+def truncate_stream(chunks, stop_sequences: list[str]):
+    # Yields text up to the first stop sequence. Text that could be the start
+    # of a stop sequence, and trailing whitespace, is held back until the next
+    # chunk decides it.
+    hold = max(len(s) for s in stop_sequences) - 1
+    buffer = ""
+    started = False
+    for chunk in chunks:
+        buffer += chunk
+        if not started:
+            buffer = buffer.lstrip()
+            started = bool(buffer)
+
+        stop_at = min((buffer.find(s) for s in stop_sequences if s in buffer), default=-1)
+        if stop_at >= 0:
+            if buffer[:stop_at].rstrip():
+                yield buffer[:stop_at].rstrip()
+            return
+
+        safe = buffer[:max(len(buffer) - hold, 0)]
+        safe = safe[:len(safe.rstrip())]
+        if safe:
+            yield safe
+            buffer = buffer[len(safe):]
+    if buffer.rstrip():
+        yield buffer.rstrip()
+
 class ResponseGenerator:
-    def __init__(self, schema: str):
-        
-        model_name = "Qwen/Qwen2.5-0.5B-Instruct"
-        self._model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            dtype="auto",
-            device_map="cpu"
-        )
-        self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+    MODEL_NAME = "Qwen/Qwen2.5-0.5B-Instruct"
+
+    def __init__(
+        self,
+        schema: str,
+        use_prefix_cache: bool = True,
+        schema_index: SchemaIndex | None = None,
+        model=None,
+        tokenizer=None,
+        background: bool = False,
+        warmup: bool = False,
+        backend: InferenceBackend | None = None,
+        speculative: SpeculativeDecoder | None = None,
+    ):
+        # `model`/`tokenizer` replace the default Qwen checkpoint, e.g. with
+        # the tiny offline model of the benchmark suite. With `background`,
+        # the constructor returns at once and the model loads on a thread;
+        # every method that needs it waits for `ready_future`. `backend`
+        # (quantization, compilation, threads, static cache) is applied to
+        # the model after loading; None is the plain eager path. With
+        # `speculative`, single requests are decoded greedily by the
+        # speculative decoder instead of sampled by generate().
         self._schema = schema
+        self._backend = backend
+        self._speculative = speculative
+        self._schema_index = schema_index
+        self._use_prefix_cache = use_prefix_cache
+        self._warmup = warmup
+        self._model = model
+        self._tokenizer = tokenizer
+        self._prefix_cache = None
+        self.tokenizer_future = Future()
+        self.ready_future = Future()
+        if background:
+            Thread(target=self._load, daemon=True, name="load-response-generator").start()
+        else:
+            self._load()
+            # surface loading errors from the constructor
+            self.ready_future.result()
 
-    def __call__(self, question: str, query: str, query_result_str: str):
+    def _load(self):
+        try:
+            if self._tokenizer is None:
+                self._tokenizer = load_tokenizer(self.MODEL_NAME, "generator")
+            self.tokenizer_future.set_result(self._tokenizer)
+            if self._backend is not None:
+                self._backend.configure_threads()
+            if self._model is None:
+                load_kwargs = self._backend.load_kwargs() if self._backend else {"dtype": "auto", "device_map": "cpu"}
+                self._model = load_causal_lm(self.MODEL_NAME, "generator", **load_kwargs)
+            if self._backend is not None:
+                with startup_timer("generator.backend"):
+                    self._model = self._backend.prepare(self._model)
+            if self._use_prefix_cache:
+                with startup_timer("generator.prefix_cache"):
+                    self._prefix_cache = PrefixCache(self._model, self._tokenizer)
+                    self._prefix_cache.warm(self.get_prompt_prefix())
+            if self._warmup:
+                with startup_timer("generator.warmup"):
+                    self.warmup()
+            self.ready_future.set_result(True)
+        except Exception as e:
+            if not self.tokenizer_future.done():
+                self.tokenizer_future.set_exception(e)
+            self.ready_future.set_exception(e)
+
+    @property
+    def ready(self):
+        return self.ready_future.done()
+
+    def wait_ready(self, timeout: float | None = None):
+        return self.ready_future.result(timeout)
+
+    def warmup(self):
+        # One short generation through the same input path as real requests,
+        # so the first question does not pay for kernel selection and
+        # allocator growth. Not traced.
+        import torch
+
+        prompt = self.build_prompt("How many players are there?", "MATCH (p:Player) RETURN count(p)", "count(p): 4")
+        model_inputs = self._prepare_model_inputs([prompt])
+        with torch.no_grad():
+            self._generate(model_inputs, max_new_tokens=4, pad_token_id=self._tokenizer.pad_token_id)
+
+    @property
+    def tokenizer(self):
+        return self.tokenizer_future.result()
+
+    def get_fallback_answer(self, query_result_str: str):
         if query_result_str.strip() in ["(no result)", "[]", ""]:
             return "I couldn't find any information about that in the database."
         
         if "(error occurred)" in query_result_str:
             return "I'm sorry, there was an error retrieving the data."
 
+        return None
+
+    def get_schema(self, question: str):
+        if self._schema_index is None:
+            return self._schema
+        return self._schema_index.render_for(question)
+
+    def build_prompt(self, question: str, query: str, query_result_str: str, schema: str | None = None):
         evidence_status = "Data found."
+        if schema is None:
+            schema = self.get_schema(question)
 
         user_content = USER_PROMPT_TEMPLATE
-        user_content = user_content.replace("[SCHEMA]", self._schema)
+        user_content = user_content.replace("[SCHEMA]", schema)
         user_content = user_content.replace("[QUESTION]", question)
         user_content = user_content.replace("[QUERY]", query)
         user_content = user_content.replace("[QUERY_RESULT_STR]", query_result_str)
@@ -59,35 +188,170 @@ class ResponseGenerator:
             {"role": "user", "content": user_content}
         ]
         
-        text = self._tokenizer.apply_chat_template(
+        return self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True
         )
-        
-        model_inputs = (
-            self._tokenizer([text], return_tensors="pt")
+
+    def get_prompt_prefix(self):
+        # system prompt, instructions and schema: identical for every question,
+        # unless the schema is pruned per question and the prefix stops before it
+        if self._schema_index is not None:
+            return split_static_prefix(self.build_prompt("", "", "", schema=PROMPT_SENTINEL))
+        return split_static_prefix(self.build_prompt(PROMPT_SENTINEL, "", ""))
+
+    def _prepare_model_inputs(self, texts: list[str]):
+        if self._prefix_cache is not None:
+            model_inputs = self._prefix_cache.prepare_inputs(self.get_prompt_prefix(), texts)
+            if model_inputs is not None:
+                return model_inputs
+
+        return (
+            self._tokenizer(texts, return_tensors="pt", padding=True)
             .to(self._model.device)
         )
-        
-        generated_ids = self._model.generate(
-            **model_inputs,
-            max_new_tokens=512,
-            temperature=0.7 
-        )
-        
-        generated_ids = [
-            output_ids[len(input_ids):]
-            for input_ids, output_ids in zip(model_inputs.input_ids,
-                                             generated_ids)
-        ]
-        
-        response = self._tokenizer.batch_decode(
-            generated_ids,
+
+    def _generate_kwargs(self, model_inputs):
+        if self._backend is None:
+            return {}
+        return self._backend.generate_kwargs(model_inputs)
+
+    def _generate(self, model_inputs, **kwargs):
+        # the speculative decoder handles one sequence at a time; batches
+        # keep generate()
+        if self._speculative is not None and model_inputs["input_ids"].shape[0] == 1:
+            return self._speculative.generate(self._model, **model_inputs, **kwargs)
+        return self._model.generate(**model_inputs, **self._generate_kwargs(model_inputs), **kwargs)
+
+    def get_speculative_stats(self):
+        if self._speculative is None:
+            return None
+        return self._speculative.get_stats()
+
+    def get_backend_info(self):
+        if not self.ready or self._backend is None:
+            return None
+        return self._backend.get_info()
+
+    def get_prefix_cache_stats(self):
+        if not self.ready or self._prefix_cache is None:
+            return None
+        return self._prefix_cache.get_stats()
+
+    def stream(self, question: str, query: str, query_result_str: str, max_new_tokens: int = 512):
+        fallback_answer = self.get_fallback_answer(query_result_str)
+        if fallback_answer is not None:
+            yield fallback_answer
+            return
+
+        from transformers import StoppingCriteriaList, TextIteratorStreamer
+        from backend.generation import StopOnSequences, TokenTimer
+
+        if not self.ready:
+            with telemetry.span("answer.wait_for_model"):
+                self.wait_ready()
+        with telemetry.span("answer.prompt_build"):
+            text = self.build_prompt(question, query, query_result_str)
+        with telemetry.span("answer.tokenize") as span:
+            model_inputs = self._prepare_model_inputs([text])
+            span.set("prompt_tokens", model_inputs["input_ids"].shape[1])
+        telemetry.observe("rag_prompt_tokens", model_inputs["input_ids"].shape[1], stage="answer")
+
+        cancel_event = Event()
+        timer = TokenTimer()
+        streamer = TextIteratorStreamer(
+            self._tokenizer,
+            skip_prompt=True,
             skip_special_tokens=True
-        )[0]
+        )
+        stopping_criteria = StoppingCriteriaList([
+            StopOnSequences(
+                self._tokenizer,
+                model_inputs["input_ids"].shape[1],
+                STOP_SEQUENCES,
+                cancel_event
+            ),
+            timer
+        ])
+        errors = []
+
+        def generate(**kwargs):
+            try:
+                self._generate(model_inputs, **kwargs)
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        thread = Thread(
+            target=generate,
+            kwargs=dict(
+                max_new_tokens=max_new_tokens,
+                temperature=0.7,
+                streamer=streamer,
+                stopping_criteria=stopping_criteria
+            ),
+            daemon=True
+        )
+        thread.start()
+
+        try:
+            yield from truncate_stream(streamer, STOP_SEQUENCES)
+        finally:
+            # stop decoding when the caller hits a stop sequence or stops reading
+            cancel_event.set()
+            thread.join()
+            timer.record("answer")
+            telemetry.observe("rag_generated_tokens", timer.steps, stage="answer")
+        if errors:
+            raise errors[0]
 
-        if "###" in response:
-            response = response.split("###")[0]
+    def generate_batch(self, prompts: list[str], max_new_tokens: list[int]):
+        # Left padding keeps the last prompt token of every row at the same
+        # position, so all rows start decoding together.
+        import torch
+        from transformers import StoppingCriteriaList
+        from backend.generation import MaxNewTokensPerRow, StopOnSequences, TokenTimer
 
-        return response.strip()
\ No newline at end of file
+        self.wait_ready()
+        self._tokenizer.padding_side = "left"
+        if self._tokenizer.pad_token is None:
+            self._tokenizer.pad_token = self._tokenizer.eos_token
+
+        with telemetry.span("answer.tokenize", batch_size=len(prompts)):
+            model_inputs = self._prepare_model_inputs(prompts)
+        prompt_length = model_inputs["input_ids"].shape[1]
+        timer = TokenTimer()
+        stopping_criteria = StoppingCriteriaList([
+            StopOnSequences(self._tokenizer, prompt_length, STOP_SEQUENCES),
+            MaxNewTokensPerRow(prompt_length, max_new_tokens),
+            timer,
+        ])
+
+        with torch.no_grad():
+            generated_ids = self._generate(
+                model_inputs,
+                max_new_tokens=max(max_new_tokens),
+                temperature=0.7,
+                stopping_criteria=stopping_criteria,
+                pad_token_id=self._tokenizer.pad_token_id
+            )
+
+        responses = []
+        token_counts = []
+        for output_ids, limit in zip(generated_ids, max_new_tokens):
+            output_ids = output_ids[prompt_length:][:limit]
+            # rows that finished early are padded up to the longest row
+            finished = (output_ids == self._tokenizer.pad_token_id).nonzero()
+            if len(finished) > 0:
+                output_ids = output_ids[:finished[0, 0]]
+            token_counts.append(len(output_ids))
+            response = self._tokenizer.decode(output_ids, skip_special_tokens=True)
+            responses.append(truncate_response(response, STOP_SEQUENCES))
+        timer.record("answer")
+        for token_count in token_counts:
+            telemetry.observe("rag_generated_tokens", token_count, stage="answer")
+        return responses, token_counts
+
+    def __call__(self, question: str, query: str, query_result_str: str):
+        return "".join(self.stream(question, query, query_result_str)).strip()
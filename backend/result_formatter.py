@@ -0,0 +1,160 @@
+import json
+from collections import Counter
+from concurrent.futures import Future
+from backend import telemetry
+from backend.config import Config
+
+def _render_value(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_render_value(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{k}: {_render_value(v)}" for k, v in value.items()) + "}"
+    return json.dumps(value) if isinstance(value, bool) else str(value)
+
+def flatten_row(row: dict) -> dict:
+    # node/map values become one column per property, e.g. p -> p.name, p.vp
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict) and value and all(not isinstance(v, dict) for v in value.values()):
+            for prop, prop_value in value.items():
+                flat[f"{key}.{prop}"] = prop_value
+        else:
+            flat[key] = value
+    return flat
+
+class FormattedResult:
+    def __init__(self, text: str, rows: list[dict], total_rows: int, tokens: int, truncated: bool = False):
+        self.text = text
+        self.rows = rows
+        self.total_rows = total_rows
+        self.tokens = tokens
+        # rows past the token budget were replaced by a summary
+        self.truncated = truncated
+
+class ResultFormatter:
+    # Turns query records into a compact table: the header is written once,
+    # columns that hold the same value in every row are hoisted above the
+    # table, duplicate rows are dropped, and rows that do not fit the token
+    # budget are replaced by aggregate counts.
+    def __init__(self, tokenizer=None, token_budget: int = 1024, top_k_values: int = 3):
+        # `tokenizer` may be a Future of a tokenizer that is still loading
+        self._tokenizer = tokenizer
+        self._token_budget = token_budget
+        self._top_k_values = top_k_values
+
+    @classmethod
+    def from_config(cls, config: Config, tokenizer=None):
+        settings = config.get_result_formatting_settings()
+        return cls(
+            tokenizer=tokenizer,
+            token_budget=settings["token_budget"],
+            top_k_values=settings["top_k_values"],
+        )
+
+    def count_tokens(self, text: str) -> int:
+        if isinstance(self._tokenizer, Future):
+            self._tokenizer = self._tokenizer.result()
+        if self._tokenizer is None:
+            # rough estimate for English text and identifiers
+            return (len(text) + 3) // 4
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    def _render_table(self, columns: list[str], rows: list[dict], counters: dict[str, Counter], total_rows: int):
+        # a column is hoisted only when every row of the result holds the
+        # same value, not just the rows shown
+        constant = {}
+        if len(rows) > 1:
+            for column in columns:
+                counter = counters[column]
+                if len(counter) == 1 and sum(counter.values()) == total_rows:
+                    constant[column] = next(iter(counter))
+        varying = [c for c in columns if c not in constant]
+
+        lines = [f"{column}: {value} (all rows)" for column, value in constant.items()]
+        if varying:
+            lines.append(" | ".join(varying))
+            lines += [" | ".join(row.get(c, "") for c in varying) for row in rows]
+        return lines
+
+    def _render_summary(self, total_rows: int, shown_rows: int, counters: dict[str, Counter], numbers: dict[str, list]):
+        lines = [f"... showing {shown_rows} of {total_rows} rows. Summary of all rows:"]
+        for column, counter in counters.items():
+            if column in numbers and numbers[column][2] == sum(counter.values()):
+                low, high, _, total = numbers[column]
+                lines.append(f"{column}: min {low}, max {high}, sum {total}")
+            else:
+                top = ", ".join(f"{value} ({count})" for value, count in counter.most_common(self._top_k_values))
+                lines.append(f"{column}: {len(counter)} distinct, top {top}")
+        return lines
+
+    def format(self, records, token_budget: int | None = None) -> FormattedResult:
+        # `records` may be a lazy iterator (e.g. a Neo4j cursor); rows past the
+        # budget only update the running aggregates and are not kept.
+        budget = token_budget or self._token_budget
+        columns = []
+        kept = []
+        seen = set()
+        counters: dict[str, Counter] = {}
+        numbers: dict[str, list] = {}
+        total_rows = 0
+        used_tokens = 0
+        full = False
+
+        duplicates = 0
+        for record in records:
+            raw_row = flatten_row(record)
+            row = {column: _render_value(value) for column, value in raw_row.items()}
+            total_rows += 1
+            for column, value in row.items():
+                if column not in counters:
+                    columns.append(column)
+                    counters[column] = Counter()
+                counters[column][value] += 1
+                raw = raw_row[column]
+                if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+                    low, high, count, total = numbers.get(column, [raw, raw, 0, 0])
+                    numbers[column] = [min(low, raw), max(high, raw), count + 1, total + raw]
+
+            key = tuple(sorted(row.items()))
+            if key in seen:
+                duplicates += 1
+                continue
+            if full:
+                continue
+            seen.add(key)
+
+            row_tokens = self.count_tokens(" | ".join(row.values())) + 1
+            # keep a quarter of the budget for the header and the summary
+            if used_tokens + row_tokens > budget * 3 // 4 and kept:
+                full = True
+                continue
+            kept.append(row)
+            used_tokens += row_tokens
+
+        if total_rows == 0:
+            return FormattedResult("(no result)", [], 0, self.count_tokens("(no result)"))
+
+        lines = self._render_table(columns, kept, counters, total_rows)
+        if full:
+            lines += self._render_summary(total_rows, len(kept), counters, numbers)
+        elif duplicates:
+            lines.append(f"({total_rows} rows, {duplicates} duplicates omitted)")
+        else:
+            lines.append(f"({total_rows} rows)")
+        text = "\n".join(lines)
+        return FormattedResult(text, kept, total_rows, self.count_tokens(text), truncated=full)
+
+    def format_all(self, results: list) -> tuple[str, list[FormattedResult]]:
+        # the budget is split evenly across the queries of one question
+        budget = max(self._token_budget // max(len(results), 1), 1)
+        with telemetry.span("result.format", queries=len(results)) as span:
+            formatted = [self.format(records, token_budget=budget) for records in results]
+            span.set("tokens", sum(result.tokens for result in formatted))
+        if len(formatted) == 1:
+            return formatted[0].text, formatted
+        text = "\n\n".join(f"Query {i} result:\n{result.text}" for i, result in enumerate(formatted, start=1))
+        return text, formatted
@@ -0,0 +1,338 @@
+import re
+import threading
+from backend.config import Config
+from backend.embeddings import HashingEmbedder
+
+_LABEL_PATTERN = re.compile(r"^- \*\*(\w+)\*\*")
+_PROPERTY_PATTERN = re.compile(r"^- `(\w+)`:\s*(\w+)")
+_RELATIONSHIP_PATTERN = re.compile(r"^\(:(\w+)\)-\[:(\w+)\]->\(:(\w+)\)")
+_QUOTED_PATTERN = re.compile(r'"([^"]+)"')
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_CAMEL_CASE_PATTERN = re.compile(r"(?<=[a-z])(?=[A-Z])")
+
+# everyday words in questions that name a schema element differently
+SYNONYMS = {
+    "port": ["Harbor", "TradeOption"],
+    "trade": ["TradeOption", "Harbor"],
+    "tile": ["Hex"],
+    "hexes": ["Hex"],
+    "dice": ["DiceNumber"],
+    "roll": ["DiceNumber"],
+    "number": ["DiceNumber", "Hex"],
+    "probability": ["Odds"],
+    "pips": ["Odds"],
+    "vp": ["Player"],
+    "victory": ["Player", "SpecialCard"],
+    "point": ["Player"],
+    "hand": ["Resource"],
+    "card": ["Resource"],
+    "development": ["DevCardInstance", "DevCardType"],
+    "knight": ["DevCardType", "DevCardInstance"],
+    "turn": ["GameState"],
+    "phase": ["GameState", "Rule"],
+    "building": ["Piece", "BuildingType"],
+    "build": ["BuildingType", "Piece"],
+    "cost": ["BuildingType", "Resource"],
+    "road": ["Piece", "BuildingType"],
+    "settlement": ["Piece", "BuildingType"],
+    "city": ["Piece", "BuildingType"],
+    "cities": ["Piece", "BuildingType"],
+    "robber": ["Piece", "Hex"],
+    "produce": ["TerrainType", "Resource", "Hex"],
+    "production": ["TerrainType", "Resource", "Hex"],
+    "terrain": ["TerrainType"],
+    "longest": ["SpecialCard"],
+    "largest": ["SpecialCard"],
+    "army": ["SpecialCard"],
+    "who": ["Player"],
+}
+
+# too common to identify a label on their own
+_GENERIC_WORDS = {
+    "a", "an", "the", "of", "to", "in", "on", "and", "or", "for", "is", "are",
+    "what", "which", "how", "type", "card", "number", "state", "option",
+    "instance", "special", "game", "move", "year", "point",
+}
+
+def _split_words(text: str) -> list[str]:
+    text = _CAMEL_CASE_PATTERN.sub(" ", text).replace("_", " ")
+    return _WORD_PATTERN.findall(text.lower())
+
+def _stem(word: str) -> str:
+    # plurals, -ed and -ing, and a final e so that "trade", "trades",
+    # "traded" and "trading" all become "trad"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    elif len(word) > 4 and word.endswith("ed") or len(word) > 5 and word.endswith("ing"):
+        word = word[:-2] if word.endswith("ed") else word[:-3]
+        # "stopped" -> "stop", but "rolled" -> "roll"
+        if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+            word = word[:-1]
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+class SchemaIndex:
+    def __init__(
+        self,
+        schema: str,
+        embedder: HashingEmbedder | None = None,
+        similarity_threshold: float = 0.3,
+        max_note_chars: int = 1500,
+    ):
+        self._schema = schema
+        self._embedder = embedder or HashingEmbedder()
+        self._similarity_threshold = similarity_threshold
+        self._max_note_chars = max_note_chars
+        self.labels: dict[str, list[str]] = {}
+        self.relationship_properties: dict[str, list[str]] = {}
+        self.relationships: list[tuple[str, str, str]] = []
+        self.notes: list[str] = []
+        self._parse(schema)
+        self._build_keywords()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "fallbacks": 0, "full_chars": len(schema), "rendered_chars": 0}
+
+    @classmethod
+    def from_config(cls, schema: str, config: Config):
+        settings = config.get_schema_pruning_settings()
+        if not settings["enabled"]:
+            return None
+        return cls(
+            schema,
+            similarity_threshold=settings["similarity_threshold"],
+            max_note_chars=settings["max_note_chars"],
+        )
+
+    def _parse(self, schema: str):
+        section = None
+        current = None
+        for line in schema.splitlines():
+            stripped = line.strip()
+            if stripped == "Node properties:":
+                section, current = "nodes", None
+            elif stripped == "Relationship properties:":
+                section, current = "relationship_properties", None
+            elif stripped == "The relationships:":
+                section, current = "relationships", None
+            elif stripped == "Domain notes:":
+                section, current = "notes", None
+            elif section in ("nodes", "relationship_properties"):
+                target = self.labels if section == "nodes" else self.relationship_properties
+                label_match = _LABEL_PATTERN.match(stripped)
+                if label_match:
+                    current = label_match.group(1)
+                    target[current] = []
+                elif current and _PROPERTY_PATTERN.match(stripped):
+                    target[current].append(stripped)
+            elif section == "relationships":
+                match = _RELATIONSHIP_PATTERN.match(stripped)
+                if match:
+                    self.relationships.append(match.groups())
+            elif section == "notes" and stripped:
+                # top-level bullets start a note, indented lines continue it
+                if line.startswith("- "):
+                    self.notes.append(line)
+                elif self.notes:
+                    self.notes[-1] += "\n" + line
+
+    def get_properties(self, label: str) -> set[str]:
+        return {_PROPERTY_PATTERN.match(line).group(1) for line in self.labels.get(label, [])}
+
+    def get_property_types(self, label: str) -> dict[str, str]:
+        # property name -> declared type ("STRING", "INTEGER", ...)
+        return {
+            match.group(1): match.group(2)
+            for match in (_PROPERTY_PATTERN.match(line) for line in self.labels.get(label, []))
+        }
+
+    def get_enumerated_properties(self, label: str) -> set[str]:
+        # properties whose values are all listed ("Available options: [...]")
+        return {
+            _PROPERTY_PATTERN.match(line).group(1)
+            for line in self.labels.get(label, [])
+            if "Available options:" in line
+        }
+
+    def get_relationship_properties(self, rel_type: str) -> set[str]:
+        return {_PROPERTY_PATTERN.match(line).group(1) for line in self.relationship_properties.get(rel_type, [])}
+
+    def get_relationship_types(self) -> set[str]:
+        return {rel_type for _, rel_type, _ in self.relationships}
+
+    def _build_keywords(self):
+        self._keywords: dict[str, set[str]] = {}
+        self._phrases: dict[str, str] = {}
+
+        def add(word: str, label: str):
+            if len(word) > 2 and not word.isdigit() and word not in _GENERIC_WORDS:
+                self._keywords.setdefault(_stem(word), set()).add(label)
+
+        label_documents = []
+        for label, properties in self.labels.items():
+            document = _split_words(label)
+            self._phrases[" ".join(document)] = label
+            for word in document:
+                add(word, label)
+            for line in properties:
+                name = _PROPERTY_PATTERN.match(line).group(1)
+                document += _split_words(name)
+                for value in _QUOTED_PATTERN.findall(line):
+                    document += _split_words(value)
+                    for word in _split_words(value):
+                        add(word, label)
+            label_documents.append(" ".join(_stem(word) for word in document))
+
+        for word, labels in SYNONYMS.items():
+            for label in labels:
+                if label in self.labels:
+                    self._keywords.setdefault(_stem(word), set()).add(label)
+
+        self._label_names = list(self.labels)
+        self._label_matrix = self._embedder.embed_many(label_documents)
+
+        self._relationship_keywords: dict[str, str] = {}
+        self._neighbours: dict[str, set[str]] = {}
+        for start, rel_type, end in self.relationships:
+            self._relationship_keywords[" ".join(_split_words(rel_type))] = rel_type
+            self._neighbours.setdefault(start, set()).add(end)
+            self._neighbours.setdefault(end, set()).add(start)
+
+    def _distances(self, label: str) -> dict[str, int]:
+        # hops from `label` to every label it connects to, either direction
+        distances = {label: 0}
+        frontier = [label]
+        while frontier:
+            following = []
+            for current in frontier:
+                for neighbour in self._neighbours.get(current, ()):
+                    if neighbour not in distances:
+                        distances[neighbour] = distances[current] + 1
+                        following.append(neighbour)
+            frontier = following
+        return distances
+
+    def _connecting(self, seeds: set[str]) -> set[tuple]:
+        # the relationships on any shortest path between two seeds, i.e. the
+        # hops a multi-hop question walks that are not next to a seed
+        distances = {seed: self._distances(seed) for seed in seeds}
+        connecting = set()
+        ordered = sorted(seeds)
+        for i, a in enumerate(ordered):
+            for b in ordered[i + 1:]:
+                length = distances[a].get(b)
+                if not length:
+                    continue
+                for relationship in self.relationships:
+                    start, _, end = relationship
+                    for u, v in ((start, end), (end, start)):
+                        if u in distances[a] and v in distances[b] and distances[a][u] + 1 + distances[b][v] == length:
+                            connecting.add(relationship)
+        return connecting
+
+    def _named_in(self, notes: list[str], labels: set[str]) -> set[tuple]:
+        # the relationships of the types the notes name whose ends are
+        # selected or named too; the notes spell out paths such as
+        # Piece-PLACED_ON->Intersection-TOUCHES->Hex
+        text = "\n".join(notes)
+        named = labels | {label for label in self.labels if re.search(rf"\b{label}\b", text)}
+        return {
+            (start, rel_type, end)
+            for start, rel_type, end in self.relationships
+            if re.search(rf"\b{rel_type}\b", text) and start in named and end in named
+        }
+
+    def select(self, question: str):
+        words = [_stem(w) for w in _split_words(question)]
+        seeds = set()
+        for word in words:
+            seeds.update(self._keywords.get(word, ()))
+
+        scores = self._label_matrix @ self._embedder.embed(" ".join(words))
+        for label, score in zip(self._label_names, scores):
+            if score >= self._similarity_threshold:
+                seeds.add(label)
+
+        # multi-word names such as "dice number", "has resource" or "allows access"
+        question_text = " ".join(_split_words(question))
+        seeds.update(label for phrase, label in self._phrases.items() if phrase in question_text)
+        seed_rel_types = {rel for words, rel in self._relationship_keywords.items() if words in question_text}
+        for start, rel_type, end in self.relationships:
+            if rel_type in seed_rel_types:
+                seeds.update((start, end))
+
+        # 1-hop expansion over the relationship list, plus the paths
+        # connecting the seeds
+        chosen = self._connecting(seeds)
+        chosen.update(r for r in self.relationships if r[0] in seeds or r[2] in seeds)
+        return seeds, *self._with_ends(seeds, chosen)
+
+    def _with_ends(self, labels: set[str], chosen: set[tuple]):
+        # (labels, relationships in schema order) of `labels` and `chosen`
+        labels = set(labels)
+        for start, _, end in chosen:
+            labels.update((start, end))
+        return labels, [r for r in self.relationships if r in chosen]
+
+    def _select_notes(self, question: str, seeds: set[str], relationships: list[tuple]):
+        names = set(seeds) | {rel_type for _, rel_type, _ in relationships}
+        question_words = {_stem(w) for w in _split_words(question)}
+        scored = []
+        for i, note in enumerate(self.notes):
+            mentions = sum(1 for name in names if re.search(rf"\b{name}\b", note))
+            if mentions == 0:
+                continue
+            overlap = len(question_words & {_stem(w) for w in _split_words(note)})
+            scored.append((mentions + overlap, -i, note))
+        scored.sort(reverse=True)
+
+        # best notes first, skipping any that no longer fit the budget
+        chosen = []
+        budget = self._max_note_chars
+        for score, position, note in scored:
+            if len(note) <= budget:
+                chosen.append((-position, note))
+                budget -= len(note)
+        return [note for _, note in sorted(chosen)]
+
+    def render(self, labels: set[str], relationships: list[tuple], notes: list[str]) -> str:
+        lines = ["Node properties:"]
+        for label, properties in self.labels.items():
+            if label in labels:
+                lines.append(f"- **{label}**")
+                lines.extend(properties)
+        rel_types = {rel_type for _, rel_type, _ in relationships}
+        rel_properties = [(r, p) for r, p in self.relationship_properties.items() if r in rel_types]
+        if rel_properties:
+            lines += ["", "Relationship properties:"]
+            for rel_type, properties in rel_properties:
+                lines.append(f"- **{rel_type}**")
+                lines.extend(properties)
+        lines += ["", "The relationships:"]
+        lines += [f"(:{start})-[:{rel_type}]->(:{end})" for start, rel_type, end in relationships]
+        if notes:
+            lines += ["", "Domain notes:"] + notes
+        return "\n".join(lines)
+
+    def render_for(self, question: str) -> str:
+        seeds, labels, relationships = self.select(question)
+        if not seeds:
+            schema = self._schema
+        else:
+            notes = self._select_notes(question, seeds, relationships)
+            labels, relationships = self._with_ends(labels, set(relationships) | self._named_in(notes, labels))
+            schema = self.render(labels, relationships, notes)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["fallbacks"] += 0 if seeds else 1
+            self._stats["rendered_chars"] += len(schema)
+        return schema
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        rendered_chars = stats.pop("rendered_chars")
+        stats["avg_rendered_chars"] = rendered_chars / stats["requests"] if stats["requests"] else 0.0
+        return stats
@@ -0,0 +1,248 @@
+import argparse
+import json
+import threading
+import time
+from backend import telemetry
+from backend.config import Config, load_config
+from backend.database import GraphDatabaseDriver
+
+# What the shortcuts are derived from: each player's settlements and cities
+# with the intersection they stand on, and the hexes the robber is on.
+PLACEMENTS_QUERY = """MATCH (p:Player)
+OPTIONAL MATCH (p)-[:OWNS]->(piece:Piece)-[:PLACED_ON]->(i:Intersection)
+WHERE piece.type IN ['Settlement', 'City']
+RETURN p.name AS player, collect(piece.type + '@' + i.id) AS placements"""
+ROBBER_QUERY = """MATCH (:Piece {type: 'Robber'})-[:LOCATED_AT]->(h:Hex)
+RETURN collect(h.id) AS hexes"""
+
+DELETE_ALL = "MATCH (:Player)-[r:PRODUCES_FROM|CAN_TRADE_AT]->() DELETE r"
+DELETE_PLAYERS = """MATCH (p:Player)-[r:PRODUCES_FROM|CAN_TRADE_AT]->()
+WHERE p.name IN $players
+DELETE r"""
+# 1 card per settlement and 2 per city on the hex's corners; the desert
+# never produces. `blocked` while the robber stands on the hex.
+CREATE_PRODUCES_FROM = """MATCH (p:Player)-[:OWNS]->(piece:Piece)-[:PLACED_ON]->(:Intersection)-[:TOUCHES]->(h:Hex)
+WHERE p.name IN $players AND piece.type IN ['Settlement', 'City']
+AND NOT (h)-[:IS_TYPE]->(:TerrainType {name: 'Desert'})
+WITH p, h, sum(CASE piece.type WHEN 'City' THEN 2 ELSE 1 END) AS multiplier
+OPTIONAL MATCH (robber:Piece {type: 'Robber'})-[:LOCATED_AT]->(h)
+WITH p, h, multiplier, count(robber) > 0 AS blocked
+CREATE (p)-[:PRODUCES_FROM {multiplier: multiplier, blocked: blocked}]->(h)
+RETURN count(*) AS created"""
+# `resources` are those of the special ports among the harbors
+CREATE_CAN_TRADE_AT = """MATCH (p:Player)-[:OWNS]->(piece:Piece)-[:PLACED_ON]->(:Intersection)-[:HAS_HARBOR]->(harbor:Harbor)-[:ALLOWS_ACCESS]->(t:TradeOption)
+WHERE p.name IN $players AND piece.type IN ['Settlement', 'City']
+OPTIONAL MATCH (harbor)-[:FOR_RESOURCE]->(r:Resource)
+WITH p, t, collect(DISTINCT r.name) AS resources
+CREATE (p)-[:CAN_TRADE_AT {resources: resources}]->(t)
+RETURN count(*) AS created"""
+UPDATE_BLOCKED = """MATCH (h:Hex) WHERE h.id IN $hexes
+OPTIONAL MATCH (robber:Piece {type: 'Robber'})-[:LOCATED_AT]->(h)
+WITH h, count(robber) > 0 AS blocked
+MATCH (:Player)-[r:PRODUCES_FROM]->(h)
+SET r.blocked = blocked
+RETURN count(r) AS updated"""
+
+# What schema.txt gains while a maintainer keeps the shortcuts: without one
+# they are not in the graph, so the LLM, validator and pruning must not see them
+SCHEMA_PROPERTIES = """- **PRODUCES_FROM**
+- `multiplier`: INTEGER Min: 1, Max: 6
+- `blocked`: BOOLEAN
+
+- **CAN_TRADE_AT**
+- `resources`: LIST Example: ["Ore"]
+
+"""
+SCHEMA_RELATIONSHIPS = """(:Player)-[:PRODUCES_FROM]->(:Hex)
+(:Player)-[:CAN_TRADE_AT]->(:TradeOption)
+"""
+SCHEMA_NOTES = """- PRODUCES_FROM and CAN_TRADE_AT are shortcuts kept up to date from the pieces on the board; use them instead of walking OWNS, PLACED_ON, TOUCHES and HAS_HARBOR:
+  - (:Player)-[:PRODUCES_FROM]->(:Hex) exists when the Player has Settlements or Cities on the Hex's corners (never for the Desert). `multiplier` is the cards the Player receives when its number is rolled (1 per Settlement, 2 per City); `blocked` is true while the Robber is on the Hex.
+  - Who receives resources on a roll of X: MATCH (p:Player)-[pf:PRODUCES_FROM]->(h:Hex)-[:HAS_TOKEN]->(:DiceNumber {value: X}) WHERE NOT pf.blocked MATCH (h)-[:IS_TYPE]->(:TerrainType)-[:PRODUCES]->(r:Resource) RETURN p.name, r.name, pf.multiplier
+  - (:Player)-[:CAN_TRADE_AT]->(:TradeOption) exists when the Player has a Settlement or City on an Intersection with a Harbor granting that TradeOption; `resources` lists the resources of its special ports."""
+
+def with_shortcuts(schema: str) -> str:
+    # `schema` (schema.txt's text) with the shortcuts added to its
+    # relationship properties, relationships and domain notes
+    schema = schema.replace("The relationships:\n", SCHEMA_PROPERTIES + "The relationships:\n" + SCHEMA_RELATIONSHIPS, 1)
+    return schema.rstrip() + "\n" + SCHEMA_NOTES
+
+class ShortcutMaintainer:
+    # Materializes the multi-hop board patterns as 1-hop relationships:
+    #   (:Player)-[:PRODUCES_FROM {multiplier, blocked}]->(:Hex)
+    #   (:Player)-[:CAN_TRADE_AT {resources}]->(:TradeOption)
+    # The first sync rebuilds all of them. Later syncs (every
+    # `refresh_interval_seconds`, once the graph version token changed, or
+    # always without one) compare each player's settlements and cities and
+    # the robber's hexes with the last sync, and only replace the shortcuts
+    # of players whose pieces changed and the `blocked` flags of the hexes
+    # the robber left or entered, in one transaction.
+    def __init__(self, driver_factory, refresh_interval_seconds: float = 5.0):
+        # `driver_factory` returns a GraphDatabaseDriver that reads Neo4j
+        # itself (not the replica), so its view is never behind a write
+        self._driver_factory = driver_factory
+        self._refresh_interval = refresh_interval_seconds
+        self._lock = threading.Lock()
+        # one sync at a time: each diffs against the state the last one left
+        self._sync_lock = threading.Lock()
+        self._placements = None
+        self._robber_hexes = set()
+        self._version = None
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._stats = {
+            "syncs": 0,
+            "unchanged": 0,
+            "full_rebuilds": 0,
+            "incremental_updates": 0,
+            "players_updated": 0,
+            "hexes_updated": 0,
+            "produces_from_created": 0,
+            "can_trade_at_created": 0,
+            "errors": 0,
+            "last_error": None,
+            "last_sync_time": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Config, driver_factory=None):
+        settings = config.get_shortcuts_settings()
+        if not settings["enabled"]:
+            return None
+        return cls(
+            driver_factory or (lambda: GraphDatabaseDriver(config, use_replica=False)),
+            refresh_interval_seconds=settings["refresh_interval_seconds"],
+        )
+
+    def start(self):
+        # first sync on the caller's thread, then one every interval
+        self.sync()
+        self._thread = threading.Thread(target=self._poll, name="shortcuts", daemon=True)
+        self._thread.start()
+        return self
+
+    def _poll(self):
+        while not self._closed:
+            self._wake.wait(self._refresh_interval)
+            self._wake.clear()
+            if not self._closed:
+                self.sync()
+
+    def mark_stale(self):
+        # called by whatever moved pieces, to sync now instead of at the next interval
+        self._wake.set()
+
+    def rebuild(self):
+        # drops and recreates every shortcut at the next sync, which runs now
+        with self._lock:
+            self._placements = None
+            self._version = None
+        return self.sync()
+
+    def _statements(self, placements: dict, robber_hexes: set):
+        # (statements, players, hexes) to bring the shortcuts from the last
+        # sync's state to this one
+        if self._placements is None:
+            players = sorted(placements)
+            return [
+                (DELETE_ALL, {}),
+                (CREATE_PRODUCES_FROM, {"players": players}),
+                (CREATE_CAN_TRADE_AT, {"players": players}),
+            ], players, set()
+        players = sorted(p for p in placements if placements[p] != self._placements.get(p))
+        hexes = robber_hexes ^ self._robber_hexes
+        statements = []
+        if players:
+            statements += [
+                (DELETE_PLAYERS, {"players": players}),
+                (CREATE_PRODUCES_FROM, {"players": players}),
+                (CREATE_CAN_TRADE_AT, {"players": players}),
+            ]
+        if hexes:
+            statements.append((UPDATE_BLOCKED, {"hexes": sorted(hexes)}))
+        return statements, players, hexes
+
+    def sync(self) -> bool:
+        # True when shortcuts were written
+        with self._sync_lock:
+            return self._sync()
+
+    def _sync(self) -> bool:
+        start = time.perf_counter()
+        try:
+            with telemetry.background_span("shortcuts.sync") as span, self._driver_factory() as driver:
+                version = driver.get_graph_version()
+                with self._lock:
+                    self._stats["syncs"] += 1
+                    current = self._placements is not None and version is not None and version == self._version
+                if current:
+                    with self._lock:
+                        self._stats["unchanged"] += 1
+                    return False
+                placements = {
+                    row["player"]: tuple(sorted(row["placements"]))
+                    for row in driver.execute_query(PLACEMENTS_QUERY, {})
+                }
+                robber_rows = driver.execute_query(ROBBER_QUERY, {})
+                robber_hexes = set(robber_rows[0]["hexes"]) if robber_rows else set()
+
+                full = self._placements is None
+                statements, players, hexes = self._statements(placements, robber_hexes)
+                results = driver.execute_write(statements) if statements else []
+                span.set("players", len(players))
+                span.set("hexes", len(hexes))
+        except Exception as error:
+            with self._lock:
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(error)
+            return False
+
+        created = {query: rows[0][next(iter(rows[0]))] for (query, _), rows in zip(statements, results) if rows}
+        with self._lock:
+            self._placements = placements
+            self._robber_hexes = robber_hexes
+            self._version = version
+            if statements:
+                self._stats["full_rebuilds" if full else "incremental_updates"] += 1
+            else:
+                self._stats["unchanged"] += 1
+            self._stats["players_updated"] += len(players)
+            self._stats["hexes_updated"] += len(hexes)
+            self._stats["produces_from_created"] += created.get(CREATE_PRODUCES_FROM, 0)
+            self._stats["can_trade_at_created"] += created.get(CREATE_CAN_TRADE_AT, 0)
+            self._stats["last_sync_time"] = time.perf_counter() - start
+            self._stats["last_error"] = None
+        return bool(statements)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["players"] = len(self._placements or {})
+            stats["robber_hexes"] = sorted(self._robber_hexes)
+            stats["version"] = self._version
+        return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize the PRODUCES_FROM and CAN_TRADE_AT shortcuts.")
+    parser.add_argument("--watch", action="store_true", help="Keep them up to date instead of exiting after a rebuild.")
+    args = parser.parse_args()
+    config = load_config()
+    maintainer = ShortcutMaintainer.from_config(config) or ShortcutMaintainer(
+        lambda: GraphDatabaseDriver(config, use_replica=False)
+    )
+    maintainer.rebuild()
+    print(json.dumps(maintainer.get_stats(), indent=2))
+    if args.watch:
+        maintainer.start()
+        try:
+            maintainer._thread.join()
+        except KeyboardInterrupt:
+            maintainer.close()
+
+if __name__ == "__main__":
+    main()
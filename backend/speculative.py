@@ -0,0 +1,311 @@
+import threading
+import time
+from backend import telemetry
+from backend.config import Config
+from backend.model_loading import load_causal_lm, startup_timer
+
+# torch/transformers are imported inside the methods, like the model-backed
+# classes that use this module
+
+class PromptLookupDrafter:
+    # Drafts the tokens that followed the latest earlier occurrence of the
+    # context's last n-gram (longest n first). Generated Cypher copies labels,
+    # properties and keywords from the schema in the prompt, and answers copy
+    # values from the evidence, so such continuations are often right.
+    def __init__(self, max_ngram_size: int = 3):
+        self._max_ngram_size = max_ngram_size
+        # n-gram -> position right after its latest occurrence
+        self._index: dict[tuple, int] = {}
+        self._indexed = 0
+
+    def propose(self, tokens: list[int], count: int) -> list[int]:
+        # index every n-gram that ends before the last token, so the lookup
+        # of the context's own suffix finds an earlier occurrence
+        for end in range(max(self._indexed, 1), len(tokens)):
+            for n in range(1, min(self._max_ngram_size, end) + 1):
+                self._index[tuple(tokens[end - n:end])] = end
+        self._indexed = max(self._indexed, len(tokens))
+
+        for n in range(min(self._max_ngram_size, len(tokens)), 0, -1):
+            position = self._index.get(tuple(tokens[-n:]))
+            if position is not None:
+                return tokens[position:position + count]
+        return []
+
+class DraftModel:
+    # A small model with the target's tokenizer, loaded on first use and
+    # shared by the drafters of concurrent generations.
+    def __init__(self, model_name: str, component: str, model=None):
+        self._model_name = model_name
+        self._component = component
+        self._model = model
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._model is None:
+                with startup_timer(f"{self._component}.draft_model"):
+                    self._model = load_causal_lm(self._model_name, f"{self._component}.draft", dtype="auto", device_map="cpu")
+            return self._model
+
+def has_sliding_window(model, cache=None) -> bool:
+    # Sliding window layers (e.g. Gemma 3's local attention, also in hybrid
+    # models) drop states past the window, so their cache cannot be cropped
+    # back once the context is longer than the window.
+    if cache is not None and any(getattr(layer, "is_sliding", False) for layer in getattr(cache, "layers", [])):
+        return True
+    config = model.config.get_text_config() if hasattr(model.config, "get_text_config") else model.config
+    if not getattr(config, "sliding_window", None):
+        return False
+    layer_types = getattr(config, "layer_types", None)
+    return layer_types is None or "sliding_attention" in layer_types
+
+class DraftModelDrafter:
+    # Drafts greedily with the small model. Its KV cache follows the context:
+    # after a verification step it is cropped back to the accepted tokens, or
+    # rebuilt when the model has sliding window layers.
+    def __init__(self, draft_model: DraftModel):
+        self._model = draft_model.get()
+        self._cache = None
+        self._tokens: list[int] = []
+
+    def propose(self, tokens: list[int], count: int) -> list[int]:
+        import torch
+        from transformers import DynamicCache
+
+        if self._cache is None:
+            self._cache = DynamicCache(config=self._model.config)
+        common = 0
+        for cached, token in zip(self._tokens, tokens):
+            if cached != token:
+                break
+            common += 1
+        # at least one token is fed, so there are logits to draft from
+        common = min(common, len(tokens) - 1)
+        if common < self._cache.get_seq_length() and has_sliding_window(self._model, self._cache):
+            self._cache = DynamicCache(config=self._model.config)
+            common = 0
+        else:
+            self._cache.crop(common)
+        self._tokens = list(tokens[:common])
+
+        draft = []
+        pending = tokens[common:]
+        with torch.no_grad():
+            while len(draft) < count:
+                logits = self._model(
+                    input_ids=torch.tensor([pending], device=self._model.device),
+                    past_key_values=self._cache,
+                    use_cache=True,
+                ).logits
+                self._tokens += pending
+                token = int(logits[0, -1].argmax())
+                draft.append(token)
+                pending = [token]
+        return draft
+
+class SpeculativeDecoder:
+    # Greedy decoding that lets the target model verify several drafted
+    # tokens per forward pass. The drafted tokens are accepted up to the
+    # first one that differs from the target's own argmax, and the target's
+    # token at that position is taken instead, so the output is the one plain
+    # greedy decoding produces. The target's KV cache is cropped back to the
+    # accepted tokens after each step. Batch size 1 only. Models with sliding
+    # window layers, whose cache cannot be cropped, fall back to
+    # model.generate().
+    def __init__(self, drafter_factory, max_draft_tokens: int = 8, strategy: str = "prompt_lookup"):
+        # `drafter_factory()` returns a fresh drafter (an object with
+        # propose(tokens, count) -> tokens) for every generation
+        self._drafter_factory = drafter_factory
+        self._max_draft_tokens = max_draft_tokens
+        self.strategy = strategy
+        self._lock = threading.Lock()
+        self._stats = {
+            "generations": 0,
+            "generated_tokens": 0,
+            "forward_passes": 0,
+            "drafted_tokens": 0,
+            "accepted_tokens": 0,
+            # seconds after the first token
+            "decode_time": 0.0,
+            # target passes without a draft, i.e. plain decoding steps
+            "plain_steps": 0,
+            "plain_step_time": 0.0,
+            # generations handed to model.generate() (sliding window models)
+            "fallbacks": 0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Config, component: str):
+        # `component` is "text_to_cypher" or "answer"; None when it is off
+        settings = config.get_speculative_settings()
+        strategy = settings[component]
+        if strategy == "off":
+            return None
+        max_draft_tokens = settings["max_draft_tokens"]
+        if strategy == "prompt_lookup":
+            max_ngram_size = settings["max_ngram_size"]
+            return cls(lambda: PromptLookupDrafter(max_ngram_size), max_draft_tokens, strategy)
+        if strategy == "draft_model":
+            model_name = settings[f"{component}_draft_model"]
+            if not model_name:
+                raise ValueError(f"[speculative] {component}_draft_model is required for the draft_model strategy")
+            draft_model = DraftModel(model_name, component)
+            return cls(lambda: DraftModelDrafter(draft_model), max_draft_tokens, strategy)
+        raise ValueError(f"unknown speculative decoding strategy {strategy!r} for {component}")
+
+    def _logits_processor(self, model):
+        # generate() applies the repetition penalty of the generation config
+        # to greedy decoding as well, so verification has to, too
+        from transformers import LogitsProcessorList, RepetitionPenaltyLogitsProcessor
+
+        processors = LogitsProcessorList()
+        penalty = getattr(model.generation_config, "repetition_penalty", None)
+        if penalty is not None and penalty != 1.0:
+            processors.append(RepetitionPenaltyLogitsProcessor(penalty))
+        return processors
+
+    def generate(
+        self,
+        model,
+        input_ids,
+        attention_mask=None,
+        past_key_values=None,
+        max_new_tokens: int = 256,
+        eos_token_id=None,
+        stopping_criteria=None,
+        streamer=None,
+        **kwargs,
+    ):
+        # Same inputs and output as model.generate() for one sequence: the
+        # prompt followed by the generated ids. `past_key_values` may hold a
+        # prefix of the prompt (the prefix cache). Other generate() arguments
+        # (sampling settings, pad token) are ignored: decoding is greedy.
+        import torch
+        from transformers import DynamicCache
+
+        if has_sliding_window(model, past_key_values):
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            return model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                max_new_tokens=max_new_tokens,
+                eos_token_id=eos_token_id,
+                stopping_criteria=stopping_criteria,
+                streamer=streamer,
+                **kwargs,
+            )
+        if input_ids.shape[0] != 1:
+            raise ValueError("speculative decoding supports one sequence at a time")
+        if eos_token_id is None:
+            eos_token_id = model.generation_config.eos_token_id
+        eos = set(eos_token_id if isinstance(eos_token_id, (list, tuple)) else [eos_token_id])
+        eos.discard(None)
+        processors = self._logits_processor(model)
+        drafter = self._drafter_factory()
+        cache = past_key_values if past_key_values is not None else DynamicCache(config=model.config)
+        device = input_ids.device
+
+        tokens = input_ids[0].tolist()
+        prompt_length = len(tokens)
+        stats = {key: 0 for key in ("forward_passes", "drafted_tokens", "accepted_tokens", "plain_steps")}
+        plain_step_time = 0.0
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+
+        def next_tokens(logits, draft: list[int]):
+            # greedy choice after the context and after each drafted token
+            if not processors:
+                return logits[0].argmax(-1).tolist()
+            sequence = torch.tensor([tokens + draft], device=device)
+            context_length = len(tokens)
+            return [
+                int(processors(sequence[:, :context_length + i], logits[:, i].float()).argmax(-1))
+                for i in range(logits.shape[1])
+            ]
+
+        def emit(new_tokens: list[int]) -> bool:
+            # appends tokens one at a time and checks for the end after each,
+            # like generate(); True when done
+            sequence = torch.tensor([tokens + new_tokens], device=device)
+            for token in new_tokens:
+                tokens.append(token)
+                if streamer is not None:
+                    streamer.put(torch.tensor([token]))
+                done = token in eos or len(tokens) - prompt_length >= max_new_tokens
+                if stopping_criteria is not None:
+                    done = bool(stopping_criteria(sequence[:, :len(tokens)], None).all()) or done
+                if done:
+                    return True
+            return False
+
+        try:
+            with torch.no_grad():
+                cached = cache.get_seq_length()
+                logits = model(input_ids=input_ids[:, cached:], past_key_values=cache, use_cache=True).logits
+                stats["forward_passes"] += 1
+                done = emit(next_tokens(logits[:, -1:], []))
+                # after the prefill, which speculation does not change
+                decode_start = time.perf_counter()
+                while not done:
+                    # the last token is not in the cache yet and is fed with the draft
+                    remaining = max_new_tokens - (len(tokens) - prompt_length)
+                    draft = drafter.propose(tokens, min(self._max_draft_tokens, remaining - 1)) if remaining > 1 else []
+                    cached = len(tokens) - 1
+                    step_start = time.perf_counter()
+                    logits = model(
+                        input_ids=torch.tensor([[tokens[-1]] + draft], device=device),
+                        past_key_values=cache,
+                        use_cache=True,
+                    ).logits
+                    predicted = next_tokens(logits, draft)
+                    accepted = 0
+                    while accepted < len(draft) and draft[accepted] == predicted[accepted]:
+                        accepted += 1
+                    cache.crop(cached + 1 + accepted)
+                    stats["forward_passes"] += 1
+                    stats["drafted_tokens"] += len(draft)
+                    stats["accepted_tokens"] += accepted
+                    if not draft:
+                        stats["plain_steps"] += 1
+                        plain_step_time += time.perf_counter() - step_start
+                    done = emit(draft[:accepted] + [predicted[accepted]])
+        finally:
+            if streamer is not None:
+                streamer.end()
+
+        decode_time = time.perf_counter() - decode_start
+        generated = len(tokens) - prompt_length
+        with self._lock:
+            self._stats["generations"] += 1
+            self._stats["generated_tokens"] += generated
+            self._stats["decode_time"] += decode_time
+            self._stats["plain_step_time"] += plain_step_time
+            for key, value in stats.items():
+                self._stats[key] += value
+        telemetry.increment("rag_speculative_tokens_total", stats["drafted_tokens"], result="drafted")
+        telemetry.increment("rag_speculative_tokens_total", stats["accepted_tokens"], result="accepted")
+        span = telemetry.current_span()
+        if span is not None:
+            span.set("forward_passes", stats["forward_passes"])
+            span.set("accepted_tokens", stats["accepted_tokens"])
+        return torch.tensor([tokens], device=device)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["strategy"] = self.strategy
+        stats["acceptance_rate"] = stats["accepted_tokens"] / stats["drafted_tokens"] if stats["drafted_tokens"] else 0.0
+        stats["tokens_per_forward"] = stats["generated_tokens"] / stats["forward_passes"] if stats["forward_passes"] else 0.0
+        # time plain decoding of the tokens after the first would have taken
+        # at the measured cost of a single-token step, over the time taken
+        plain_steps = stats.pop("plain_steps")
+        plain_step_time = stats.pop("plain_step_time")
+        if plain_steps and stats["decode_time"]:
+            decoded = stats["generated_tokens"] - stats["generations"]
+            stats["estimated_speedup"] = decoded * plain_step_time / plain_steps / stats["decode_time"]
+        else:
+            stats["estimated_speedup"] = None
+        return stats
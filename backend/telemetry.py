@@ -0,0 +1,305 @@
+import contextvars
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from backend.config import Config
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+# name -> (type, help text, buckets)
+METRICS = {
+    "rag_span_seconds": ("histogram", "Duration of traced spans.", SECONDS_BUCKETS),
+    "rag_prompt_tokens": ("histogram", "Prompt tokens sent to a model.", TOKEN_BUCKETS),
+    "rag_generated_tokens": ("histogram", "Tokens generated by a model.", TOKEN_BUCKETS),
+    "rag_db_rows": ("histogram", "Rows returned by a Cypher query.", ROW_BUCKETS),
+    "rag_cache_lookups_total": ("counter", "Cache lookups by cache and result.", None),
+    "rag_requests_total": ("counter", "Requests handled by stage and status.", None),
+    "rag_validation_total": ("counter", "Generated Cypher checked before execution, by result.", None),
+    "rag_hedged_candidates_total": ("counter", "Hedged Cypher candidates that did not win, by outcome.", None),
+    "rag_llm_requests_total": ("counter", "LLM API calls by outcome, retries included.", None),
+    "rag_speculative_tokens_total": ("counter", "Speculative decoding tokens drafted and accepted.", None),
+}
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    def __init__(self, telemetry, name: str, parent, attributes: dict, export: bool = True):
+        self._telemetry = telemetry
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        # a root span with export=False only feeds the metrics
+        self.export = export
+        self.children = []
+        self.error = None
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self._token = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def end(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+            self._telemetry._finish(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_span.reset(self._token)
+        if exc_value is not None:
+            self.error = f"{exc_type.__name__}: {exc_value}"
+        self.end()
+
+    def to_dict(self):
+        span = {
+            "name": self.name,
+            "start": self.start_time,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+        if self.error:
+            span["error"] = self.error
+        return span
+
+    def breakdown(self, depth: int = 0):
+        # flattened (depth, name, milliseconds) rows for display
+        rows = [(depth, self.name, (self.duration or 0.0) * 1000)]
+        for child in self.children:
+            rows += child.breakdown(depth + 1)
+        return rows
+
+class _NoopSpan:
+    # returned when telemetry is disabled so call sites cost one branch
+    name = None
+    attributes = {}
+
+    def set(self, key: str, value):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def breakdown(self, depth: int = 0):
+        return []
+
+_NOOP_SPAN = _NoopSpan()
+
+class Telemetry:
+    def __init__(self, enabled: bool = False, exporters: list | None = None):
+        self.enabled = enabled
+        self._exporters = exporters or []
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, list]] = {}
+
+    def add_exporter(self, exporter):
+        self._exporters.append(exporter)
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, _current_span.get(), attributes)
+
+    def start_span(self, name: str, **attributes):
+        # for work that outlives a with-block (lazy iterators); call end()
+        return self.span(name, **attributes)
+
+    def background_span(self, name: str, **attributes):
+        # for background loops (refresh polls): timed in rag_span_seconds and
+        # exported only as part of a request that runs it, so a poll every
+        # second does not drown the request traces
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, _current_span.get(), attributes, export=False)
+
+    def record_span(self, name: str, duration: float, **attributes):
+        # child span for an interval measured elsewhere (e.g. on a worker thread)
+        if not self.enabled:
+            return
+        span = Span(self, name, _current_span.get(), attributes)
+        span.start_time -= duration
+        span.duration = duration
+        self._finish(span)
+
+    def _finish(self, span: Span):
+        self.observe("rag_span_seconds", span.duration, span=span.name)
+        if span.parent is not None:
+            span.parent.children.append(span)
+        elif span.export:
+            for exporter in self._exporters:
+                exporter.export(span)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        buckets = METRICS[name][2]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # per-bucket counts, then sum and count
+            state = series.setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render_prometheus(self) -> str:
+        def format_labels(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+        lines = []
+        with self._lock:
+            for name, series in self._counters.items():
+                lines += [f"# HELP {name} {METRICS[name][1]}", f"# TYPE {name} counter"]
+                lines += [f"{name}{format_labels(labels)} {value}" for labels, value in series.items()]
+            for name, series in self._histograms.items():
+                buckets = METRICS[name][2]
+                lines += [f"# HELP {name} {METRICS[name][1]}", f"# TYPE {name} histogram"]
+                for labels, state in series.items():
+                    for bound, count in zip(buckets, state):
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {state[-1]}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {state[-2]}")
+                    lines.append(f"{name}_count{format_labels(labels)} {state[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def get_stats(self):
+        with self._lock:
+            counters = {name: {str(dict(k)): v for k, v in series.items()} for name, series in self._counters.items()}
+            histograms = {
+                name: {str(dict(k)): {"count": state[-1], "avg": state[-2] / state[-1]} for k, state in series.items()}
+                for name, series in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def close(self):
+        for exporter in self._exporters:
+            exporter.close()
+
+class JsonlExporter:
+    # one finished request trace (root span with nested children) per line
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class PrometheusExporter:
+    # serves the metrics registry in Prometheus text format on /metrics
+    def __init__(self, telemetry: Telemetry, port: int, host: str = "0.0.0.0"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        # metrics are pulled by the scraper
+        pass
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+_telemetry = Telemetry()
+
+def get_telemetry() -> Telemetry:
+    return _telemetry
+
+def configure_telemetry(config: Config) -> Telemetry:
+    global _telemetry
+    settings = config.get_telemetry_settings()
+    _telemetry.close()
+    telemetry = Telemetry(enabled=settings["enabled"])
+    if settings["enabled"]:
+        if settings["jsonl_path"]:
+            telemetry.add_exporter(JsonlExporter(settings["jsonl_path"]))
+        if settings["prometheus_port"]:
+            telemetry.add_exporter(PrometheusExporter(telemetry, settings["prometheus_port"]))
+    _telemetry = telemetry
+    return telemetry
+
+# shortcuts for call sites, bound to the configured instance
+
+def span(name: str, **attributes):
+    return _telemetry.span(name, **attributes)
+
+def start_span(name: str, **attributes):
+    return _telemetry.start_span(name, **attributes)
+
+def background_span(name: str, **attributes):
+    return _telemetry.background_span(name, **attributes)
+
+def record_span(name: str, duration: float, **attributes):
+    _telemetry.record_span(name, duration, **attributes)
+
+def current_span():
+    return _current_span.get()
+
+class use_span:
+    # makes `span` the parent of spans opened in another thread or task
+    def __init__(self, span):
+        self._span = span
+        self._token = None
+
+    def __enter__(self):
+        if isinstance(self._span, Span):
+            self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._token is not None:
+            _current_span.reset(self._token)
+
+def increment(name: str, value: float = 1, **labels):
+    _telemetry.increment(name, value, **labels)
+
+def observe(name: str, value: float, **labels):
+    _telemetry.observe(name, value, **labels)
@@ -1,5 +1,10 @@
-from openai import OpenAI
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from backend import telemetry
 from backend.config import Config
+from backend.llm_client import LLMClient
+from backend.schema_index import SchemaIndex
 
 EXAMPLES = """
     Question: List all players and their total victory points.
@@ -27,19 +32,29 @@ EXAMPLES = """
             RETURN h, p;
 """
 
+def _successful(results: list) -> list[str]:
+    # the candidates whose requests succeeded; the first error only when all failed
+    candidates = [result for result in results if not isinstance(result, BaseException)]
+    if results and not candidates:
+        raise results[0]
+    return candidates
+
 class TextToCypher:
     def __init__(
         self,
         schema: str,
         config: Config,
         model: str = "kwaipilot/kat-coder-pro:free",
+        schema_index: SchemaIndex | None = None,
+        llm_client: LLMClient | None = None,
     ):
+        # `llm_client` adds pooling, deadlines, retries, rate limiting and
+        # hedging to the OpenRouter calls; by default it is built from the
+        # [llm_client] settings
         self._schema = schema
+        self._schema_index = schema_index
         self._model = model
-        self._client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=config.get_openai_key(),
-        )
+        self._client = llm_client or LLMClient.from_config(config)
 
         self._instruction = (
             "You are an expert Neo4j Cypher generator.\n"
@@ -59,6 +74,11 @@ class TextToCypher:
             "Cypher:"
         )
 
+    def get_schema(self, question: str) -> str:
+        if self._schema_index is None:
+            return self._schema
+        return self._schema_index.render_for(question)
+
     def prepare_chat_prompt(
         self,
         question: str,
@@ -99,27 +119,115 @@ class TextToCypher:
         output_cypher = output_cypher.replace("\\n", " ")
         return output_cypher.strip()
 
+    def get_client_stats(self):
+        return self._client.get_stats()
+
+    def record_usage(self, response, span):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        span.set("prompt_tokens", usage.prompt_tokens)
+        span.set("generated_tokens", usage.completion_tokens)
+        telemetry.observe("rag_prompt_tokens", usage.prompt_tokens, stage="cypher")
+        telemetry.observe("rag_generated_tokens", usage.completion_tokens, stage="cypher")
+
+    def _build_messages(self, question: str) -> list[dict]:
+        with telemetry.span("cypher.prompt_build"):
+            return self.prepare_chat_prompt(
+                question=question,
+                schema=self.get_schema(question),
+            )
+
+    def _complete(self, messages: list[dict], temperature: float = 0.1) -> str:
+        with telemetry.span("cypher.api_call", model=self._model, temperature=temperature) as span:
+            response = self._client.chat(
+                model=self._model,
+                messages=messages,
+                temperature=temperature,
+            )
+            self.record_usage(response, span)
+
+            raw_output = response.choices[0].message.content or ""
+            processed_output = self.postprocess_output_cypher(raw_output)
+            span.set("cypher", processed_output)
+        return processed_output
+
     def __call__(
         self,
         question: str,
     ):
-        messages = self.prepare_chat_prompt(
-            question=question,
-            schema=self._schema,
-        )
+        return [self._complete(self._build_messages(question))]
+
+    def generate_candidates(self, question: str, count: int, temperature: float = 0.8) -> list[str]:
+        # `count` alternative queries for the same question from parallel
+        # requests (OpenRouter ignores `n` for most models): the usual
+        # low-temperature one first, then sampled ones
+        messages = self._build_messages(question)
+        temperatures = [0.1] + [temperature] * (count - 1)
+        with ThreadPoolExecutor(max_workers=count, thread_name_prefix="cypher-candidate") as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._complete, messages, t) for t in temperatures
+            ]
+        return _successful([future.exception() or future.result() for future in futures])
+
+class AsyncTextToCypher(TextToCypher):
+    # Same prompts and post-processing, but calls OpenRouter through the
+    # async client so many questions can be in flight on one event loop.
+    def __init__(
+        self,
+        schema: str,
+        config: Config,
+        model: str = "kwaipilot/kat-coder-pro:free",
+        schema_index: SchemaIndex | None = None,
+        llm_client: LLMClient | None = None,
+    ):
+        super().__init__(schema, config, model=model, schema_index=schema_index, llm_client=llm_client)
+
+    async def _complete(self, messages: list[dict], temperature: float = 0.1) -> str:
+        with telemetry.span("cypher.api_call", model=self._model, temperature=temperature) as span:
+            response = await self._client.chat_async(
+                model=self._model,
+                messages=messages,
+                temperature=temperature,
+            )
+            self.record_usage(response, span)
+
+            raw_output = response.choices[0].message.content or ""
+            processed_output = self.postprocess_output_cypher(raw_output)
+            span.set("cypher", processed_output)
+        return processed_output
+
+    async def __call__(
+        self,
+        question: str,
+    ):
+        return [await self._complete(self._build_messages(question))]
 
-        response = self._client.chat.completions.create(
-            model=self._model,
-            messages=messages,
-            temperature=0.1,
+    async def generate_candidates(self, question: str, count: int, temperature: float = 0.8) -> list[str]:
+        messages = self._build_messages(question)
+        temperatures = [0.1] + [temperature] * (count - 1)
+        return _successful(
+            await asyncio.gather(*(self._complete(messages, t) for t in temperatures), return_exceptions=True)
         )
 
-        raw_output = response.choices[0].message.content or ""
-        processed_output = self.postprocess_output_cypher(raw_output)
-
-        print("Raw generated text:", raw_output)
-        print("Post-processed Cypher:", processed_output)
-
-        return [processed_output]
-
-
+    async def stream_candidates(self, question: str, count: int, temperature: float = 0.8):
+        # the candidates of generate_candidates() in the order their requests
+        # finish, so the first can run while slower ones are still sampled;
+        # closing the iterator cancels the requests still in flight
+        messages = self._build_messages(question)
+        temperatures = [0.1] + [temperature] * (count - 1)
+        tasks = [asyncio.ensure_future(self._complete(messages, t)) for t in temperatures]
+        errors = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    candidate = await next_done
+                except Exception as error:
+                    errors.append(error)
+                    continue
+                yield candidate
+        finally:
+            for task in tasks:
+                task.cancel()
+        if errors and len(errors) == len(tasks):
+            raise errors[0]
@@ -1,34 +1,52 @@
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    BitsAndBytesConfig,
-)
-import torch
+from functools import partial
+from backend import telemetry
 from backend.config import Config
+from backend.model_loading import load_causal_lm, load_tokenizer, startup_timer
+from backend.prefix_cache import PROMPT_SENTINEL, PrefixCache, split_static_prefix
+from backend.schema_index import SchemaIndex
+from backend.speculative import SpeculativeDecoder
 
 class TextToCypher:
-    def __init__(self, schema: str, config: Config, model: str = "neo4j/text-to-cypher-Gemma-3-4B-Instruct-2025.04.0"):
+    def __init__(
+        self,
+        schema: str,
+        config: Config,
+        model: str = "neo4j/text-to-cypher-Gemma-3-4B-Instruct-2025.04.0",
+        use_prefix_cache: bool = True,
+        schema_index: SchemaIndex | None = None,
+    ):
         self._schema = schema
+        self._schema_index = schema_index
         self._config = config
+        import torch
+        from transformers import BitsAndBytesConfig
+
         bnb_config = BitsAndBytesConfig(
             load_in_4bit=True,
             bnb_4bit_use_double_quant=True,
             bnb_4bit_quant_type="nf4",
             bnb_4bit_compute_dtype=torch.bfloat16,
         )
-        self._tokenizer = AutoTokenizer.from_pretrained(model)
-        self._model = AutoModelForCausalLM.from_pretrained(
+        self._tokenizer = load_tokenizer(model, "text_to_cypher")
+        self._model = load_causal_lm(
             model,
+            "text_to_cypher",
+            use_safetensors=None,
             quantization_config=bnb_config,
             dtype=torch.bfloat16,
             attn_implementation="eager",
-            low_cpu_mem_usage=True,
         )
         self._instruction = (
             "Generate Cypher statement to query a graph database. "
             "Use only the provided relationship types and properties in the schema. \n"
             "Schema: {schema} \n Question: {question}  \n Cypher output: "
         )
+        self._prefix_cache = PrefixCache(self._model, self._tokenizer) if use_prefix_cache else None
+        if self._prefix_cache is not None:
+            with startup_timer("text_to_cypher.prefix_cache"):
+                self._prefix_cache.warm(self.get_prompt_prefix())
+        # decoding is greedy, so speculative decoding gives the same Cypher
+        self._speculative = SpeculativeDecoder.from_config(config, "text_to_cypher")
     
     def prepare_chat_prompt(self, question, schema) -> list[dict]:
         chat = [
@@ -41,6 +59,34 @@ class TextToCypher:
         ]
         return chat
     
+    def get_schema(self, question: str) -> str:
+        if self._schema_index is None:
+            return self._schema
+        return self._schema_index.render_for(question)
+
+    def build_prompt(self, question: str, schema: str | None = None) -> str:
+        if schema is None:
+            schema = self.get_schema(question)
+        new_message = self.prepare_chat_prompt(question=question, schema=schema)
+        return self._tokenizer.apply_chat_template(new_message, add_generation_prompt=True, tokenize=False)
+
+    def get_prompt_prefix(self) -> str:
+        # instruction and schema: identical for every question, unless the
+        # schema is pruned per question and the prefix stops before it
+        if self._schema_index is not None:
+            return split_static_prefix(self.build_prompt("", schema=PROMPT_SENTINEL))
+        return split_static_prefix(self.build_prompt(PROMPT_SENTINEL))
+
+    def get_prefix_cache_stats(self):
+        if self._prefix_cache is None:
+            return None
+        return self._prefix_cache.get_stats()
+
+    def get_speculative_stats(self):
+        if self._speculative is None:
+            return None
+        return self._speculative.get_stats()
+
     def postprocess_output_cypher(self, output_cypher: str) -> str:
         partition_by = "**Explanation:**"
         output_cypher, _, _ = output_cypher.partition(partition_by)
@@ -50,10 +96,53 @@ class TextToCypher:
         output_cypher = output_cypher.replace("\\n", " ")
         return output_cypher
 
+    def _prepare_inputs(self, prompts: list[str]):
+        with telemetry.span("cypher.tokenize", batch_size=len(prompts)) as span:
+            inputs = None
+            if self._prefix_cache is not None:
+                inputs = self._prefix_cache.prepare_inputs(self.get_prompt_prefix(), prompts)
+            if inputs is None:
+                inputs = self._tokenizer(prompts, return_tensors="pt", padding=True).to(self._model.device)
+            span.set("prompt_tokens", inputs["input_ids"].shape[1])
+        telemetry.observe("rag_prompt_tokens", inputs["input_ids"].shape[1], stage="cypher")
+        return inputs
+
+    def generate_candidates(self, question: str, count: int, temperature: float = 0.8) -> list[str]:
+        # the greedy query first, then `count - 1` sampled ones decoded
+        # together as one batch
+        import torch
+
+        candidates = self(question)
+        if count < 2:
+            return candidates
+        with telemetry.span("cypher.prompt_build"):
+            prompt = self.build_prompt(question)
+        # identical rows, so there is no padding
+        inputs = self._prepare_inputs([prompt] * (count - 1))
+        with telemetry.span("cypher.sample", candidates=count - 1) as span:
+            with torch.no_grad():
+                tokens = self._model.generate(
+                    **inputs,
+                    do_sample=True,
+                    temperature=temperature,
+                    top_p=0.9,
+                    max_new_tokens=256,
+                    pad_token_id=self._tokenizer.eos_token_id,
+                )
+            tokens = tokens[:, inputs["input_ids"].shape[1]:]
+            raw_outputs = self._tokenizer.batch_decode(tokens, skip_special_tokens=True)
+            sampled = [self.postprocess_output_cypher(output) for output in raw_outputs]
+            span.set("cypher", sampled)
+        return candidates + sampled
+
     def __call__(self, question: str):
-        new_message = self.prepare_chat_prompt(question=question, schema=self._schema)
-        prompt = self._tokenizer.apply_chat_template(new_message, add_generation_prompt=True, tokenize=False)
-        inputs = self._tokenizer(prompt, return_tensors="pt", padding=True)
+        import torch
+        from transformers import StoppingCriteriaList
+        from backend.generation import TokenTimer
+
+        with telemetry.span("cypher.prompt_build"):
+            prompt = self.build_prompt(question)
+        inputs = self._prepare_inputs([prompt])
 
         model_generate_parameters = {
             "top_p": 0.9,
@@ -63,14 +152,18 @@ class TextToCypher:
             "pad_token_id": self._tokenizer.eos_token_id,
         }
 
-        inputs.to(self._model.device)
-        self._model.eval()
-        with torch.no_grad():
-            tokens = self._model.generate(**inputs, **model_generate_parameters)
-            tokens = tokens[:, inputs.input_ids.shape[1] :]
-            raw_outputs = self._tokenizer.batch_decode(tokens, skip_special_tokens=True)
-            outputs = [self.postprocess_output_cypher(output) for output in raw_outputs]
-
-        print("Raw generated text:", raw_outputs)
-        print("Post-processed Cypher:", outputs)
+        with telemetry.span("cypher.generate") as span:
+            timer = TokenTimer()
+            with torch.no_grad():
+                generate = self._model.generate
+                if self._speculative is not None:
+                    generate = partial(self._speculative.generate, self._model)
+                tokens = generate(**inputs, **model_generate_parameters, stopping_criteria=StoppingCriteriaList([timer]))
+                tokens = tokens[:, inputs["input_ids"].shape[1] :]
+                raw_outputs = self._tokenizer.batch_decode(tokens, skip_special_tokens=True)
+                outputs = [self.postprocess_output_cypher(output) for output in raw_outputs]
+            timer.record("cypher")
+            span.set("generated_tokens", tokens.shape[1])
+            span.set("cypher", outputs)
+        telemetry.observe("rag_generated_tokens", tokens.shape[1], stage="cypher")
         return outputs
@@ -0,0 +1,389 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from backend import telemetry
+from backend.config import Config
+from backend.cypher_utils import render_parameters
+from backend.database import GraphDatabaseDriver
+from backend.embeddings import HashingEmbedder, cosine_top_k
+from backend.schema_index import SchemaIndex
+
+_CAMEL_CASE_PATTERN = re.compile(r"(?<=[a-z])(?=[A-Z])")
+_WORD_PATTERN = re.compile(r"[a-z0-9:]+")
+
+# questions about what something is or does, rather than about the game state
+DESCRIPTIVE_PATTERN = re.compile(
+    r"\b(what (is|are|does|do|happens)|explain|describe|meaning|definition|tell me about|"
+    r"how (does|do|is|can)|rules?|allowed|can (i|you|a|players?))\b",
+    re.I,
+)
+STATE_PATTERN = re.compile(
+    r"\b(how many|how much|which players?|who|whose|currently|right now|own|owns|holds?|has|have)\b",
+    re.I,
+)
+
+# question words that say nothing about which node is meant
+_STOP_WORDS = {
+    "a", "an", "the", "of", "to", "in", "on", "for", "and", "or", "is", "are", "be",
+    "what", "does", "do", "how", "can", "i", "you", "me", "about", "tell", "explain",
+    "describe", "work", "works", "mean", "means", "meaning", "happens", "when", "it",
+}
+
+NODES_QUERY = (
+    "MATCH (n) WHERE any(l IN labels(n) WHERE l IN $labels) "
+    "RETURN elementId(n) AS id, labels(n) AS labels, properties(n) AS properties"
+)
+
+# the retrieved nodes in rank order, each with a few of its neighbours
+EXPANSION_QUERY = """UNWIND range(0, size($ids) - 1) AS rank
+MATCH (n) WHERE elementId(n) = $ids[rank]
+OPTIONAL MATCH (n)-[r]-(m)
+WITH rank, n, collect(CASE WHEN r IS NULL THEN NULL ELSE {
+    relationship: type(r), outgoing: startNode(r) = n,
+    node: coalesce(m.name, m.id, m.value), properties: properties(r)
+} END)[..$max_related] AS related
+RETURN labels(n)[0] AS label, properties(n) AS properties, related
+ORDER BY rank"""
+
+def _prepare(text: str) -> str:
+    words = _WORD_PATTERN.findall(_CAMEL_CASE_PATTERN.sub(" ", text).lower())
+    return " ".join(word for word in words if word not in _STOP_WORDS)
+
+class VectorHit:
+    def __init__(self, node_id: str, label: str, name: str, score: float):
+        # `node_id` is the Neo4j elementId
+        self.node_id = node_id
+        self.label = label
+        self.name = name
+        self.score = score
+
+class RetrievalMatch:
+    def __init__(self, hits: list[VectorHit], max_related: int):
+        self.hits = hits
+        self.parameters = {"ids": [hit.node_id for hit in hits], "max_related": max_related}
+
+    @property
+    def cypher(self) -> str:
+        return render_parameters(EXPANSION_QUERY, self.parameters)
+
+class VectorIndex:
+    # Embeds the text properties of descriptive nodes (rules, development
+    # card types, trophies, ...) and answers questions about them by cosine
+    # similarity instead of LLM-written `CONTAINS` filters. The vectors are a
+    # float32 matrix in a memory-mapped file under `path` (in memory without
+    # one), one row per node; the row of a node whose text changed is
+    # re-embedded in place, rows of removed nodes are zeroed and reused. A
+    # refresh every `refresh_interval_seconds` compares the graph version
+    # token (or, without one, the text hashes) with the last one.
+    VECTORS_FILE = "vectors.f32"
+    META_FILE = "index.json"
+
+    def __init__(
+        self,
+        text_properties: dict[str, list[str]],
+        path: str | None = None,
+        embedder: HashingEmbedder | None = None,
+        top_k: int = 3,
+        similarity_threshold: float = 0.15,
+        max_related: int = 10,
+        refresh_interval_seconds: float = 60.0,
+        driver_factory=None,
+    ):
+        # label -> properties whose values are embedded
+        self._text_properties = text_properties
+        self._path = path
+        self._embedder = embedder or HashingEmbedder()
+        self._top_k = top_k
+        self._similarity_threshold = similarity_threshold
+        self._max_related = max_related
+        self._refresh_interval = refresh_interval_seconds
+        # () -> GraphDatabaseDriver
+        self._driver_factory = driver_factory
+        self._signature = f"{type(self._embedder).__name__}:{self._embedder.dim}"
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._vectors = np.zeros((0, self._embedder.dim), dtype=np.float32)
+        # per row: element id, label, name and text hash; None for free rows
+        self._ids: list[str | None] = []
+        self._labels: list[str | None] = []
+        self._names: list[str | None] = []
+        self._hashes: list[str | None] = []
+        self._rows: dict[str, int] = {}
+        self._version = None
+        self._refreshed_at = None
+        self._stats = {
+            "lookups": 0,
+            "routed": 0,
+            "not_descriptive": 0,
+            "below_threshold": 0,
+            "match_time": 0.0,
+            "refreshes": 0,
+            "unchanged_refreshes": 0,
+            "embedded": 0,
+            "removed": 0,
+            "refresh_errors": 0,
+            "last_error": None,
+            "last_refresh_time": 0.0,
+        }
+        self._load()
+
+    @classmethod
+    def from_config(cls, config: Config, schema: str, driver_factory=None):
+        settings = config.get_vector_index_settings()
+        if not settings["enabled"]:
+            return None
+        # the STRING properties of the configured labels, ids aside
+        schema_index = SchemaIndex(schema)
+        text_properties = {}
+        for label in settings["labels"]:
+            properties = [
+                name for name, kind in schema_index.get_property_types(label).items()
+                if kind == "STRING" and name != "id"
+            ]
+            if properties:
+                text_properties[label] = properties
+        index = cls(
+            text_properties,
+            path=settings["path"] or None,
+            embedder=HashingEmbedder(settings["n_features"]),
+            top_k=settings["top_k"],
+            similarity_threshold=settings["similarity_threshold"],
+            max_related=settings["max_related"],
+            refresh_interval_seconds=settings["refresh_interval_seconds"],
+            driver_factory=driver_factory or (lambda: GraphDatabaseDriver(config)),
+        )
+        # the fast path stays off until the graph answers; errors are in the stats
+        index.refresh()
+        return index
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self._path, name)
+
+    def _load(self):
+        # reopens the vectors of an earlier run, so a restart re-embeds only
+        # what changed since; anything inconsistent starts empty
+        if self._path is None or not os.path.exists(self._file(self.META_FILE)):
+            return
+        try:
+            with open(self._file(self.META_FILE)) as fp:
+                meta = json.load(fp)
+            capacity = meta["capacity"]
+            expected_size = capacity * self._embedder.dim * 4
+            if meta["signature"] != self._signature or os.path.getsize(self._file(self.VECTORS_FILE)) != expected_size:
+                return
+            vectors = np.memmap(self._file(self.VECTORS_FILE), dtype=np.float32, mode="r+", shape=(capacity, self._embedder.dim))
+        except (OSError, ValueError, KeyError):
+            return
+        self._vectors = vectors
+        self._ids, self._labels, self._names, self._hashes = meta["ids"], meta["labels"], meta["names"], meta["hashes"]
+        self._rows = {node_id: row for row, node_id in enumerate(self._ids) if node_id is not None}
+
+    def _save(self):
+        if self._path is None:
+            return
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        meta = {
+            "signature": self._signature,
+            "capacity": self._vectors.shape[0],
+            "ids": self._ids,
+            "labels": self._labels,
+            "names": self._names,
+            "hashes": self._hashes,
+        }
+        temporary = self._file(self.META_FILE + ".tmp")
+        with open(temporary, "w") as fp:
+            json.dump(meta, fp)
+        os.replace(temporary, self._file(self.META_FILE))
+
+    def _grow(self, rows: int):
+        # doubles the matrix (and its file) when `rows` do not fit
+        capacity = self._vectors.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 64)
+        if self._path is None:
+            vectors = np.zeros((capacity, self._embedder.dim), dtype=np.float32)
+            vectors[:len(self._ids)] = self._vectors[:len(self._ids)]
+            self._vectors = vectors
+            return
+        os.makedirs(self._path, exist_ok=True)
+        temporary = self._file(self.VECTORS_FILE + ".tmp")
+        vectors = np.memmap(temporary, dtype=np.float32, mode="w+", shape=(capacity, self._embedder.dim))
+        vectors[:len(self._ids)] = self._vectors[:len(self._ids)]
+        vectors.flush()
+        del vectors
+        os.replace(temporary, self._file(self.VECTORS_FILE))
+        self._vectors = np.memmap(self._file(self.VECTORS_FILE), dtype=np.float32, mode="r+", shape=(capacity, self._embedder.dim))
+
+    def _document(self, label: str, properties: dict) -> str:
+        values = [str(properties[name]) for name in self._text_properties[label] if properties.get(name) is not None]
+        return _prepare(" ".join([label] + values))
+
+    def refresh(self) -> bool:
+        # re-reads the indexed nodes and re-embeds the changed ones; True
+        # when the index changed. Only one refresh runs at a time.
+        if self._driver_factory is None or not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self) -> bool:
+        start = time.perf_counter()
+        with self._lock:
+            self._refreshed_at = time.monotonic()
+        try:
+            with telemetry.background_span("vector.refresh") as span, self._driver_factory() as driver:
+                version = driver.get_graph_version()
+                if version is not None and version == self._version:
+                    with self._lock:
+                        self._stats["unchanged_refreshes"] += 1
+                    span.set("changed", 0)
+                    return False
+                rows = driver.execute_query(NODES_QUERY, {"labels": list(self._text_properties)})
+                documents = {}
+                for row in rows:
+                    label = next((l for l in row["labels"] if l in self._text_properties), None)
+                    if label is not None:
+                        properties = row["properties"]
+                        documents[row["id"]] = (label, properties.get("name"), self._document(label, properties))
+                changed = self.update(documents)
+                span.set("changed", changed)
+        except Exception as error:
+            with self._lock:
+                self._stats["refresh_errors"] += 1
+                self._stats["last_error"] = str(error)
+            return False
+        with self._lock:
+            self._version = version
+            self._stats["refreshes"] += 1
+            self._stats["last_refresh_time"] = time.perf_counter() - start
+            self._stats["last_error"] = None
+        return changed > 0
+
+    def update(self, documents: dict[str, tuple]) -> int:
+        # `documents` is every indexed node: element id -> (label, name,
+        # text). Embeds new and changed texts, frees the rows of nodes that
+        # are gone. Returns the number of rows written.
+        hashes = {node_id: hashlib.sha256(text.encode("utf-8")).hexdigest() for node_id, (_, _, text) in documents.items()}
+        with self._lock:
+            changed = [
+                node_id for node_id in documents
+                if node_id not in self._rows or self._hashes[self._rows[node_id]] != hashes[node_id]
+            ]
+            removed = [node_id for node_id in self._rows if node_id not in documents]
+        if not changed and not removed:
+            return 0
+        # one vectorized pass over the changed texts, outside the lock
+        embeddings = self._embedder.embed_many([documents[node_id][2] for node_id in changed])
+
+        with self._lock:
+            for node_id in removed:
+                row = self._rows.pop(node_id)
+                self._vectors[row] = 0.0
+                self._ids[row] = self._labels[row] = self._names[row] = self._hashes[row] = None
+            free = [row for row, node_id in enumerate(self._ids) if node_id is None]
+            new_rows = sum(1 for node_id in changed if node_id not in self._rows)
+            self._grow(len(self._ids) + max(new_rows - len(free), 0))
+            for node_id, embedding in zip(changed, embeddings):
+                row = self._rows.get(node_id)
+                if row is None:
+                    if free:
+                        row = free.pop(0)
+                    else:
+                        row = len(self._ids)
+                        for column in (self._ids, self._labels, self._names, self._hashes):
+                            column.append(None)
+                    self._rows[node_id] = row
+                label, name, _ = documents[node_id]
+                self._vectors[row] = embedding
+                self._ids[row], self._labels[row], self._names[row], self._hashes[row] = node_id, label, name, hashes[node_id]
+            self._stats["embedded"] += len(changed)
+            self._stats["removed"] += len(removed)
+            self._save()
+        return len(changed) + len(removed)
+
+    def search(self, question: str, k: int | None = None) -> list[VectorHit]:
+        # top-k nodes by cosine similarity; free (zero) rows never score above 0
+        query_embedding = self._embedder.embed(_prepare(question))
+        with self._lock:
+            ranked = cosine_top_k(self._vectors[:len(self._ids)], query_embedding, k or self._top_k)
+            return [
+                VectorHit(self._ids[row], self._labels[row], self._names[row], score)
+                for row, score in ranked
+                if self._ids[row] is not None and score > 0
+            ]
+
+    def _find(self, question: str):
+        if not DESCRIPTIVE_PATTERN.search(question) or STATE_PATTERN.search(question):
+            return None, "not_descriptive"
+        hits = [hit for hit in self.search(question) if hit.score >= self._similarity_threshold]
+        if not hits:
+            return None, "below_threshold"
+        return RetrievalMatch(hits, self._max_related), "routed"
+
+    def match(self, question: str) -> RetrievalMatch | None:
+        # a parameterized expansion of the nodes a descriptive question is
+        # about, or None when the question should go to text-to-Cypher
+        start = time.perf_counter()
+        with self._lock:
+            stale = self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self._refresh_interval
+        if stale:
+            self.refresh()
+        with telemetry.span("cypher.vector") as span:
+            found, outcome = self._find(question)
+            span.set("hits", [hit.name for hit in found.hits] if found else None)
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats[outcome] += 1
+            self._stats["match_time"] += time.perf_counter() - start
+        telemetry.increment("rag_cache_lookups_total", cache="vector", result="hit" if found else "miss")
+        return found
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["nodes"] = len(self._rows)
+            stats["capacity"] = self._vectors.shape[0]
+            stats["version"] = self._version
+        stats["labels"] = list(self._text_properties)
+        match_time = stats.pop("match_time")
+        stats["avg_match_ms"] = match_time / stats["lookups"] * 1000 if stats["lookups"] else 0.0
+        stats["routed_rate"] = stats["routed"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+class RetrievingTextToCypher:
+    # Wraps any TextToCypher backend; descriptive questions the vector index
+    # answers skip it entirely.
+    def __init__(self, text_to_cypher, index: VectorIndex):
+        self._text_to_cypher = text_to_cypher
+        self._index = index
+        self.last_retrieval = None
+
+    @property
+    def index(self):
+        return self._index
+
+    def __getattr__(self, name):
+        return getattr(self._text_to_cypher, name)
+
+    def __call__(self, question: str):
+        found = self._index.match(question)
+        self.last_retrieval = found
+        if found is not None:
+            return [found.cypher]
+        return self._text_to_cypher(question)
+
+    def generate_candidates(self, question: str, count: int, temperature: float = 0.8) -> list[str]:
+        # a retrieval is the only candidate
+        found = self._index.match(question)
+        self.last_retrieval = found
+        if found is not None:
+            return [found.cypher]
+        return self._text_to_cypher.generate_candidates(question, count, temperature)
@@ -0,0 +1,183 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmark.questions import QUESTIONS
+
+QUESTION_PATTERN = re.compile(r"Question:\s*(.*?)\s*\n", re.S)
+
+def reference_answer(messages: list[dict]) -> str:
+    # the reference query of the benchmark question in the last "Question:"
+    # line (the few-shot examples come before it)
+    queries = {q.question: q.cypher for q in QUESTIONS}
+    content = messages[-1]["content"] if messages else ""
+    found = QUESTION_PATTERN.findall(content + "\n")
+    return queries.get(found[-1], "MATCH (n) RETURN count(n)") if found else "MATCH (n) RETURN count(n)"
+
+class FakeOpenAIServer:
+    # OpenAI-compatible POST /v1/chat/completions on localhost, for exercising
+    # LLMClient without network access or API keys. Faults are injected at
+    # random (seeded): a latency tail (`slow_fraction` of the requests take
+    # `slow_latency_ms`), 500/503 errors at `error_rate`, and 429 with
+    # Retry-After and X-RateLimit-* headers above `rate_limit_per_second`.
+    # Connections are kept alive, and new ones are counted, so pooling shows.
+    def __init__(
+        self,
+        answer=reference_answer,
+        latency_ms: float = 0.0,
+        slow_fraction: float = 0.0,
+        slow_latency_ms: float = 1000.0,
+        error_rate: float = 0.0,
+        rate_limit_per_second: int = 0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self._answer = answer
+        self._latency = latency_ms / 1000
+        self._slow_fraction = slow_fraction
+        self._slow_latency = slow_latency_ms / 1000
+        self._error_rate = error_rate
+        self._rate_limit = rate_limit_per_second
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = (0, 0)
+        self.stats = {"requests": 0, "connections": 0, "rate_limited": 0, "errors": 0, "slow": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="fake-openai")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _decide(self):
+        # (status, delay, headers) of the next request
+        with self._lock:
+            self.stats["requests"] += 1
+            if self._rate_limit:
+                second = int(time.time())
+                window_second, count = self._window
+                count = count + 1 if window_second == second else 1
+                self._window = (second, count)
+                if count > self._rate_limit:
+                    self.stats["rate_limited"] += 1
+                    reset = second + 1
+                    return 429, 0.0, {
+                        "Retry-After": "1",
+                        "X-RateLimit-Limit": str(self._rate_limit),
+                        "X-RateLimit-Remaining": "0",
+                        "X-RateLimit-Reset": str(reset * 1000),
+                    }
+            if self._random.random() < self._error_rate:
+                self.stats["errors"] += 1
+                return self._random.choice([500, 503]), 0.0, {}
+            delay = self._latency
+            if self._random.random() < self._slow_fraction:
+                self.stats["slow"] += 1
+                delay = self._slow_latency
+            return 200, delay, {}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.stats["connections"] += 1
+
+            def _send(self, status: int, body: dict, headers: dict):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"unknown path {self.path}"}}, {})
+                    return
+                status, delay, headers = server._decide()
+                if delay:
+                    time.sleep(delay)
+                if status != 200:
+                    self._send(status, {"error": {"message": f"injected {status}", "code": status}}, headers)
+                    return
+
+                messages = request.get("messages", [])
+                content = server._answer(messages)
+                prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+                completion_tokens = max(len(content) // 4, 1)
+                self._send(200, {
+                    "id": f"chatcmpl-fake-{server.stats['requests']}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }, headers)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server answering the benchmark questions.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--slow-fraction", type=float, default=0.05)
+    parser.add_argument("--slow-latency-ms", type=float, default=2000.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--rate-limit", type=int, default=0, help="Requests per second before 429s (0 = unlimited).")
+    args = parser.parse_args()
+    server = FakeOpenAIServer(
+        latency_ms=args.latency_ms,
+        slow_fraction=args.slow_fraction,
+        slow_latency_ms=args.slow_latency_ms,
+        error_rate=args.error_rate,
+        rate_limit_per_second=args.rate_limit,
+        port=args.port,
+    )
+    print(f"serving on {server.url} (set [llm_client] base_url to it)")
+    try:
+        server.start()._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
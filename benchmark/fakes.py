@@ -0,0 +1,92 @@
+import time
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from transformers import PreTrainedTokenizerFast, Qwen2Config, Qwen2ForCausalLM
+from backend.graph_replica import GraphSnapshot
+from backend.local_executor import UnsupportedQuery
+from benchmark.questions import BenchmarkQuestion
+
+CHAT_TEMPLATE = (
+    "{% for message in messages %}"
+    "<|im_start|>{{ message['role'] }}\n{{ message['content'] }}<|im_end|>\n"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+SPECIAL_TOKENS = ["<|endoftext|>", "<|im_start|>", "<|im_end|>"]
+
+class StubTextToCypher:
+    # Deterministic text-to-Cypher: answers every benchmark question with its
+    # reference query after an optional fixed delay standing in for the LLM.
+    def __init__(self, questions: list[BenchmarkQuestion], latency_ms: float = 0.0):
+        self._queries = {q.question: q.cypher for q in questions}
+        self._latency = latency_ms / 1000
+
+    def __call__(self, question: str):
+        if self._latency:
+            time.sleep(self._latency)
+        query = self._queries.get(question)
+        return [query] if query else []
+
+class FixtureGraphDriver:
+    # Stand-in for GraphDatabaseDriver: queries run on the local executor
+    # over the fixture graph, the same one the in-memory replica uses in
+    # production. Queries it does not support return no rows.
+    def __init__(self, snapshot: GraphSnapshot):
+        self._snapshot = snapshot
+        self.unknown_queries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def execute_query(self, query: str, parameters: dict | None = None):
+        try:
+            return self._snapshot.execute(query, parameters)
+        except UnsupportedQuery:
+            self.unknown_queries += 1
+            return []
+
+    def stream_query(self, query: str, parameters: dict | None = None):
+        return iter(self.execute_query(query, parameters))
+
+def build_tiny_tokenizer(corpus: list[str], vocab_size: int = 2048):
+    # byte-level BPE trained on the prompts themselves, so nothing is downloaded
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=SPECIAL_TOKENS,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+        show_progress=False,
+    )
+    tokenizer.train_from_iterator(corpus, trainer)
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        eos_token="<|im_end|>",
+        pad_token="<|endoftext|>",
+        chat_template=CHAT_TEMPLATE,
+        model_input_names=["input_ids", "attention_mask"],
+    )
+
+def build_tiny_model(tokenizer, hidden_size: int = 64, num_layers: int = 2, seed: int = 0):
+    # randomly initialized Qwen2 architecture: real decode loop, tiny weights
+    torch.manual_seed(seed)
+    config = Qwen2Config(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 4,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=8192,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    model = Qwen2ForCausalLM(config)
+    model.generation_config.eos_token_id = tokenizer.eos_token_id
+    model.generation_config.pad_token_id = tokenizer.pad_token_id
+    model.eval()
+    return model
@@ -0,0 +1,254 @@
+import json
+import math
+import os
+from collections import defaultdict
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "catan_graph.json")
+
+# beginner board, rows top to bottom
+_TERRAIN_ROWS = [
+    ["Mountains", "Pasture", "Forest"],
+    ["Fields", "Hills", "Pasture", "Hills"],
+    ["Fields", "Forest", "Desert", "Forest", "Mountains"],
+    ["Forest", "Mountains", "Fields", "Pasture"],
+    ["Hills", "Fields", "Pasture"],
+]
+_NUMBER_ROWS = [
+    [10, 2, 9],
+    [12, 6, 4, 10],
+    [9, 11, 0, 3, 8],
+    [8, 3, 4, 5],
+    [5, 6, 11],
+]
+_PRODUCES = {
+    "Forest": "Lumber",
+    "Hills": "Brick",
+    "Pasture": "Wool",
+    "Fields": "Grain",
+    "Mountains": "Ore",
+}
+_PROBABILITY = {1: "Low", 2: "Low-Mid", 3: "Medium", 4: "Mid-High", 5: "High", 6: "Highest"}
+# harbors clockwise around the coast; None is a generic 3:1 harbor
+_HARBORS = [None, "Wool", None, "Ore", "Grain", None, "Brick", "Lumber", None]
+_PLAYERS = [
+    ("Filbert", "Blue"),
+    ("Ivan", "Red"),
+    ("Mesach", "White"),
+    ("Adelia", "Orange"),
+]
+_HANDS = {
+    "Filbert": {"Brick": 2, "Lumber": 1, "Wool": 0, "Grain": 3, "Ore": 1},
+    "Ivan": {"Brick": 0, "Lumber": 2, "Wool": 1, "Grain": 1, "Ore": 4},
+    "Mesach": {"Brick": 1, "Lumber": 1, "Wool": 3, "Grain": 0, "Ore": 0},
+    "Adelia": {"Brick": 4, "Lumber": 0, "Wool": 2, "Grain": 2, "Ore": 1},
+}
+_DEV_CARDS = [
+    ("dc_ivan_1", "Ivan", "Knight", "Played"),
+    ("dc_ivan_2", "Ivan", "Knight", "Played"),
+    ("dc_ivan_3", "Ivan", "Knight", "Played"),
+    ("dc_filbert_1", "Filbert", "Victory Point", "Hidden"),
+    ("dc_mesach_1", "Mesach", "Monopoly", "Hidden"),
+    ("dc_adelia_1", "Adelia", "Knight", "Hidden"),
+]
+_DEV_CARD_TYPES = [
+    ("Knight", "Move the Robber and steal one resource card", True),
+    ("Victory Point", "Worth one hidden victory point", False),
+    ("Monopoly", "Take every card of one resource from all other players", True),
+    ("Year of Plenty", "Take any two resource cards from the bank", True),
+    ("Road Building", "Place two roads for free", True),
+]
+_BUILDING_TYPES = [
+    ("Road", 0, 15, {"Brick": 1, "Lumber": 1}),
+    ("Settlement", 1, 5, {"Brick": 1, "Lumber": 1, "Wool": 1, "Grain": 1}),
+    ("City", 2, 4, {"Grain": 2, "Ore": 3}),
+]
+_RULES = [
+    ("Distance Rule", "A settlement may not be built on an intersection adjacent to another settlement or city.", "Build"),
+    ("Road Connection", "A new road must connect to one of your roads, settlements or cities.", "Build"),
+    ("City Upgrade", "A city replaces one of your settlements and produces two cards per hex.", "Build"),
+    ("Setup Placement", "Each player places two settlements and two roads before the first roll.", "Setup"),
+    ("Production", "Every hex whose number is rolled produces resources for the settlements and cities on its corners.", "Roll"),
+    ("Robber on Seven", "On a 7 players with more than 7 cards discard half and the active player moves the robber.", "Robber"),
+    ("Maritime Trade", "Trade 4:1 with the bank, or at a better rate at a harbor you have built on.", "Trade"),
+]
+
+def _pips(value: int):
+    return 6 - abs(7 - value)
+
+def _hex_grid():
+    hexes = []
+    for row, (terrains, numbers) in enumerate(zip(_TERRAIN_ROWS, _NUMBER_ROWS)):
+        r = row - 2
+        q_start = max(-2, -2 - r)
+        for offset, (terrain, number) in enumerate(zip(terrains, numbers)):
+            q = q_start + offset
+            x = math.sqrt(3) * (q + r / 2)
+            y = 1.5 * r
+            corners = []
+            for i in range(6):
+                angle = math.radians(60 * i - 30)
+                corners.append((round(x + math.cos(angle), 3), round(y + math.sin(angle), 3)))
+            hexes.append((terrain, number, corners))
+    return hexes
+
+def build_catan_graph():
+    # Deterministic Catan board and mid-game state that follows schema.txt.
+    nodes = []
+    relationships = []
+
+    def node(label: str, **properties):
+        nodes.append({"id": len(nodes), "labels": [label], "properties": properties})
+        return len(nodes) - 1
+
+    def rel(start: int, rel_type: str, end: int, **properties):
+        relationships.append({"type": rel_type, "start": start, "end": end, "properties": properties})
+
+    resources = {name: node("Resource", name=name) for name in ["Brick", "Lumber", "Wool", "Grain", "Ore"]}
+    terrains = {}
+    for name in ["Forest", "Hills", "Pasture", "Fields", "Mountains", "Desert"]:
+        terrains[name] = node("TerrainType", name=name)
+        if name in _PRODUCES:
+            rel(terrains[name], "PRODUCES", resources[_PRODUCES[name]])
+
+    rules = {name: node("Rule", name=name, description=description, phase=phase) for name, description, phase in _RULES}
+    odds = {pips: node("Odds", pips=pips, probability=label) for pips, label in _PROBABILITY.items()}
+    dice = {}
+    for value in range(2, 13):
+        dice[value] = node("DiceNumber", value=value)
+        rel(dice[value], "HAS_ODDS", odds[_pips(value)])
+        rel(dice[value], "GOVERNED_BY", rules["Robber on Seven" if value == 7 else "Production"])
+
+    building_types = {}
+    for name, vp_value, limit, costs in _BUILDING_TYPES:
+        building_types[name] = node("BuildingType", name=name, vp_value=vp_value, limit=limit)
+        for resource, amount in costs.items():
+            rel(building_types[name], "COSTS", resources[resource], amount=amount)
+    rel(building_types["City"], "UPGRADES_FROM", building_types["Settlement"])
+    rel(building_types["Road"], "GOVERNED_BY", rules["Road Connection"])
+    rel(building_types["Settlement"], "GOVERNED_BY", rules["Distance Rule"])
+    rel(building_types["Settlement"], "GOVERNED_BY", rules["Setup Placement"])
+    rel(building_types["City"], "GOVERNED_BY", rules["City Upgrade"])
+
+    dev_card_types = {}
+    for name, description, is_playable in _DEV_CARD_TYPES:
+        dev_card_types[name] = node("DevCardType", name=name, description=description, is_playable=is_playable)
+        for resource in ["Wool", "Grain", "Ore"]:
+            rel(dev_card_types[name], "COSTS", resources[resource], amount=1)
+
+    trade_options = {
+        "Bank Trade": node("TradeOption", name="Bank Trade", rate=4),
+        "Generic Port": node("TradeOption", name="Generic Port", rate=3),
+        "Special Port": node("TradeOption", name="Special Port", rate=2),
+    }
+    special_cards = {
+        "Longest Road": node("SpecialCard", name="Longest Road", bonus_vp=2),
+        "Largest Army": node("SpecialCard", name="Largest Army", bonus_vp=2),
+    }
+
+    # board: 19 hexes, 54 intersections, 72 paths
+    grid = _hex_grid()
+    points = sorted({corner for _, _, corners in grid for corner in corners}, key=lambda p: (p[1], p[0]))
+    intersections = {point: node("Intersection", id=f"i{i}") for i, point in enumerate(points, start=1)}
+    edge_hexes = defaultdict(list)
+    hex_ids = []
+    for i, (terrain, number, corners) in enumerate(grid, start=1):
+        hex_id = node("Hex", id=f"h{i}", number=number)
+        hex_ids.append(hex_id)
+        rel(hex_id, "IS_TYPE", terrains[terrain])
+        if number:
+            rel(hex_id, "HAS_TOKEN", dice[number])
+        for corner in corners:
+            rel(intersections[corner], "TOUCHES", hex_id)
+        for a, b in zip(corners, corners[1:] + corners[:1]):
+            edge_hexes[tuple(sorted((a, b), key=lambda p: (p[1], p[0])))].append(i - 1)
+
+    edges = sorted(edge_hexes, key=lambda e: (e[0][1], e[0][0], e[1][1], e[1][0]))
+    paths = {}
+    neighbours = defaultdict(set)
+    for i, (a, b) in enumerate(edges, start=1):
+        paths[(a, b)] = node("Path", id=f"p{i}")
+        rel(paths[(a, b)], "CONNECTS_TO", intersections[a])
+        rel(paths[(a, b)], "CONNECTS_TO", intersections[b])
+        rel(intersections[a], "ADJACENT_TO", intersections[b])
+        rel(intersections[b], "ADJACENT_TO", intersections[a])
+        neighbours[a].add(b)
+        neighbours[b].add(a)
+
+    coast = [edge for edge in edges if len(edge_hexes[edge]) == 1]
+    coast.sort(key=lambda e: -math.atan2(e[0][1] + e[1][1], e[0][0] + e[1][0]))
+    for i, resource in enumerate(_HARBORS):
+        a, b = coast[(i * len(coast)) // len(_HARBORS)]
+        if resource is None:
+            harbor = node("Harbor", id=f"harbor{i + 1}", type="Generic", ratio=3)
+            rel(harbor, "ALLOWS_ACCESS", trade_options["Generic Port"])
+        else:
+            harbor = node("Harbor", id=f"harbor{i + 1}", type="Special", ratio=2)
+            rel(harbor, "ALLOWS_ACCESS", trade_options["Special Port"])
+            rel(harbor, "FOR_RESOURCE", resources[resource])
+        rel(harbor, "ALLOWS_ACCESS", trade_options["Bank Trade"])
+        rel(intersections[a], "HAS_HARBOR", harbor)
+        rel(intersections[b], "HAS_HARBOR", harbor)
+
+    # starting placements: best remaining intersection by pips, snake order
+    corner_hexes = defaultdict(list)
+    for i, (_, number, corners) in enumerate(grid):
+        for corner in corners:
+            corner_hexes[corner].append((i, number))
+    ranked = sorted(points, key=lambda p: (-sum(_pips(n) for _, n in corner_hexes[p] if n), p[1], p[0]))
+    taken = set()
+    order = [0, 1, 2, 3, 3, 2, 1, 0]
+    placements = defaultdict(list)
+    for player_index in order:
+        point = next(p for p in ranked if p not in taken and not (neighbours[p] & taken))
+        taken.add(point)
+        placements[player_index].append(point)
+
+    players = {}
+    for player_index, (name, color) in enumerate(_PLAYERS):
+        players[name] = node("Player", name=name, vp=0, cardCount=sum(_HANDS[name].values()), color=color)
+        for resource, amount in _HANDS[name].items():
+            rel(players[name], "HAS_RESOURCE", resources[resource], amount=amount)
+
+        vp = 0
+        for n, point in enumerate(placements[player_index], start=1):
+            # Ivan upgraded his first settlement
+            piece_type = "City" if name == "Ivan" and n == 1 else "Settlement"
+            prefix = "ct" if piece_type == "City" else "st"
+            piece = node("Piece", id=f"{prefix}{name}{n}", type=piece_type)
+            rel(players[name], "OWNS", piece)
+            rel(piece, "PLACED_ON", intersections[point])
+            rel(piece, "INSTANCE_OF", building_types[piece_type])
+            vp += 2 if piece_type == "City" else 1
+            for hex_index, number in corner_hexes[point]:
+                if number:
+                    rel(dice[number], "ACTIVATES", piece)
+
+            edge = min(e for e in edges if point in e)
+            road = node("Piece", id=f"rd{name}{n}", type="Road")
+            rel(players[name], "OWNS", road)
+            rel(road, "PLACED_ON", paths[edge])
+            rel(road, "INSTANCE_OF", building_types["Road"])
+        nodes[players[name]]["properties"]["vp"] = vp
+
+    for dev_card_id, owner, card_type, status in _DEV_CARDS:
+        card = node("DevCardInstance", id=dev_card_id, status=status)
+        rel(players[owner], "HOLDS_DEVCARD", card)
+        rel(card, "IS_TYPE", dev_card_types[card_type])
+
+    for card_name, owner in [("Longest Road", "Filbert"), ("Largest Army", "Ivan")]:
+        rel(players[owner], "HOLDS_TROPHY", special_cards[card_name])
+        nodes[players[owner]]["properties"]["vp"] += nodes[special_cards[card_name]]["properties"]["bonus_vp"]
+
+    desert = hex_ids[[terrain for terrain, _, _ in grid].index("Desert")]
+    robber = node("Piece", id="robber", type="Robber")
+    rel(robber, "LOCATED_AT", desert)
+
+    game_state = node("GameState", current_phase="Trade", turn_number=42, current_turn_player="Filbert")
+    rel(game_state, "ACTIVE_PLAYER", players["Filbert"])
+    return {"nodes": nodes, "relationships": relationships}
+
+if __name__ == "__main__":
+    graph = build_catan_graph()
+    with open(FIXTURE_PATH, "w") as fp:
+        json.dump(graph, fp, indent=1)
+    print(f"Wrote {len(graph['nodes'])} nodes and {len(graph['relationships'])} relationships to {FIXTURE_PATH}")
@@ -0,0 +1,181 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from backend.inference import InferenceBackend
+from backend.model_loading import load_causal_lm, load_tokenizer
+from backend.response_generator_v2 import SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, ResponseGenerator
+from backend.result_formatter import ResultFormatter
+from backend.graph_replica import GraphSnapshot
+from backend.speculative import PromptLookupDrafter, SpeculativeDecoder
+from benchmark.fakes import FixtureGraphDriver, build_tiny_model, build_tiny_tokenizer
+from benchmark.fixture import FIXTURE_PATH
+from benchmark.questions import QUESTIONS
+from benchmark.run import git_commit, peak_rss_mb, percentiles
+
+# backends that must reproduce the eager output token for token; int8 changes
+# the weights, so its outputs are only compared. "lookup" adds speculative
+# decoding with prompt lookup to any backend.
+LOSSLESS = {"compile", "static", "compile+static", "lookup", "compile+lookup"}
+
+def build_prompts(generator: ResponseGenerator, fixture: str, count: int) -> list[str]:
+    # the real answer prompts of the benchmark questions, evidence included
+    driver = FixtureGraphDriver(GraphSnapshot.load(fixture))
+    formatter = ResultFormatter(tokenizer=generator.tokenizer)
+    questions = QUESTIONS[:count] if count else QUESTIONS
+    prompts = []
+    for question in questions:
+        evidence, _ = formatter.format_all([driver.execute_query(question.cypher)])
+        prompts.append(generator.build_prompt(question.question, question.cypher, evidence))
+    return prompts
+
+def run_single(args, name: str) -> dict:
+    # one backend in this process: load, prepare, warm up, then answer every
+    # prompt greedily, one at a time
+    with open(args.schema) as fp:
+        schema = fp.read().strip()
+    parts = name.split("+")
+    speculative = None
+    if "lookup" in parts:
+        parts.remove("lookup")
+        speculative = SpeculativeDecoder(lambda: PromptLookupDrafter(args.max_ngram_size), args.max_draft_tokens)
+    backend = InferenceBackend.from_name("+".join(parts) or "eager", num_threads=args.threads)
+    start = time.perf_counter()
+    if args.generator == "tiny":
+        corpus = [schema, SYSTEM_PROMPT, USER_PROMPT_TEMPLATE] + [q.question for q in QUESTIONS]
+        tokenizer = build_tiny_tokenizer(corpus)
+        model = build_tiny_model(tokenizer, hidden_size=args.hidden_size, num_layers=args.num_layers)
+    else:
+        tokenizer = load_tokenizer(ResponseGenerator.MODEL_NAME, "benchmark")
+        backend.configure_threads()
+        model = load_causal_lm(ResponseGenerator.MODEL_NAME, "benchmark", **backend.load_kwargs())
+    # greedy decoding, so outputs of different backends are comparable
+    model.generation_config.do_sample = False
+    model.generation_config.temperature = None
+    model.generation_config.top_p = None
+    model.generation_config.top_k = None
+
+    generator = ResponseGenerator(
+        schema,
+        use_prefix_cache=args.prefix_cache,
+        model=model,
+        tokenizer=tokenizer,
+        warmup=True,
+        backend=backend,
+        speculative=speculative,
+    )
+    startup = time.perf_counter() - start
+
+    prompts = build_prompts(generator, args.fixture, args.prompts)
+    latencies = []
+    outputs = []
+    tokens = 0
+    for iteration in range(args.iterations):
+        for prompt in prompts:
+            prompt_start = time.perf_counter()
+            responses, token_counts = generator.generate_batch([prompt], [args.max_new_tokens])
+            latencies.append(time.perf_counter() - prompt_start)
+            tokens += token_counts[0]
+            if iteration == 0:
+                outputs.append(responses[0])
+
+    info = generator.get_backend_info()
+    if speculative is not None:
+        info["speculative"] = speculative.get_stats()
+    return {
+        "backend": name,
+        "startup_seconds": startup,
+        "latency": percentiles(latencies),
+        "tokens_per_second": tokens / sum(latencies) if latencies else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "model_mb": generator.get_backend_info()["model_bytes"] / (1024 * 1024),
+        "info": info,
+        "outputs": outputs,
+    }
+
+def run_isolated(args, name: str) -> dict:
+    # a fresh process per backend keeps peak RSS, thread settings and
+    # compiled graphs from leaking between backends
+    command = [sys.executable, "-m", "benchmark.inference", "--single", name] + args.passthrough
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"backend {name} failed:\n{completed.stderr[-4000:]}")
+    return json.loads(completed.stdout)
+
+def check_equivalence(results: list[dict]) -> list[str]:
+    # Compares every backend's outputs with the eager baseline. Returns the
+    # lossless backends whose output differs.
+    baseline = next(r for r in results if r["backend"] == "eager")["outputs"]
+    failures = []
+    for result in results:
+        matching = sum(1 for a, b in zip(result["outputs"], baseline) if a == b)
+        result["matching_outputs"] = f"{matching}/{len(baseline)}"
+        result["equivalent"] = matching == len(baseline)
+        if not result["equivalent"] and result["backend"] in LOSSLESS:
+            failures.append(result["backend"])
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU inference backends of the answer model.")
+    parser.add_argument("--backends", default="eager,int8,compile,static,int8+compile",
+                        help="Comma-separated backends; eager is always run as the baseline.")
+    parser.add_argument("--generator", choices=["tiny", "qwen"], default="tiny")
+    parser.add_argument("--prompts", type=int, default=0, help="Use only the first N benchmark questions (0 = all).")
+    parser.add_argument("--iterations", type=int, default=2, help="Measured passes over the prompts.")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = default).")
+    parser.add_argument("--hidden-size", type=int, default=64, help="Width of the tiny model.")
+    parser.add_argument("--num-layers", type=int, default=2, help="Depth of the tiny model.")
+    parser.add_argument("--max-draft-tokens", type=int, default=8, help="Speculative draft length of the lookup backends.")
+    parser.add_argument("--max-ngram-size", type=int, default=3, help="Prompt lookup n-gram size of the lookup backends.")
+    parser.add_argument("--prefix-cache", action="store_true", help="Use the prompt prefix cache (disables the static cache).")
+    parser.add_argument("--schema", default="schema.txt")
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Write the JSON report here.")
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args, args.single)))
+        return
+
+    args.passthrough = [
+        f"--generator={args.generator}", f"--prompts={args.prompts}", f"--iterations={args.iterations}",
+        f"--max-new-tokens={args.max_new_tokens}", f"--threads={args.threads}",
+        f"--hidden-size={args.hidden_size}", f"--num-layers={args.num_layers}",
+        f"--max-draft-tokens={args.max_draft_tokens}", f"--max-ngram-size={args.max_ngram_size}",
+        f"--schema={args.schema}", f"--fixture={args.fixture}",
+    ] + (["--prefix-cache"] if args.prefix_cache else [])
+    names = ["eager"] + [name for name in args.backends.split(",") if name and name != "eager"]
+    results = []
+    for name in names:
+        print(f"running {name} ...", file=sys.stderr)
+        results.append(run_isolated(args, name))
+    failures = check_equivalence(results)
+
+    header = f"{'backend':<16}{'startup s':>10}{'p50 ms':>10}{'p95 ms':>10}{'tok/s':>9}{'RSS MB':>9}{'model MB':>10}  outputs"
+    lines = [header]
+    for r in results:
+        lines.append(
+            f"{r['backend']:<16}{r['startup_seconds']:>10.2f}{r['latency']['p50_ms']:>10.1f}{r['latency']['p95_ms']:>10.1f}"
+            f"{r['tokens_per_second']:>9.1f}{r['peak_rss_mb']:>9.1f}{r['model_mb']:>10.1f}  {r['matching_outputs']} match eager"
+        )
+    print("\n".join(lines))
+
+    if args.output:
+        report = {
+            "results": results,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("output", "passthrough", "single")},
+        }
+        with open(args.output, "w") as fp:
+            fp.write(json.dumps(report, indent=2) + "\n")
+    if failures:
+        print(f"output differs from eager: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
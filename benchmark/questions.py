@@ -0,0 +1,70 @@
+class BenchmarkQuestion:
+    # A fixed question and the Cypher a good text-to-Cypher model would
+    # write for it.
+    def __init__(self, question: str, cypher: str):
+        self.question = question
+        self.cypher = cypher
+
+QUESTIONS = [
+    BenchmarkQuestion(
+        "How many victory points does Filbert have?",
+        'MATCH (p:Player {name: "Filbert"}) RETURN p.vp AS vp',
+    ),
+    BenchmarkQuestion(
+        "Which player has the most victory points?",
+        "MATCH (p:Player) RETURN p.name AS name, p.vp AS vp ORDER BY vp DESC LIMIT 1",
+    ),
+    BenchmarkQuestion(
+        "What resource cards does Ivan have in his hand?",
+        'MATCH (p:Player {name: "Ivan"})-[r:HAS_RESOURCE]->(res:Resource) RETURN res.name AS resource, r.amount AS amount',
+    ),
+    BenchmarkQuestion(
+        "What does it cost to build a City?",
+        'MATCH (b:BuildingType {name: "City"})-[c:COSTS]->(r:Resource) RETURN r.name AS resource, c.amount AS amount',
+    ),
+    BenchmarkQuestion(
+        "Which hexes have the number 8?",
+        "MATCH (h:Hex)-[:HAS_TOKEN]->(d:DiceNumber {value: 8}) RETURN h.id AS hex",
+    ),
+    BenchmarkQuestion(
+        "Which terrain produces Ore?",
+        'MATCH (t:TerrainType)-[:PRODUCES]->(r:Resource {name: "Ore"}) RETURN t.name AS terrain',
+    ),
+    BenchmarkQuestion(
+        "Whose turn is it and in which phase?",
+        "MATCH (g:GameState)-[:ACTIVE_PLAYER]->(p:Player) RETURN p.name AS player, g.current_phase AS phase, g.turn_number AS turn",
+    ),
+    BenchmarkQuestion(
+        "Who holds the Longest Road card?",
+        'MATCH (p:Player)-[:HOLDS_TROPHY]->(s:SpecialCard {name: "Longest Road"}) RETURN p.name AS player, s.bonus_vp AS bonus',
+    ),
+    BenchmarkQuestion(
+        "How many pieces does each player own?",
+        "MATCH (p:Player)-[:OWNS]->(pc:Piece) RETURN p.name AS player, count(pc) AS pieces ORDER BY pieces DESC",
+    ),
+    BenchmarkQuestion(
+        "Where is the robber?",
+        'MATCH (pc:Piece {type: "Robber"})-[:LOCATED_AT]->(h:Hex)-[:IS_TYPE]->(t:TerrainType) RETURN h.id AS hex, t.name AS terrain',
+    ),
+    BenchmarkQuestion(
+        "Which players receive resources when a 6 is rolled?",
+        "MATCH (d:DiceNumber {value: 6})<-[:HAS_TOKEN]-(h:Hex)<-[:TOUCHES]-(i:Intersection)<-[:PLACED_ON]-(pc:Piece)<-[:OWNS]-(p:Player) "
+        'WHERE pc.type IN ["Settlement", "City"] RETURN DISTINCT p.name AS player',
+    ),
+    BenchmarkQuestion(
+        "What are the odds of rolling a 6?",
+        "MATCH (d:DiceNumber {value: 6})-[:HAS_ODDS]->(o:Odds) RETURN o.pips AS pips, o.probability AS probability",
+    ),
+    BenchmarkQuestion(
+        "What development cards are there?",
+        "MATCH (d:DevCardType) RETURN d.name AS name, d.description AS description",
+    ),
+    BenchmarkQuestion(
+        "Which intersections have a harbor?",
+        "MATCH (i:Intersection)-[:HAS_HARBOR]->(h:Harbor) RETURN i.id AS intersection, h.type AS type, h.ratio AS ratio",
+    ),
+    BenchmarkQuestion(
+        "Which intersections does each path connect?",
+        "MATCH (p:Path)-[:CONNECTS_TO]->(i:Intersection) RETURN p.id AS path, i.id AS intersection",
+    ),
+]
@@ -0,0 +1,244 @@
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+from backend import telemetry
+from backend.response_generator_v2 import SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, ResponseGenerator
+from backend.config import Config
+from backend.model_loading import get_startup_times
+from backend.result_formatter import ResultFormatter
+from backend.cypher_templates import EntityCatalog, TemplatedTextToCypher, TemplateMatcher
+from backend.graph_replica import GraphSnapshot
+from backend.inference import InferenceBackend
+from benchmark.fakes import (
+    FixtureGraphDriver,
+    StubTextToCypher,
+    build_tiny_model,
+    build_tiny_tokenizer,
+)
+from benchmark.fixture import FIXTURE_PATH
+from benchmark.questions import QUESTIONS
+
+STAGES = ["cypher", "db", "answer", "total"]
+
+def percentiles(samples: list[float]):
+    if not samples:
+        return None
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "count": len(samples),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def answer_question(question: str, text_to_cypher, driver_factory, generator, formatter: ResultFormatter, max_new_tokens: int):
+    # same stages as app.py, timed separately
+    timings = {}
+    start = time.perf_counter()
+    cypher_queries = text_to_cypher(question)
+    if isinstance(cypher_queries, str):
+        cypher_queries = [cypher_queries]
+    timings["cypher"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with driver_factory() as driver:
+        context_str, formatted = formatter.format_all([driver.stream_query(q) for q in cypher_queries])
+    if not any(result.total_rows for result in formatted):
+        context_str = "(no result)"
+    timings["db"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    answer = "".join(generator.stream(question, "\n\n".join(cypher_queries), context_str, max_new_tokens=max_new_tokens))
+    timings["answer"] = time.perf_counter() - start
+    timings["total"] = sum(timings.values())
+    return answer, timings
+
+def run_benchmark(text_to_cypher, driver_factory, generator, questions, iterations: int = 3, warmup: int = 1, max_new_tokens: int = 64):
+    formatter = ResultFormatter(tokenizer=generator.tokenizer)
+    samples = {stage: [] for stage in STAGES}
+    span_samples = {}
+    generated_tokens = 0
+    generation_time = 0.0
+
+    for iteration in range(warmup + iterations):
+        for question in questions:
+            with telemetry.span("request") as request_span:
+                answer, timings = answer_question(
+                    question.question, text_to_cypher, driver_factory, generator, formatter, max_new_tokens
+                )
+            if iteration < warmup:
+                continue
+            # finer stages (tokenize, prefill, decode, ...) from the request trace
+            for depth, name, ms in request_span.breakdown():
+                if depth:
+                    span_samples.setdefault(name, []).append(ms / 1000)
+            for stage, seconds in timings.items():
+                samples[stage].append(seconds)
+            generated_tokens += len(generator.tokenizer.encode(answer, add_special_tokens=False))
+            generation_time += timings["answer"]
+
+    return {
+        "stages": {stage: percentiles(values) for stage, values in samples.items()},
+        "spans": {name: percentiles(values) for name, values in span_samples.items()},
+        "generated_tokens": generated_tokens,
+        "tokens_per_second": generated_tokens / generation_time if generation_time else 0.0,
+        "questions_per_second": len(samples["total"]) / sum(samples["total"]) if samples["total"] else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def build_backends(args):
+    with open(args.schema) as fp:
+        schema = fp.read().strip()
+    questions = QUESTIONS[:args.questions] if args.questions else QUESTIONS
+
+    if args.text_to_cypher == "stub":
+        text_to_cypher = StubTextToCypher(questions, latency_ms=args.cypher_latency_ms)
+    elif args.text_to_cypher == "fake-openai":
+        # the real OpenRouter backend and client against a local fake server
+        from backend.text_to_cypher_v2 import TextToCypher
+        from benchmark.fake_openai import FakeOpenAIServer
+        server = FakeOpenAIServer(
+            latency_ms=args.cypher_latency_ms,
+            slow_fraction=args.fake_slow_fraction,
+            error_rate=args.fake_error_rate,
+        ).start()
+        config = Config({
+            "openai": {"openai_api_key": "fake"},
+            "llm_client": {"base_url": server.url, "hedge_percentile": args.hedge_percentile},
+        })
+        text_to_cypher = TextToCypher(schema, config)
+    else:
+        from backend.config import load_config
+        from backend.text_to_cypher_v2 import TextToCypher
+        text_to_cypher = TextToCypher(schema, load_config(args.config))
+
+    if args.database == "fixture":
+        fixture_driver = FixtureGraphDriver(GraphSnapshot.load(args.fixture))
+        driver_factory = lambda: fixture_driver
+        catalog_loader = lambda: EntityCatalog.from_driver(fixture_driver)
+    else:
+        from backend.config import load_config
+        from backend.cypher_templates import load_entity_catalog
+        from backend.database import GraphDatabaseDriver
+        config = load_config(args.config)
+        driver_factory = lambda: GraphDatabaseDriver(config)
+        catalog_loader = lambda: load_entity_catalog(config)
+
+    if args.templates:
+        text_to_cypher = TemplatedTextToCypher(text_to_cypher, TemplateMatcher(catalog_loader()))
+
+    if args.generator == "tiny":
+        corpus = [schema, SYSTEM_PROMPT, USER_PROMPT_TEMPLATE] + [q.question for q in questions]
+        tokenizer = build_tiny_tokenizer(corpus)
+        generator = ResponseGenerator(
+            schema,
+            use_prefix_cache=not args.no_prefix_cache,
+            model=build_tiny_model(tokenizer, hidden_size=args.hidden_size, num_layers=args.num_layers),
+            tokenizer=tokenizer,
+            backend=InferenceBackend.from_name(args.inference_backend),
+        )
+    else:
+        generator = ResponseGenerator(
+            schema,
+            use_prefix_cache=not args.no_prefix_cache,
+            backend=InferenceBackend.from_name(args.inference_backend),
+        )
+    return questions, text_to_cypher, driver_factory, generator
+
+def compare(report: dict, baseline: dict):
+    # ratio > 1 means slower (or more memory) than the baseline
+    lines = []
+    for stage in STAGES:
+        current, previous = report["stages"].get(stage), baseline["stages"].get(stage)
+        if current and previous:
+            for key in ["p50_ms", "p95_ms", "p99_ms"]:
+                if previous[key]:
+                    lines.append(f"{stage} {key}: {previous[key]:.2f} -> {current[key]:.2f} ({current[key] / previous[key]:.2f}x)")
+    if baseline.get("tokens_per_second"):
+        lines.append(f"tokens/s: {baseline['tokens_per_second']:.1f} -> {report['tokens_per_second']:.1f}")
+    lines.append(f"peak RSS MB: {baseline['peak_rss_mb']:.1f} -> {report['peak_rss_mb']:.1f}")
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency benchmark of the RAG pipeline.")
+    parser.add_argument("--iterations", type=int, default=3, help="Measured passes over the question set.")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured passes before measuring.")
+    parser.add_argument("--questions", type=int, default=0, help="Use only the first N questions (0 = all).")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--text-to-cypher", choices=["stub", "fake-openai", "openrouter"], default="stub")
+    parser.add_argument("--cypher-latency-ms", type=float, default=0.0, help="Simulated latency of the stub or fake server.")
+    parser.add_argument("--fake-slow-fraction", type=float, default=0.0, help="Fake server requests that take 1s.")
+    parser.add_argument("--fake-error-rate", type=float, default=0.0, help="Fake server requests that fail with 500/503.")
+    parser.add_argument("--hedge-percentile", type=float, default=0.0, help="LLM client hedging with fake-openai (0 = off).")
+    parser.add_argument("--database", choices=["fixture", "neo4j"], default="fixture")
+    parser.add_argument("--generator", choices=["tiny", "qwen"], default="tiny")
+    parser.add_argument("--hidden-size", type=int, default=64, help="Width of the tiny model.")
+    parser.add_argument("--num-layers", type=int, default=2, help="Depth of the tiny model.")
+    parser.add_argument("--no-prefix-cache", action="store_true")
+    parser.add_argument("--inference-backend", default="eager", help="e.g. int8, compile, static or int8+compile.")
+    parser.add_argument("--templates", action="store_true", help="Put the template fast path in front of text-to-Cypher.")
+    parser.add_argument("--no-telemetry", action="store_true", help="Measure with instrumentation disabled.")
+    parser.add_argument("--schema", default="schema.txt")
+    parser.add_argument("--fixture", default=FIXTURE_PATH)
+    parser.add_argument("--config", default="config.toml")
+    parser.add_argument("--output", help="Write the JSON report here.")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against.")
+    args = parser.parse_args()
+
+    telemetry.configure_telemetry(Config({"telemetry": {"enabled": not args.no_telemetry}}))
+    start = time.perf_counter()
+    questions, text_to_cypher, driver_factory, generator = build_backends(args)
+    setup_time = time.perf_counter() - start
+
+    report = run_benchmark(
+        text_to_cypher,
+        driver_factory,
+        generator,
+        questions,
+        iterations=args.iterations,
+        warmup=args.warmup,
+        max_new_tokens=args.max_new_tokens,
+    )
+    report["setup_seconds"] = setup_time
+    report["startup_seconds"] = get_startup_times()
+    if isinstance(text_to_cypher, TemplatedTextToCypher):
+        report["templates"] = text_to_cypher.matcher.get_stats()
+    if hasattr(text_to_cypher, "get_client_stats"):
+        report["llm_client"] = text_to_cypher.get_client_stats()
+    report["commit"] = git_commit()
+    report["python"] = platform.python_version()
+    report["settings"] = {
+        key: value for key, value in vars(args).items() if key not in ("output", "compare", "config")
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        print("\n".join(compare(report, baseline)))
+
+if __name__ == "__main__":
+    main()
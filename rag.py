@@ -1,42 +1,173 @@
-from backend.database import GraphDatabaseDriver
-from backend.response_generator import ResponseGenerator
-from backend.text_to_cypher import TextToCypher
+import argparse
+import asyncio
+import json
+import sys
+import time
+from backend.text_to_cypher_v2 import AsyncTextToCypher
+from backend.response_generator_v2 import ResponseGenerator
+from backend.inference import InferenceBackend
+from backend.speculative import SpeculativeDecoder
+from backend.batching import BatchingResponseGenerator
+from backend.question_cache import QuestionCache
+from backend.pipeline import AsyncPipeline, PipelineRunner
+from backend.schema_index import SchemaIndex
+from backend.result_formatter import ResultFormatter
+from backend.cypher_templates import TemplateMatcher, load_entity_catalog
+from backend.cypher_validator import CypherValidator
+from backend.hedging import HedgedExecutor
+from backend.vector_index import VectorIndex
+from backend.shortcuts import ShortcutMaintainer, with_shortcuts
+from backend.batch import load_completed, read_questions, run_batch, summarize
+from backend import telemetry
+from backend.config import load_config
 
-with GraphDatabaseDriver() as driver:
-    with open("schema_example.txt") as fp:
-        schema = fp.read().strip()
-
-    print("Preparing text-to-Cypher pipeline ....")
-    ttc = TextToCypher(schema)
+# Answers questions through the same stages as the app's pipeline mode:
+#   python rag.py                                       interactive
+#   python rag.py --input q.jsonl --output out.jsonl    batch (JSONL or CSV in)
+# A batch run appends to --output and skips the ids already answered there,
+# so an interrupted run is resumed by running the same command again.
 
-    print("Preparing response generator pipeline ....")
-    generator = ResponseGenerator(schema)
+def build_pipeline(args, config, schema: str) -> AsyncPipeline:
+    # PRODUCES_FROM / CAN_TRADE_AT are only in the schema while [shortcuts]
+    # keeps them in the graph, which it does in the background from here on
+    shortcuts = ShortcutMaintainer.from_config(config)
+    schema_transform = None
+    if shortcuts is not None:
+        shortcuts.start()
+        schema_transform = with_shortcuts
+        schema = with_shortcuts(schema)
+    schema_index = SchemaIndex.from_config(schema, config)
+    generator = ResponseGenerator(
+        schema,
+        use_prefix_cache=config.get_prefix_cache_settings()["enabled"],
+        schema_index=schema_index,
+        backend=InferenceBackend.from_config(config),
+        speculative=SpeculativeDecoder.from_config(config, "answer"),
+    )
+    if args.answer_batch_size > 1:
+        generator = BatchingResponseGenerator(generator, args.answer_batch_size, args.max_wait_ms)
+    return AsyncPipeline(
+        AsyncTextToCypher(schema, config, schema_index=schema_index),
+        generator,
+        config,
+        question_cache=QuestionCache.from_config(
+            config, args.schema, lambda: load_entity_catalog(config), schema_transform
+        ),
+        cypher_concurrency=args.cypher_concurrency,
+        db_concurrency=args.db_concurrency,
+        # a batch only fills up when that many answer calls wait at once
+        answer_workers=max(args.answer_workers, args.answer_batch_size),
+        max_in_flight=args.concurrency,
+        max_pending=args.concurrency,
+        result_formatter=ResultFormatter.from_config(config, tokenizer=generator.tokenizer_future),
+        validator=CypherValidator.from_config(schema, config, schema_index=schema_index),
+        template_matcher=TemplateMatcher.from_config(config, lambda: load_entity_catalog(config)),
+        hedger=HedgedExecutor.from_config(config),
+        vector_index=VectorIndex.from_config(config, schema),
+    )
 
-    interrupt = False
+def interactive(runner: PipelineRunner):
     print("(Interrupt to stop.)")
-    while not interrupt:
+    while True:
         try:
-            question = input("Question: ")
-        except KeyboardInterrupt:
-            interrupt = True
-
-        if not interrupt:
-            print("Generating Cypher query ....")
-            query = ttc(question)
+            question = input("Question: ").strip()
+        except (KeyboardInterrupt, EOFError):
+            break
+        if not question:
+            continue
+        result = runner.run(runner.pipeline.answer(question))
+        for query in result["cypher_queries"]:
             print(query)
-
-            print("Executing Cypher query ....")
-            results = driver.execute_query(query)
-            if len(results) > 0:
-                query_result_str = "\n".join([
-                    str(x) for x in results
-                ])
-            else:
-                query_result_str = "(no result)"
-            print(query_result_str)
-
-            print("Generating response ....")
-            response = generator(question, query, query_result_str)
-            print(response)
-    
+        for error in result["errors"]:
+            print(f"(error occurred: {error})")
+        print("\n".join(str(row) for row in result["results"]) or "(no result)")
+        print(result["answer"])
     print("(Stopped.)")
+
+def print_summary(summary: dict):
+    print(
+        f"{summary['questions']} questions ({summary['skipped']} already done) in {summary['wall_seconds']:.1f}s: "
+        f"{summary['questions_per_second']:.2f} q/s, error rate {summary['error_rate']:.1%} "
+        f"({summary['query_errors']} more answered after query errors)",
+        file=sys.stderr,
+    )
+    print(f"{'stage':<10}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=sys.stderr)
+    for stage, latency in {**summary["stages"], "total": summary["latency"]}.items():
+        if latency["count"]:
+            print(
+                f"{stage:<10}{latency['count']:>7}{latency['mean_ms']:>10.0f}{latency['p50_ms']:>10.0f}"
+                f"{latency['p95_ms']:>10.0f}{latency['p99_ms']:>10.0f}",
+                file=sys.stderr,
+            )
+
+async def batch(args, pipeline: AsyncPipeline):
+    items = read_questions(args.input, args.id_field, args.question_field)
+    if args.limit:
+        items = items[:args.limit]
+    completed = load_completed(args.output)
+    todo = [item for item in items if item["id"] not in completed]
+    print(f"{len(todo)} of {len(items)} questions to answer", file=sys.stderr)
+
+    def progress(record: dict, done: int, total: int):
+        status = "failed" if "error" in record else "ok"
+        print(f"[{done}/{total}] {record['id']} {status} {record['latency_seconds']:.1f}s", file=sys.stderr)
+
+    start = time.perf_counter()
+    records = await run_batch(pipeline.answer, todo, args.output, args.concurrency, progress)
+    summary = summarize(records, time.perf_counter() - start, skipped=len(items) - len(todo))
+    summary["pipeline"] = pipeline.get_stats()
+    print_summary(summary)
+    if args.summary:
+        with open(args.summary, "w") as fp:
+            fp.write(json.dumps(summary, indent=2) + "\n")
+    return summary
+
+async def run(args, pipeline: AsyncPipeline):
+    await pipeline.start()
+    try:
+        summary = await batch(args, pipeline)
+    finally:
+        await pipeline.close()
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    config = load_config()
+    pipeline_settings = config.get_pipeline_settings()
+    batching_settings = config.get_batching_settings()
+
+    parser = argparse.ArgumentParser(description="Answer questions about the Catan graph, interactively or in batch.")
+    parser.add_argument("--input", help="Questions as JSONL or CSV (.csv); without it, ask interactively.")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL results, appended as questions finish.")
+    parser.add_argument("--summary", help="Also write the run summary here as JSON.")
+    parser.add_argument("--id-field", default="id", help="Id column; defaults to the line/row number when missing.")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--limit", type=int, default=0, help="Only the first N questions (0 = all).")
+    parser.add_argument("--concurrency", type=int, default=pipeline_settings["max_in_flight"],
+                        help="Questions in flight at once.")
+    parser.add_argument("--cypher-concurrency", type=int, default=pipeline_settings["cypher_concurrency"],
+                        help="Concurrent text-to-Cypher API calls.")
+    parser.add_argument("--db-concurrency", type=int, default=pipeline_settings["db_concurrency"],
+                        help="Concurrent Neo4j queries.")
+    parser.add_argument("--answer-workers", type=int, default=pipeline_settings["answer_workers"],
+                        help="Threads calling the local answer model.")
+    parser.add_argument("--answer-batch-size", type=int,
+                        default=batching_settings["max_batch_size"] if batching_settings["enabled"] else 1,
+                        help="Answer prompts generated in one batch (1 = no batching).")
+    parser.add_argument("--max-wait-ms", type=float, default=batching_settings["max_wait_ms"],
+                        help="How long a batch waits to fill up.")
+    parser.add_argument("--schema", default="schema.txt")
+    args = parser.parse_args()
+    if not args.input:
+        args.concurrency = 1
+
+    telemetry.configure_telemetry(config)
+    with open(args.schema, encoding="utf-8") as fp:
+        schema = fp.read().strip()
+    print("Preparing pipeline ....", file=sys.stderr)
+    if args.input:
+        sys.exit(asyncio.run(run(args, build_pipeline(args, config, schema))))
+    runner = PipelineRunner(build_pipeline(args, config, schema))
+    try:
+        interactive(runner)
+    finally:
+        runner.close()